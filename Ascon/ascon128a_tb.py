@@ -1,6 +1,4 @@
 from pathlib import Path
-import random
-from random import randint
 import sys
 import os
 import inspect
@@ -30,10 +28,10 @@ sys.path.insert(0, COCOLIGHT_DIR)
 
 try:
     from .cocolight.lwc_api import LwcCffi, LwcAead, LwcHash
-    from .cocolight import LwcRefCheckerTb
+    from .cocolight import LwcRefCheckerTb, Vector
 except:
     from cocolight.lwc_api import LwcCffi, LwcAead, LwcHash
-    from cocolight import LwcRefCheckerTb
+    from cocolight import LwcRefCheckerTb, Vector
 
 
 class Cref(LwcCffi, LwcAead, LwcHash):
@@ -212,18 +210,51 @@ async def test_enc_dec(dut: HierarchyObject):
 
     await tb.start()
 
-    ad_sizes = list(set(short_sizes(AD_BS) + [randint(0, 200) for _ in range(10)]))
-    xt_sizes = list(set(short_sizes(XT_BS) + [randint(0, 200) for _ in range(10)]))
+    ad_sizes = list(set(short_sizes(AD_BS) + [tb.sizes.randint(0, 200) for _ in range(10)]))
+    xt_sizes = list(set(short_sizes(XT_BS) + [tb.sizes.randint(0, 200) for _ in range(10)]))
 
-    for ad_size, xt_size in itertools.product(ad_sizes, xt_sizes):
+    # decryptions and encryptions run under a loaded key, which is reloaded every 5 of them
+    tb.start_key_session(length=5)
+    for ad_size, xt_size in tb.shard_items(itertools.product(ad_sizes, xt_sizes)):
         await tb.xdec_test(ad_size=ad_size, ct_size=xt_size)
         await tb.xenc_test(ad_size=ad_size, pt_size=xt_size)
 
-    await tb.xdec_test(ad_size=1536, ct_size=0)
-    await tb.xenc_test(ad_size=1536, pt_size=0)
-    await tb.xdec_test(ad_size=0, ct_size=1536)
-    await tb.xenc_test(ad_size=0, pt_size=1536)
-    await tb.xdec_test(ad_size=0, ct_size=1535)
+    # long messages, split between shards like the vectors above
+    long_vectors = [
+        Vector("dec", ad_size=1536, xt_size=0),
+        Vector("enc", ad_size=1536, xt_size=0),
+        Vector("dec", ad_size=0, xt_size=1536),
+        Vector("enc", ad_size=0, xt_size=1536),
+        Vector("dec", ad_size=0, xt_size=1535),
+    ]
+    for vector in tb.shard_items(long_vectors):
+        await tb.run_vector(vector)
+
+    await tb.launch_monitors()
+    await tb.launch_drivers()
+
+    await tb.join_drivers()
+    await tb.join_monitors()
+
+
+@cocotb.test()
+async def test_dec_fail(dut: HierarchyObject):
+    """Forged tags and ciphertexts must be rejected with the failure status"""
+    debug = False
+    tb = RefCheckerTb(dut, debug=debug, max_in_stalls=3, max_out_stalls=12)
+
+    await tb.start()
+
+    xt_sizes = short_sizes(XT_BS) + [tb.sizes.randint(0, 200) for _ in range(4)]
+    sizes = [(tb.sizes.randint(0, 2 * AD_BS), xt_size) for xt_size in xt_sizes]
+    for ad_size, xt_size in tb.shard_items(sizes):
+        await tb.xdec_fail_test(ad_size=ad_size, ct_size=xt_size, corrupt="tag")
+        await tb.xdec_fail_test(ad_size=ad_size, ct_size=xt_size, corrupt="ct")
+        # a valid decryption right after a rejected one
+        await tb.xdec_test(ad_size=ad_size, ct_size=xt_size)
+    # first and last bit of the tag
+    for bit in tb.shard_items([0, 8 * tb.ref.CRYPTO_ABYTES - 1]):
+        await tb.xdec_fail_test(ad_size=AD_BS, ct_size=XT_BS, bit=bit)
 
     await tb.launch_monitors()
     await tb.launch_drivers()
@@ -255,9 +286,9 @@ async def test_hash(dut: HierarchyObject):
 
     await tb.start()
 
-    hm_sizes = list(set(short_sizes(HM_BS) + [randint(2, 200) for _ in range(40)]))
+    hm_sizes = list(set(short_sizes(HM_BS) + [tb.sizes.randint(2, 200) for _ in range(40)]))
 
-    for hm_size in hm_sizes:
+    for hm_size in tb.shard_items(hm_sizes):
         await tb.xhash_test(hm_size=hm_size)
 
     await tb.launch_monitors()
@@ -306,31 +337,34 @@ async def randomized_tests(dut: HierarchyObject):
             67,
             3 * AD_BS - 1,
         ]
-        + [randint(2, 500) for _ in range(30)]
+        + [tb.sizes.randint(2, 500) for _ in range(30)]
         + short_sizes(AD_BS)
     )
 
     ad_sizes = list(set(ad_sizes))  # unique
-    random.shuffle(ad_sizes)
+    tb.sizes.shuffle(ad_sizes)
     xt_sizes = ad_sizes[:] + short_sizes(XT_BS)
-    random.shuffle(xt_sizes)
+    tb.sizes.shuffle(xt_sizes)
 
     await tb.start()
 
-    for ad_size, xt_size in itertools.product(ad_sizes, xt_sizes):
-        op = randint(0, 2 if tb.supports_hash else 1)
-        if op == 0:
-            await tb.xenc_test(ad_size=ad_size, pt_size=xt_size)
-        elif op == 1:
-            await tb.xdec_test(ad_size=ad_size, ct_size=xt_size)
-        else:
-            await tb.xhash_test(hm_size=xt_size)
+    # draw ops of all vectors before sharding, so that all shards see the same test plan
+    vectors = [
+        (ad_size, xt_size, tb.sizes.randint(0, 2 if tb.supports_hash else 1))
+        for ad_size, xt_size in itertools.product(ad_sizes, xt_sizes)
+    ]
 
-    await tb.launch_monitors()
-    await tb.launch_drivers()
+    def vectors_of_shard():
+        for ad_size, xt_size, op in tb.shard_items(vectors):
+            if op == 0:
+                yield Vector("enc", ad_size=ad_size, xt_size=xt_size)
+            elif op == 1:
+                yield Vector("dec", ad_size=ad_size, xt_size=xt_size)
+            else:
+                yield Vector("hash", hm_size=xt_size)
 
-    await tb.join_drivers()
-    await tb.join_monitors()
+    # vectors are generated, encoded and checked on the fly, keeping only a few messages in memory
+    await tb.run_stream(vectors_of_shard())
 
 
 @cocotb.test()
@@ -442,8 +476,30 @@ async def measure_timings(dut: HierarchyObject):
                 "msgBytes": "long",
             }
         )
+        bt = "AD+XT reused key"
+        for sz in sizes:
+            cycles = (await tb.measure_key_reuse(dict(op=op, ad_size=sz, xt_size=sz)))["reused key"]
+            results[f"{bt} {sz}"] = cycles
+            db_results.append(
+                {
+                    "Cycles": cycles,
+                    "Op": op.capitalize().capitalize(),
+                    "Reuse Key": "True",
+                    "Throughput": f"{(2 * sz) / cycles}",
+                    "adBytes": str(sz),
+                    "msgBytes": str(sz),
+                }
+            )
         all_results[op] = results
 
+    results = {}
+    op = "dec_fail"
+    for bt in ["tag", "ct"]:
+        for sz in sizes:
+            cycles = await tb.measure_op(dict(op=op, ad_size=sz, xt_size=sz, corrupt=bt))
+            results[f"AD+XT {sz} forged {bt}"] = cycles
+    all_results[op] = results
+
     if tb.supports_hash:
         results = {}
         op = "hash"
@@ -459,9 +515,22 @@ async def measure_timings(dut: HierarchyObject):
         all_results[op] = results
 
     pprint(all_results)
+    tb.check_timings(all_results)
+    tb.calibrate_cycle_model(dict(AD=AD_BS, XT=XT_BS, HM=HM_BS))
     import json
     print(json.dumps(db_results, indent=2))
 
 
+@cocotb.test()
+async def workload_throughput(dut: HierarchyObject):
+    """Back-to-back throughput of a workload histogram (`run.py --workload CSV`)"""
+    max_stalls = 0
+    tb = RefCheckerTb(dut, debug=False, max_in_stalls=max_stalls, max_out_stalls=max_stalls)
+
+    await tb.start()
+
+    await tb.measure_workload_from_env()
+
+
 if __name__ == "__main__":
     print("should be run as a cocotb module")
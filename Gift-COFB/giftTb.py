@@ -1,6 +1,4 @@
 from pathlib import Path
-import random
-from random import randint
 import sys
 import os
 import inspect
@@ -28,10 +26,10 @@ sys.path.append(SCRIPT_DIR)
 
 try:
     from .cocolight.lwc_api import LwcCffi, LwcAead, LwcHash
-    from .cocolight import LwcRefCheckerTb
+    from .cocolight import LwcRefCheckerTb, Vector
 except:
     from cocolight.lwc_api import LwcCffi, LwcAead, LwcHash
-    from cocolight import LwcRefCheckerTb
+    from cocolight import LwcRefCheckerTb, Vector
 
 class Cref(LwcCffi, LwcAead, LwcHash):
     """ Python wrapper for C-Reference implementation """
@@ -175,18 +173,23 @@ async def blanket_test_simple(dut: HierarchyObject):
 
     await tb.start()
 
-    for ad_size, xt_size in itertools.product(short_sizes(AD_BS), short_sizes(XT_BS)):
+    for ad_size, xt_size in tb.shard_items(itertools.product(short_sizes(AD_BS), short_sizes(XT_BS))):
         await tb.xdec_test(ad_size=ad_size, ct_size=xt_size)
         print(f"ad_size={ad_size} pt_size={xt_size}")
         await tb.xenc_test(ad_size=ad_size, pt_size=xt_size)
     #     if tb.supports_hash:
     #         await tb.xhash_test(xt_size)
 
-    await tb.xdec_test(ad_size=1536, ct_size=0)
-    await tb.xenc_test(ad_size=1536, pt_size=0)
-    await tb.xdec_test(ad_size=0, ct_size=1536)
-    await tb.xenc_test(ad_size=0, pt_size=1536)
-    await tb.xdec_test(ad_size=0, ct_size=1535)
+    # long messages, split between shards like the vectors above
+    long_vectors = [
+        Vector("dec", ad_size=1536, xt_size=0),
+        Vector("enc", ad_size=1536, xt_size=0),
+        Vector("dec", ad_size=0, xt_size=1536),
+        Vector("enc", ad_size=0, xt_size=1536),
+        Vector("dec", ad_size=0, xt_size=1535),
+    ]
+    for vector in tb.shard_items(long_vectors):
+        await tb.run_vector(vector)
 
     await tb.launch_monitors()
     await tb.launch_drivers()
@@ -210,29 +213,32 @@ async def randomized_tests(dut: HierarchyObject):
     tb = RefCheckerTb(dut, debug=debug, max_in_stalls=5, max_out_stalls=5)
 
     ad_sizes = [0, 1, 15, 16, 17,  23, 24, 25, 31, 32, 33, 43, 44, 45, 47, 48, 49, 61, 64, 65, 67, 3*AD_BS - 1 ] + \
-        [randint(2, 500) for _ in range(30)] + short_sizes(AD_BS)
+        [tb.sizes.randint(2, 500) for _ in range(30)] + short_sizes(AD_BS)
 
     ad_sizes = list(set(ad_sizes))  # unique
-    random.shuffle(ad_sizes)
+    tb.sizes.shuffle(ad_sizes)
     xt_sizes = ad_sizes[:] + short_sizes(XT_BS)
-    random.shuffle(xt_sizes)
+    tb.sizes.shuffle(xt_sizes)
 
     await tb.start()
 
-    for ad_size, xt_size in itertools.product(ad_sizes, xt_sizes):
-        op = randint(0, 2 if tb.supports_hash else 1)
-        if (op == 0):
-            await tb.xenc_test(ad_size=ad_size, pt_size=xt_size)
-        elif (op == 1):
-            await tb.xdec_test(ad_size=ad_size, ct_size=xt_size)
-        else:
-            await tb.xhash_test(hm_size=xt_size)
+    # draw ops of all vectors before sharding, so that all shards see the same test plan
+    vectors = [
+        (ad_size, xt_size, tb.sizes.randint(0, 2 if tb.supports_hash else 1))
+        for ad_size, xt_size in itertools.product(ad_sizes, xt_sizes)
+    ]
 
-    await tb.launch_monitors()
-    await tb.launch_drivers()
+    def vectors_of_shard():
+        for ad_size, xt_size, op in tb.shard_items(vectors):
+            if op == 0:
+                yield Vector('enc', ad_size=ad_size, xt_size=xt_size)
+            elif op == 1:
+                yield Vector('dec', ad_size=ad_size, xt_size=xt_size)
+            else:
+                yield Vector('hash', hm_size=xt_size)
 
-    await tb.join_drivers()
-    await tb.join_monitors()
+    # vectors are generated, encoded and checked on the fly, keeping only a few messages in memory
+    await tb.run_stream(vectors_of_shard())
 
 
 @cocotb.test()
@@ -296,6 +302,8 @@ async def measure_timings(dut: HierarchyObject, supportsHash=False):
         all_results[op] = results
 
     pprint(all_results)
+    tb.check_timings(all_results)
+    tb.calibrate_cycle_model(dict(AD=AD_BS, XT=XT_BS, HM=HM_BS))
 
 
 if __name__ == "__main__":
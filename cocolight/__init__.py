@@ -1,14 +1,44 @@
-from typing import List, Optional, Union
+import json
+import os
+import random
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union
 
+import cocotb
 from cocotb.utils import get_sim_time
 from .lwc_api import LwcAead, LwcHash
 
 from cocotb.handle import SimHandleBase
+from cocotb.queue import Queue as StreamQueue
 from cocotb.triggers import First, Join, ReadOnly, RisingEdge, Timer
 
-from .hw_api import Instruction, Segment, SegmentType, OpCode, Status
-from .utils import rand_bytes
-from .valid_ready_tester import ValidReadyTester, ValidReadyDriver, ValidReadyMonitor
+from .cycle_model import (
+    CYCLE_MODEL_ENV,
+    CYCLE_MODEL_TOLERANCE_ENV,
+    CYCLE_MODEL_UPDATE_ENV,
+    CycleModel,
+    OpSample,
+    load_model,
+    save_model,
+)
+from .hw_api import API_BYTEORDER, Instruction, Segment, SegmentType, OpCode, Status
+from .journal import REPLAY_ENV, Vector, VectorJournal, load_replay
+from .metrics import TimedCalls
+from .perf_db import DESIGN_ENV, REVISION_ENV, PerfDb
+from .rng import RngStreams, derive_seed
+from .utils import bytes_to_words, flip_bit, rand_bytes, shard_items
+from .valid_ready_tester import Message, ValidReadyTester, ValidReadyDriver, ValidReadyMonitor
+from .workload import (
+    CLOCK_MHZ_ENV,
+    WORKLOAD_ENV,
+    WORKLOAD_OPS_ENV,
+    WORKLOAD_REPORT_ENV,
+    format_report,
+    load_histogram,
+    sample_workload,
+    workload_report,
+)
+
+T = TypeVar("T")
 
 
 def chunks(l, n):
@@ -26,6 +56,52 @@ def show_messages(messages, width):
         print(preamble + f'\n{" "*len(preamble)}'.join(lines))
 
 
+def merge_timestamps(messages: List[Message]) -> Dict[str, Tuple[int, int]]:
+    merged: Dict[str, Tuple[int, int]] = {}
+    for message in messages:
+        for name, (t0, t1) in message.timestamps.items():
+            if name in merged:
+                t0, t1 = min(t0, merged[name][0]), max(t1, merged[name][1])
+            merged[name] = (t0, t1)
+    return merged
+
+
+def latency_breakdown(
+    inputs: Dict[str, Tuple[int, int]], outputs: Dict[str, Tuple[int, int]], t_start: int, t_end: int
+) -> Dict[str, int]:
+    """Split [t_start, t_end] into consecutive phases, based on first/last handshake times of segments.
+    inputs/outputs: segment name -> (first, last) handshake time on input (pdi/sdi) and output (do) buses
+    """
+
+    def first(timestamps, *names):
+        ts = [timestamps[n][0] for n in names if n in timestamps]
+        return min(ts) if ts else None
+
+    def last(timestamps, *names):
+        ts = [timestamps[n][1] for n in names if n in timestamps]
+        return max(ts) if ts else None
+
+    msg_types = ("PT", "CT", "HM")
+    init_done = first(inputs, "AD", *msg_types)
+    if init_done is None:
+        init_done = last(inputs, "NPUB")
+    msg_done = [t for t in (last(inputs, *msg_types), last(outputs, "PT", "CT")) if t is not None]
+    milestones = [
+        ("key load", last(inputs, "KEY")),
+        ("init", init_done),
+        ("AD", last(inputs, "AD")),
+        ("message", max(msg_done, default=None)),
+        ("finalization", t_end),
+    ]
+    phases = {}
+    t = t_start
+    for phase, milestone in milestones:
+        milestone = t if milestone is None else max(milestone, t)
+        phases[phase] = milestone - t
+        t = milestone
+    return phases
+
+
 class Tb(ValidReadyTester):
     def __init__(
         self,
@@ -67,8 +143,11 @@ class Tb(ValidReadyTester):
             await driver.fork()
 
     async def join_monitors(self, timeout=None):
-        for mon in self.monitors.__dict__.values():
-            await mon.join(timeout)
+        try:
+            for mon in self.monitors.__dict__.values():
+                await mon.join(timeout)
+        finally:
+            self.save_metrics()
 
     async def join_drivers(self, timeout=None):
         for driver in self.drivers.__dict__.values():
@@ -76,6 +155,12 @@ class Tb(ValidReadyTester):
 
 
 class LwcTb(Tb):
+    # output of a decryption that failed tag verification, before the failure status:
+    #   "unverified": the decrypted plaintext (bluelight's LwcApi sends it out while verifying the tag)
+    #   "zeroed": a PT segment of the same length with all bytes zero
+    #   "none": no plaintext segment
+    failed_dec_output = "unverified"
+
     def __init__(
         self, dut: SimHandleBase, debug=False, max_in_stalls=0, max_out_stalls=0, min_out_stalls=0
     ) -> None:
@@ -93,47 +178,89 @@ class LwcTb(Tb):
         self.pdi: ValidReadyDriver = self.drivers.pdi
         self.sdi: ValidReadyDriver = self.drivers.sdi
         self.do: ValidReadyMonitor = self.monitors.do
+        # when not None, enqueued/expected messages are also collected here (bus name -> messages)
+        self.timed_messages: Optional[Dict[str, List[Message]]] = None
+        # id of the messages of the next operation, numbered like the do monitor's messages
+        self.next_msg_id = 1
+        # seeds of the stall schedules of the next operation's input/output messages (None: global `random`)
+        self.in_stall_seed: Optional[int] = None
+        self.out_stall_seed: Optional[int] = None
+        # while streaming, messages of the current operation, before they are put on the bounded bus queues
+        self._outbox: Optional[List[Tuple[Union[ValidReadyDriver, ValidReadyMonitor], Message]]] = None
+
+    def _submit(self, bus: Union[ValidReadyDriver, ValidReadyMonitor], message: Message):
+        if self._outbox is not None:
+            self._outbox.append((bus, message))
+        else:
+            bus.queue.put(message)
+
+    def _track(self, bus: Union[ValidReadyDriver, ValidReadyMonitor], message: Message):
+        if self.timed_messages is not None:
+            self.timed_messages.setdefault(bus.name, []).append(message)
 
     def enqueue_message(self, instruction: Instruction, *segments: Segment):
         sender = self.sdi if instruction.op == OpCode.LDKEY else self.pdi
         width = sender.width
 
-        # self.log.debug(f'enqueuing instruction {instruction} on {sender.name}')
-        message = instruction.to_words(width)
-        last_idx = len(segments) - 1
-        for i, segment in enumerate(segments):
-            last = i == last_idx
-
-            segment.header.last = last
-
-            # eoi = last
-            # if not last:
-            eoi = True
-            for x in segments[i + 1 :]:
-                if x.len and x.type not in {SegmentType.TAG, SegmentType.LENGTH}:
-                    eoi = False
-                    break
-
-            segment.header.last = last
-            segment.header.eoi = eoi
-            segment.header.eot = last or segments[i + 1].type != segment.type
-
-            message.extend(segment.to_words(width))
-
-        sender.queue.put(message)
-
-    def expect_message(self, *segments: Segment, status=Status.Success):
-        width = self.do.width
-        message = []
-        for segment in segments:
-            exp_words = segment.to_words(width)
-            message.extend(exp_words)
-        message.extend(status.to_words(width))
-        self.do.queue.put(message)
-
-    async def encrypt_test(self, key, nonce, ad, pt, ct, tag):
+        with self.metrics.timed("hw_api"):
+            # self.log.debug(f'enqueuing instruction {instruction} on {sender.name}')
+            message = Message()
+            message.id = self.next_msg_id
+            message.stall_seed = self.in_stall_seed
+            message.add_span(instruction.op.name, instruction.to_words(width))
+            last_idx = len(segments) - 1
+            for i, segment in enumerate(segments):
+                last = i == last_idx
+
+                segment.header.last = last
+
+                # eoi = last
+                # if not last:
+                eoi = True
+                for x in segments[i + 1 :]:
+                    if x.len and x.type not in {SegmentType.TAG, SegmentType.LENGTH}:
+                        eoi = False
+                        break
+
+                segment.header.last = last
+                segment.header.eoi = eoi
+                segment.header.eot = last or segments[i + 1].type != segment.type
+
+                message.extend(segment.header.to_words(width))
+                message.add_span(segment.type.name, bytes_to_words(segment.data, width, API_BYTEORDER))
+
+        self._track(sender, message)
+        self._submit(sender, message)
+
+    def expect_message(self, *segments: Segment, status=Status.Success, checked_bytes: Optional[int] = None):
+        """With `checked_bytes`, only the words holding the first `checked_bytes` bytes of each segment's data
+        are checked, the values of the following words are not."""
+        with self.metrics.timed("hw_api"):
+            width = self.do.width
+            message = Message()
+            message.id = self.next_msg_id
+            message.stall_seed = self.out_stall_seed
+            self.next_msg_id += 1  # each operation ends with its expected output
+            for segment in segments:
+                message.extend(segment.header.to_words(width))
+                words = bytes_to_words(segment.data, width, API_BYTEORDER)
+                if checked_bytes is not None:
+                    checked_words = checked_bytes // (width // 8)
+                    words = words[:checked_words] + [None] * (len(words) - checked_words)
+                message.add_span(segment.type.name, words)
+            message.add_span("STATUS", status.to_words(width))
+        self._track(self.do, message)
+        self._submit(self.do, message)
+
+    def load_key(self, key):
+        # ACTKEY makes the core receive the key from sdi and use it starting with the next operation
         self.enqueue_message(Instruction(OpCode.ACTKEY))
         self.enqueue_message(Instruction(OpCode.LDKEY), *Segment.segmentize(SegmentType.KEY, key))
+
+    async def encrypt_test(self, key, nonce, ad, pt, ct, tag, new_key=True):
+        """with new_key=False, the core reuses the previously loaded key, which must be `key`"""
+        if new_key:
+            self.load_key(key)
         self.enqueue_message(
             Instruction(OpCode.ENC),
             *Segment.segmentize(SegmentType.NPUB, nonce),
@@ -146,9 +273,9 @@ class LwcTb(Tb):
             *Segment.segmentize(SegmentType.TAG, tag, last=1, eot=1, eoi=0),
         )
 
-    async def decrypt_test(self, key, nonce, ad, pt, ct, tag):
-        self.enqueue_message(Instruction(OpCode.ACTKEY))
-        self.enqueue_message(Instruction(OpCode.LDKEY), *Segment.segmentize(SegmentType.KEY, key))
+    async def decrypt_test(self, key, nonce, ad, pt, ct, tag, new_key=True):
+        if new_key:
+            self.load_key(key)
         self.enqueue_message(
             Instruction(OpCode.DEC),
             *Segment.segmentize(SegmentType.NPUB, nonce),
@@ -158,6 +285,28 @@ class LwcTb(Tb):
         )
         self.expect_message(Segment(SegmentType.PT, pt, last=1, eot=1, eoi=0))
 
+    async def decrypt_fail_test(self, key, nonce, ad, ct, tag, pt, pt_checked=None, new_key=True):
+        """Decryption of a forged ciphertext or tag, which the core must reject with `Status.Failure`.
+        `pt` is the expected unverified plaintext, of which only the first `pt_checked` bytes are checked
+        (default: all), see `failed_dec_output`."""
+        if new_key:
+            self.load_key(key)
+        self.enqueue_message(
+            Instruction(OpCode.DEC),
+            *Segment.segmentize(SegmentType.NPUB, nonce),
+            *Segment.segmentize(SegmentType.AD, ad),
+            *Segment.segmentize(SegmentType.CT, ct),
+            *Segment.segmentize(SegmentType.TAG, tag),
+        )
+        if self.failed_dec_output == "none":
+            self.expect_message(status=Status.Failure)
+            return
+        if self.failed_dec_output == "zeroed":
+            pt, pt_checked = bytes(len(ct)), None
+        self.expect_message(
+            Segment(SegmentType.PT, pt, last=1, eot=1, eoi=0), status=Status.Failure, checked_bytes=pt_checked
+        )
+
     async def hash_test(self, hm, digest):
         self.enqueue_message(Instruction(OpCode.HASH), *Segment.segmentize(SegmentType.HM, hm))
         self.expect_message(*Segment.segmentize(SegmentType.DIGEST, digest, last=1, eot=1, eoi=0))
@@ -182,20 +331,198 @@ class LwcRefCheckerTb(LwcTb):
             min_out_stalls=min_out_stalls,
         )
         self.debug = debug
-        self.ref = ref
+        self.ref = TimedCalls(ref, self.metrics, "ref_model")
         self.supports_hash = supports_hash
         self.rand_inputs = not debug
+        self.perf_db = PerfDb.from_env()
+        self.last_breakdown: Dict[str, int] = {}
+        self.op_samples: List[OpSample] = []  # latencies measured by `measure_op`
+        self.rng = random.Random()  # payload of the current vector
+        test = getattr(cocotb.regression_manager, "_test", None)
+        test_name = getattr(test, "__qualname__", "unknown")
+        self.streams = RngStreams.from_env(test_name)
+        # for drawing vector sizes and ops of the test plan
+        self.sizes: random.Random = self.streams.sizes
+        self.journal = VectorJournal.from_env(test_name)
+        if self.journal:
+            self.journal.plan(self.streams.as_dict())
+        replay_file = os.environ.get(REPLAY_ENV)
+        # vectors to issue in place of the ones of the test
+        self.replay: Optional[List[Vector]] = load_replay(replay_file, test_name) if replay_file else None
+        # key sessions: when enabled, encryptions/decryptions reuse the loaded key
+        self.key_reuse = False
+        self.key_session_length: Optional[int] = None
+        self._session_ops = 0
+        self.loaded_key_seed: Optional[int] = None  # key loaded by the operations issued so far
+
+    def start_key_session(self, length: Optional[int] = None):
+        """Following encryptions and decryptions share a key, loaded (ACTKEY + LDKEY) by the first of them.
+        With `length`, a new key is loaded every `length` operations."""
+        self.key_reuse = True
+        self.key_session_length = length
+        self._session_ops = None  # load a new key first
+
+    def end_key_session(self):
+        """load a new key for each following operation"""
+        self.key_reuse = False
+
+    def gen_key(self, key_seed: int) -> bytes:
+        if not self.rand_inputs:
+            return self.gen_inputs(self.ref.CRYPTO_KEYBYTES)
+        return rand_bytes(self.ref.CRYPTO_KEYBYTES, random.Random(key_seed))
+
+    def _key_schedule(self, vector: Vector) -> Vector:
+        """decide whether `vector` loads a new key, and which key it uses"""
+        new_key = vector.new_key
+        if new_key is None:
+            new_key = (
+                not self.key_reuse
+                or self._session_ops is None
+                or (self.key_session_length is not None and self._session_ops >= self.key_session_length)
+            )
+        key_seed = vector.key_seed
+        if key_seed is None:
+            if new_key or self.loaded_key_seed is None:
+                key_seed = derive_seed(vector.seed, "key")
+            else:
+                key_seed = self.loaded_key_seed
+        if key_seed != self.loaded_key_seed:
+            new_key = True  # e.g. a replayed key-reuse vector: its key has to be loaded first
+        if new_key:
+            self._session_ops = 0
+        if self._session_ops is not None:
+            self._session_ops += 1
+        self.loaded_key_seed = key_seed
+        return vector._replace(new_key=new_key, key_seed=key_seed)
+
+    def _forgery(self, vector: Vector) -> Vector:
+        """decide which bit of the tag or ciphertext a forged decryption inverts"""
+        requested = vector.corrupt or "tag"
+        assert requested in ("tag", "ct"), f"invalid corruption target: {requested}"
+        corrupt = "tag" if requested == "ct" and not vector.xt_size else requested  # no ciphertext to forge
+        num_bits = 8 * (vector.xt_size if corrupt == "ct" else self.ref.CRYPTO_ABYTES)
+        bit = vector.corrupt_bit
+        # draw a new position if none was given, or it doesn't fit (e.g. a ciphertext shrunk by `run.py --shrink`)
+        if bit is None or corrupt != requested or not 0 <= bit < num_bits:
+            bit = random.Random(derive_seed(vector.seed, "forgery")).randrange(num_bits)
+        return vector._replace(corrupt=corrupt, corrupt_bit=bit)
 
     def gen_inputs(self, numbytes):
         s = 0 if numbytes > 1 else 1
         return (
-            rand_bytes(numbytes)
+            rand_bytes(numbytes, self.rng)
             if self.rand_inputs
             else bytes([i % 255 for i in range(s, numbytes + s)])
         )
 
+    def shard_items(self, items: Iterable[T]) -> Iterator[T]:
+        """items of the test plan assigned to this shard (`utils.shard_items`). The vectors issued for an item are
+        seeded by its index in the full plan, so they are the same in sharded and unsharded runs."""
+        return self.streams.shard_items(items)
+
+    async def run_vector(self, vector: Vector):
+        """Issue a test vector. Its payload and stall schedules are drawn from RNGs seeded by the vector's seeds,
+        so that it can be reproduced on its own. Missing seeds are derived from the test's `RngStreams`."""
+        if self.replay is not None:
+            # replaying: the first vector of the test is replaced by the replayed ones, the others are skipped
+            replay, self.replay = self.replay, []
+            if replay:
+                self.log.info(f"replaying {len(replay)} vectors: {', '.join(map(str, replay))}")
+            for v in replay:
+                await self._issue(v)
+            return
+        await self._issue(vector)
+
+    async def _issue(self, vector: Vector):
+        seeds = self.streams.vector_seeds(vector.op, vector.ad_size, vector.xt_size, vector.hm_size)
+        vector = vector._replace(**{f: s for f, s in seeds.items() if getattr(vector, f) is None})
+        if vector.op in ("enc", "dec", "dec_fail"):
+            vector = self._key_schedule(vector)
+        if vector.op == "dec_fail":
+            vector = self._forgery(vector)
+        if self.journal:
+            self.journal.issued(self.next_msg_id, vector)
+        self.rng.seed(vector.seed)
+        self.in_stall_seed = vector.in_seed
+        self.out_stall_seed = vector.out_seed
+        try:
+            if vector.op == "enc":
+                await self._xenc_test(vector.ad_size, vector.xt_size, vector.key_seed, vector.new_key)
+            elif vector.op == "dec":
+                await self._xdec_test(vector.ad_size, vector.xt_size, vector.key_seed, vector.new_key)
+            elif vector.op == "dec_fail":
+                await self._xdec_fail_test(
+                    vector.ad_size,
+                    vector.xt_size,
+                    vector.key_seed,
+                    vector.new_key,
+                    vector.corrupt,
+                    vector.corrupt_bit,
+                )
+            elif vector.op == "hash":
+                await self._xhash_test(vector.hm_size)
+            else:
+                raise ValueError(f"unknown operation: {vector.op}")
+        finally:
+            self.in_stall_seed = self.out_stall_seed = None
+
+    async def run_stream(self, vectors: Iterable[Vector], maxsize=4, timeout=None):
+        """Issue and check `vectors` (e.g. a generator) with bounded memory: each vector is generated and encoded
+        only when the bus queues, holding at most `maxsize` messages each, have room for its messages.
+        Launches and joins the drivers and monitors; messages enqueued before are sent first."""
+        buses = [self.pdi, self.sdi, self.do]
+        for bus in buses:
+            bus.stream = StreamQueue(maxsize=maxsize)
+
+        async def produce():
+            try:
+                for vector in vectors:
+                    self._outbox = []
+                    await self.run_vector(vector)
+                    outbox, self._outbox = self._outbox, None
+                    for bus, message in outbox:
+                        await bus.stream.put(message)
+            finally:
+                self._outbox = None
+                for bus in buses:
+                    await bus.stream.put(None)  # end of stream
+
+        producer = cocotb.start_soon(produce())
+        try:
+            await self.launch_monitors()
+            await self.launch_drivers()
+            await self.join_drivers(timeout)
+            await self.join_monitors(timeout)
+            await Join(producer)
+        finally:
+            for bus in buses:
+                bus.stream = None
+
+    async def join_monitors(self, timeout=None):
+        try:
+            await super().join_monitors(timeout)
+        finally:
+            if self.journal:
+                last = self.do.last_id or 0
+                self.journal.finished(self.do.failed_ids, range(last + 1, self.next_msg_id))
+
     async def xenc_test(self, ad_size, pt_size):
-        key = self.gen_inputs(self.ref.CRYPTO_KEYBYTES)
+        await self.run_vector(Vector("enc", ad_size=ad_size, xt_size=pt_size))
+
+    async def xdec_test(self, ad_size, ct_size):
+        await self.run_vector(Vector("dec", ad_size=ad_size, xt_size=ct_size))
+
+    async def xdec_fail_test(self, ad_size, ct_size, corrupt="tag", bit=None):
+        """decryption with `bit` (default: random) of the tag or ciphertext (`corrupt`: "tag" or "ct") inverted"""
+        await self.run_vector(
+            Vector("dec_fail", ad_size=ad_size, xt_size=ct_size, corrupt=corrupt, corrupt_bit=bit)
+        )
+
+    async def xhash_test(self, hm_size):
+        await self.run_vector(Vector("hash", hm_size=hm_size))
+
+    async def _xenc_test(self, ad_size, pt_size, key_seed, new_key):
+        key = self.gen_key(key_seed)
         npub = self.gen_inputs(self.ref.CRYPTO_NPUBBYTES)
         ad = self.gen_inputs(ad_size)
         pt = self.gen_inputs(pt_size)
@@ -205,10 +532,10 @@ class LwcRefCheckerTb(LwcTb):
                 f"key={key.hex()}\nnpub={npub.hex()}\nad={ad.hex()}\n"
                 + f"pt={pt.hex()}\nct={ct.hex()}\ntag={tag.hex()}\n"
             )
-        await self.encrypt_test(key, npub, ad, pt, ct, tag)
+        await self.encrypt_test(key, npub, ad, pt, ct, tag, new_key=new_key)
 
-    async def xdec_test(self, ad_size, ct_size):
-        key = self.gen_inputs(self.ref.CRYPTO_KEYBYTES)
+    async def _xdec_test(self, ad_size, ct_size, key_seed, new_key):
+        key = self.gen_key(key_seed)
         npub = self.gen_inputs(self.ref.CRYPTO_NPUBBYTES)
         ad = self.gen_inputs(ad_size)
         pt = self.gen_inputs(ct_size)
@@ -221,36 +548,176 @@ class LwcRefCheckerTb(LwcTb):
                 f"key={key.hex()}\nnpub={npub.hex()}\nad={ad.hex()}\n"
                 + f"pt={pt.hex()}\n\nct={ct.hex()}\ntag={tag.hex()}"
             )
-        await self.decrypt_test(key, npub, ad, pt, ct, tag)
+        await self.decrypt_test(key, npub, ad, pt, ct, tag, new_key=new_key)
 
-    async def xhash_test(self, hm_size):
+    async def _xdec_fail_test(self, ad_size, ct_size, key_seed, new_key, corrupt, bit):
+        key = self.gen_key(key_seed)
+        npub = self.gen_inputs(self.ref.CRYPTO_NPUBBYTES)
+        ad = self.gen_inputs(ad_size)
+        pt = self.gen_inputs(ct_size)
+        ct, tag = self.ref.encrypt(pt, ad, npub, key)
+        pt_checked = None
+        if corrupt == "ct":
+            ct = flip_bit(ct, bit)
+            # the unverified plaintext is only known up to the forged byte
+            pt_checked = bit // 8
+        else:
+            tag = flip_bit(tag, bit)
+        assert self.ref.decrypt(ct, ad, npub, key, tag) is None, "forgery accepted by the reference model"
+        if self.debug:
+            print(
+                f"key={key.hex()}\nnpub={npub.hex()}\nad={ad.hex()}\n"
+                + f"pt={pt.hex()}\n\nct={ct.hex()}\ntag={tag.hex()} ({corrupt} bit {bit} inverted)"
+            )
+        await self.decrypt_fail_test(key, npub, ad, ct, tag, pt, pt_checked, new_key=new_key)
+
+    async def _xhash_test(self, hm_size):
         hm = self.gen_inputs(hm_size)
         digest: bytes = self.ref.hash(hm)
         if self.debug:
             print(f"message={hm.hex()}\ndigest={digest.hex()}")
         await self.hash_test(hm, digest=digest)
 
+    async def _run_queued(self, timeout=None):
+        await self.launch_monitors()
+        await self.launch_drivers()
+        await self.join_drivers(timeout)
+        await self.join_monitors(timeout)
+
     async def measure_op(self, op_dict: dict, timeout=None):
+        """Latency (cycles) of a single operation.
+        For enc/dec/dec_fail, `new_key` (default: True) selects whether the key is loaded (ACTKEY + LDKEY)
+        as part of the operation or the previously loaded key is reused.
+        dec_fail is the rejection of a forged decryption, with "corrupt" ("tag" (default) or "ct") and
+        "corrupt_bit" (default: random) selecting the inverted bit."""
         op = op_dict["op"]
         ad_size = op_dict.get("ad_size")
         xt_size = op_dict.get("xt_size")
         hm_size = op_dict.get("hm_size")
+        new_key = op_dict.get("new_key", True)
+        if op in ("enc", "dec", "dec_fail") and not new_key and self.loaded_key_seed is None:
+            # load a key first, outside of the measured interval
+            await self.run_vector(Vector("enc", ad_size=0, xt_size=0, new_key=True))
+            await self._run_queued(timeout)
+        self.timed_messages = {}
         t0 = get_sim_time()
-        if op == "enc":
+        if op in ("enc", "dec"):
             assert ad_size is not None and xt_size is not None
-            await self.xenc_test(ad_size=ad_size, pt_size=xt_size)
-        elif op == "dec":
+            await self.run_vector(Vector(op, ad_size=ad_size, xt_size=xt_size, new_key=new_key))
+        elif op == "dec_fail":
             assert ad_size is not None and xt_size is not None
-            await self.xdec_test(ad_size=ad_size, ct_size=xt_size)
+            corrupt = op_dict.get("corrupt", "tag")
+            bit = op_dict.get("corrupt_bit")
+            await self.run_vector(
+                Vector(op, ad_size=ad_size, xt_size=xt_size, new_key=new_key, corrupt=corrupt, corrupt_bit=bit)
+            )
         elif op == "hash":
             assert hm_size is not None
             await self.xhash_test(hm_size=hm_size)
-        await self.launch_monitors()
-        await self.launch_drivers()
-        await self.join_drivers(timeout)
-        await self.join_monitors(timeout)
+        await self._run_queued(timeout)
         t1 = get_sim_time()
         delta = t1 - t0
         cycles = int(round(delta / self.clock_period))
-        print(f"{op} xt={xt_size} ad={ad_size}   t0={t0}, t1={t1}, delta={t1 - t0}ns cycles={cycles}")
-        return cycles - 1  # consistent with VHDL TB
+        key = "" if new_key or op == "hash" else " (reused key)"
+        print(f"{op}{key} xt={xt_size} ad={ad_size}   t0={t0}, t1={t1}, delta={t1 - t0}ns cycles={cycles}")
+        inputs = merge_timestamps(self.timed_messages.get("pdi", []) + self.timed_messages.get("sdi", []))
+        outputs = merge_timestamps(self.timed_messages.get("do", []))
+        self.timed_messages = None
+        self.last_breakdown = {
+            phase: int(round(t / self.clock_period))
+            for phase, t in latency_breakdown(inputs, outputs, t0, t1).items()
+        }
+        print("    " + " ".join(f"{phase}={c}" for phase, c in self.last_breakdown.items()))
+        cycles -= 1  # consistent with VHDL TB
+        self.op_samples.append(OpSample(op, ad_size or 0, xt_size or 0, hm_size or 0, bool(new_key), cycles))
+        return cycles
+
+    async def measure_key_reuse(self, op_dict: dict, timeout=None) -> Dict[str, int]:
+        """`measure_op` of an encryption/decryption with and without loading a new key"""
+        return {
+            "new key": await self.measure_op(dict(op_dict, new_key=True), timeout),
+            "reused key": await self.measure_op(dict(op_dict, new_key=False), timeout),
+        }
+
+    async def measure_workload(self, vectors: List[Vector], clock_mhz: float = 100.0, timeout=None) -> dict:
+        """Run `vectors` back-to-back (construct the testbench without stalls) and report the effective
+        throughput: cycles/byte, ops/sec and MB/s at `clock_mhz`"""
+        t0 = get_sim_time()
+        await self.run_stream(vectors, timeout=timeout)
+        t1 = get_sim_time()
+        cycles = int(round((t1 - t0) / self.clock_period))
+        return workload_report(vectors, cycles, clock_mhz)
+
+    async def measure_workload_from_env(self, timeout=None) -> Optional[dict]:
+        """`measure_workload` of a stream sampled from the histogram in COCOLIGHT_WORKLOAD (`run.py --workload`).
+        The report is also written to COCOLIGHT_WORKLOAD_REPORT, if set."""
+        path = os.environ.get(WORKLOAD_ENV)
+        if not path:
+            self.log.info(f"no workload histogram given ({WORKLOAD_ENV})")
+            return None
+        bins = load_histogram(path)
+        if not self.supports_hash and any(b.op == "hash" for b in bins):
+            self.log.warning("design does not support hashing, ignoring the hash operations of the workload")
+            bins = [b for b in bins if b.op != "hash"]
+        num_ops = int(os.environ.get(WORKLOAD_OPS_ENV, 1000))
+        clock_mhz = float(os.environ.get(CLOCK_MHZ_ENV, 100.0))
+        vectors = sample_workload(bins, num_ops, self.sizes)
+        report = await self.measure_workload(vectors, clock_mhz, timeout)
+        report["workload"] = str(path)
+        print(format_report(report))
+        report_file = os.environ.get(WORKLOAD_REPORT_ENV)
+        if report_file:
+            with open(report_file, "w") as f:
+                json.dump(report, f, indent=1)
+        return report
+
+    def calibrate_cycle_model(self, block_bytes: Dict[str, int]) -> CycleModel:
+        """Fit a `CycleModel` to the latencies measured so far and store it in the project's cycle models file
+        (COCOLIGHT_CYCLE_MODEL, set by run.py). Measurements that deviate from the previously stored model
+        of the design are reported, and the stored model is then kept as the baseline unless
+        COCOLIGHT_CYCLE_MODEL_UPDATE is set (`run.py --update-cycle-model`).
+        block_bytes: AD, XT (PT/CT) and HM block sizes in bytes"""
+        model = CycleModel.fit(self.op_samples, block_bytes, revision=os.environ.get(REVISION_ENV))
+        print(f"cycle model: {model}")
+        path = os.environ.get(CYCLE_MODEL_ENV)
+        design = os.environ.get(DESIGN_ENV)
+        if not path or not design:
+            return model
+        previous = load_model(path, design)
+        deviations = []
+        if previous is not None:
+            tolerance = float(os.environ.get(CYCLE_MODEL_TOLERANCE_ENV, 0.05))
+            deviations = previous.deviations(self.op_samples, tolerance)
+            for deviation in deviations:
+                self.log.warning(f"[cycle model] {deviation}")
+        if deviations and os.environ.get(CYCLE_MODEL_UPDATE_ENV, "0") != "1":
+            self.log.warning(
+                f"[cycle model] keeping the stored model of {design} in {path}:"
+                f" {len(deviations)} measurement(s) deviate from it, update it with --update-cycle-model"
+            )
+        else:
+            save_model(path, design, model)
+        return model
+
+    def check_timings(self, all_results: Dict[str, Dict[str, int]]):
+        """Store results of `measure_op` (op -> label -> cycles) in the performance database.
+        Fails if comparison is enabled and any of the measurements regressed beyond the tolerance.
+        Results of a regressed run are not stored, so they never become the baseline of later checks."""
+        db = self.perf_db
+        if db is None:
+            return
+        baseline = db.baseline(db.baseline_revision) if db.check else {}
+        for op, results in all_results.items():
+            for label, cycles in results.items():
+                db.record(op, label, cycles)
+        regressions = db.compare(baseline, db.tolerance or 0.0)
+        if regressions and db.check:
+            db.discard()
+        else:
+            db.commit()
+        if db.check:
+            if not baseline:
+                self.log.warning(f"No baseline timings for {db.design} in {db.path}")
+            for r in regressions:
+                self.log.error(f"[timing regression] {r}")
+            assert not regressions, f"{len(regressions)} timing regression(s) in {db.design}"
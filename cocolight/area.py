@@ -0,0 +1,139 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+# Area proxies of generated Verilog, for comparing design variants without running FPGA synthesis.
+#
+# With yosys on PATH, the design is synthesized for Xilinx 7-series (synth_xilinx) and LUTs and flip-flops
+# are counted. Otherwise the number of register bits is estimated from the Verilog: widths of the regs
+# assigned with non-blocking assignments (bsc only uses those in clocked blocks), multiplied by the
+# number of instances of each module.
+
+PathLike = Union[str, os.PathLike]
+
+_MODULE_RE = re.compile(r"^\s*module\s+(\w+)(.*?)^\s*endmodule", re.M | re.S)
+_PARAM_RE = re.compile(r"\bparameter\s+(?:\[[^\]]*\]\s*)?(\w+)\s*=\s*([^;,)]+)")
+_RANGE = r"\[([^\]:]+):([^\]]+)\]"
+_REG_RE = re.compile(rf"^\s*reg\s+(?:signed\s+)?(?:{_RANGE}\s*)?(\w+)\s*(?:{_RANGE})?\s*;", re.M)
+_NBA_RE = re.compile(r"(?:^|;|\)|\belse|\bbegin)\s*(\w+)\s*(?:\[[^\]]*\])?\s*<=(?!=)", re.M)
+_INST_RE = re.compile(r"^\s*(\w+)\s*(?:#\s*\((.*?)\)\s*)?(\w+)\s*\(", re.M | re.S)
+_OVERRIDE_RE = re.compile(r"\.(\w+)\s*\(([^()]*(?:\([^()]*\)[^()]*)*)\)")
+_LITERAL_RE = re.compile(r"\d*'[sS]?([bodhBODH])([0-9a-fA-F_xXzZ]+)")
+_LUT_CELLS = re.compile(r"^LUT\d$")
+_FF_CELLS = re.compile(r"^FD[CEPRS]E?$")
+
+
+def _literal(m: re.Match) -> str:
+    base = {"b": 2, "o": 8, "d": 10, "h": 16}[m.group(1).lower()]
+    digits = m.group(2).replace("_", "")
+    try:
+        return str(int(digits, base))
+    except ValueError:  # x/z digits
+        return "0"
+
+
+def _eval(expr: str, params: Dict[str, int]) -> Optional[int]:
+    expr = _LITERAL_RE.sub(_literal, expr.strip().replace("`", ""))
+    expr = re.sub(r"\b[A-Za-z_]\w*\b", lambda m: str(params.get(m.group(0), "_")), expr)
+    if "_" in expr or not re.fullmatch(r"[\d\s+\-*/()%<>]*", expr):
+        return None
+    try:
+        return int(eval(expr.replace("/", "//")))
+    except (ArithmeticError, SyntaxError):
+        return None
+
+
+class _Module:
+    def __init__(self, name: str, body: str) -> None:
+        self.name = name
+        self.body = body
+        self.defaults = {p: v for p, v in _PARAM_RE.findall(body)}
+
+    def params(self, overrides: Dict[str, str], parent: Dict[str, int]) -> Dict[str, int]:
+        values: Dict[str, int] = {}
+        for p, expr in self.defaults.items():
+            v = _eval(overrides[p], parent) if p in overrides else None
+            if v is None:
+                v = _eval(expr, values)
+            if v is not None:
+                values[p] = v
+        return values
+
+    def own_bits(self, params: Dict[str, int]) -> int:
+        assigned = set(_NBA_RE.findall(self.body))
+        bits = 0
+        for msb, lsb, name, lo, hi in _REG_RE.findall(self.body):
+            if name not in assigned:
+                continue
+            width = 1
+            if msb:
+                m, l = _eval(msb, params), _eval(lsb, params)
+                width = abs(m - l) + 1 if m is not None and l is not None else 1
+            depth = 1
+            if lo:
+                a, b = _eval(lo, params), _eval(hi, params)
+                depth = abs(b - a) + 1 if a is not None and b is not None else 1
+            bits += width * depth
+        return bits
+
+
+def register_bits(verilog_files: Iterable[PathLike], top: str) -> int:
+    """estimated number of flip-flop (and memory) bits of `top` and all of its instances"""
+    text = "\n".join(Path(f).read_text() for f in verilog_files)
+    text = re.sub(r"//[^\n]*|/\*.*?\*/", "", text, flags=re.S)
+    modules = {name: _Module(name, body) for name, body in _MODULE_RE.findall(text)}
+
+    def bits(name: str, overrides: Dict[str, str], parent: Dict[str, int], depth=0) -> int:
+        module = modules.get(name)
+        if module is None or depth > 64:
+            return 0
+        params = module.params(overrides, parent)
+        total = module.own_bits(params)
+        for inst_module, inst_params, _ in _INST_RE.findall(module.body):
+            if inst_module in modules:
+                total += bits(inst_module, dict(_OVERRIDE_RE.findall(inst_params or "")), params, depth + 1)
+        return total
+
+    return bits(top, {}, {})
+
+
+def yosys_stats(
+    verilog_files: Iterable[PathLike], top: str, defines: Iterable[str] = ()
+) -> Optional[Dict[str, int]]:
+    """LUT and flip-flop counts of a synth_xilinx run, None if yosys is not available"""
+    yosys = shutil.which("yosys")
+    if not yosys:
+        return None
+    with tempfile.TemporaryDirectory() as tmp:
+        stat_file = Path(tmp) / "stat.json"
+        read = " ".join(["read_verilog"] + [f"-D{d}" for d in defines] + [str(f) for f in verilog_files])
+        script = f"{read}; synth_xilinx -flatten -top {top}; tee -q -o {stat_file} stat -json"
+        subprocess.run([yosys, "-q", "-p", script], check=True, stdout=subprocess.DEVNULL)
+        with open(stat_file) as f:
+            stat = json.load(f)
+    cells: Dict[str, int] = stat.get("design", {}).get("num_cells_by_type", {})
+    return dict(
+        luts=sum(n for c, n in cells.items() if _LUT_CELLS.match(c)),
+        ffs=sum(n for c, n in cells.items() if _FF_CELLS.match(c)),
+        cells=sum(cells.values()),
+    )
+
+
+def area_proxy(verilog_files: List[PathLike], top: str, defines: Iterable[str] = ()) -> dict:
+    """`area` is the LUT count from yosys if available, otherwise the estimated register bits"""
+    result = dict(reg_bits=register_bits(verilog_files, top))
+    try:
+        stats = yosys_stats(verilog_files, top, defines)
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
+        print(f"yosys failed ({e}), using register bits as area proxy")
+        stats = None
+    if stats:
+        result.update(stats, area=stats["luts"], area_unit="LUT")
+    else:
+        result.update(area=result["reg_bits"], area_unit="reg bits")
+    return result
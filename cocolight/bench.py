@@ -0,0 +1,185 @@
+import json
+import os
+import re
+import shutil
+import struct
+import subprocess
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple, Union
+
+from .build_cache import StageStamps, executable_id, hash_files, hash_items
+from .hw_api import OpCode, SegmentHeader, SegmentType
+
+# Throughput benchmark of a Verilated `lwc` top without cocotb.
+#
+# The pdi/sdi/do words of LWC test vectors (pdi.txt, sdi.txt and do.txt, e.g. a KAT directory or the output
+# of `python -m cocolight.lwc_tlm`) are written to binary stream files, which a standalone Verilator main
+# (bench_main.cpp) feeds to the model as fast as the core accepts them, checking every `do` word.
+# Words of do.txt written as X are not checked.
+
+BENCH_MAIN = Path(__file__).parent / "bench_main.cpp"
+BENCH_EXE = "bench"
+WIDTH = 32
+
+PathLike = Union[str, os.PathLike]
+
+
+def read_kat_stream(path: PathLike) -> List[Tuple[int, int]]:
+    """(word, mask) of each word of a pdi.txt/sdi.txt/do.txt file; X digits are masked out"""
+    digits = WIDTH // 4
+    words = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            _, sep, value = line.partition("=")
+            if not sep:
+                continue
+            value = value.strip().upper()
+            for i in range(0, len(value), digits):
+                word = value[i : i + digits]
+                mask = int("".join("0" if c == "X" else "F" for c in word), 16)
+                words.append((int(word.replace("X", "0"), 16), mask))
+    return words
+
+
+def write_stream(path: PathLike, words: Iterable[int]):
+    words = list(words)
+    with open(path, "wb") as f:
+        f.write(struct.pack(f"<{len(words)}I", *words))
+
+
+def write_expected(path: PathLike, words: Iterable[Tuple[int, int]]):
+    write_stream(path, (x for word, mask in words for x in (word & mask, mask)))
+
+
+def stream_stats(pdi: List[int]) -> dict:
+    """operations and payload bytes (AD, PT/CT and hash message) of a pdi stream"""
+    ops = {}
+    payload = 0
+    i = 0
+    while i < len(pdi):
+        op = (pdi[i] >> 28) & 0xF
+        i += 1
+        if op not in (OpCode.ENC, OpCode.DEC, OpCode.HASH):
+            continue  # ACTKEY, LDKEY: no data on pdi
+        name = OpCode(op).name.lower()
+        ops[name] = ops.get(name, 0) + 1
+        while i < len(pdi):
+            hdr = SegmentHeader.from_word32(pdi[i])
+            i += 1 + -(-hdr.len // (WIDTH // 8))
+            if hdr.type in (SegmentType.AD, SegmentType.PT, SegmentType.CT, SegmentType.HM):
+                payload += hdr.len
+            if hdr.last:
+                break
+    return dict(ops=ops, bytes=payload)
+
+
+def reset_port(verilog_sources: Iterable[PathLike], toplevel: str) -> str:
+    """reset port of `toplevel`: active-low `rst_n` if it has one (like `Tb` detects it), otherwise `rst`"""
+    header = re.compile(rf"\bmodule\s+{re.escape(toplevel)}\b([^;]*);", re.S)
+    for src in verilog_sources:
+        m = header.search(Path(src).read_text())
+        if m:
+            return "rst_n" if re.search(r"\brst_n\b", m.group(1)) else "rst"
+    return "rst"
+
+
+class BenchBuild:
+    """Verilator build of `bench_main.cpp` with a Verilog top, cached by content like `CachedVerilator`"""
+
+    def __init__(
+        self,
+        verilog_sources: List[PathLike],
+        toplevel: str,
+        extra_args: Optional[List[str]] = None,
+        cache_dir: PathLike = "sim_build",
+    ) -> None:
+        self.verilog_sources = [str(s) for s in verilog_sources]
+        self.toplevel = toplevel
+        self.extra_args = list(extra_args or [])
+        self.reset = reset_port(self.verilog_sources, toplevel)
+        self.verilator = shutil.which("verilator")
+        self.digest = hash_items(
+            executable_id(self.verilator),
+            toplevel,
+            self.extra_args,
+            hash_files(self.verilog_sources),
+            hash_files([BENCH_MAIN]),
+        )
+        self.build_dir = Path(cache_dir) / f"bench-{toplevel}-{self.digest[:16]}"
+        self.exe = self.build_dir / BENCH_EXE
+        self.stamps = StageStamps(self.build_dir / "model.json")
+
+    def command(self) -> List[str]:
+        return (
+            [self.verilator, "--cc", "--exe", "--build", "-Wno-fatal", "--prefix", "Vtop"]
+            + ["--top-module", self.toplevel, "-Mdir", str(self.build_dir), "-o", BENCH_EXE]
+            + ["-CFLAGS", "-O2"]
+            + (["-CFLAGS", "-DRESET_N"] if self.reset == "rst_n" else [])
+            + self.extra_args
+            + [str(BENCH_MAIN.resolve())]
+            + self.verilog_sources
+        )
+
+    def build(self) -> Path:
+        if self.stamps.is_fresh("model", self.digest, [self.exe]):
+            print(f"Reusing benchmark model {self.exe}")
+            return self.exe
+        if not self.verilator:
+            raise FileNotFoundError("verilator not found")
+        self.build_dir.mkdir(parents=True, exist_ok=True)
+        cmd = self.command()
+        print(f"running {' '.join(cmd)}")
+        subprocess.run(cmd, check=True)
+        self.stamps.update("model", self.digest)
+        return self.exe
+
+
+def prepare_streams(kat_dir: PathLike, work_dir: PathLike) -> dict:
+    """binary streams of the pdi.txt, sdi.txt and do.txt in `kat_dir`, and statistics of one pass"""
+    kat_dir, work_dir = Path(kat_dir), Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    pdi = [w for w, _ in read_kat_stream(kat_dir / "pdi.txt")]
+    sdi = [w for w, _ in read_kat_stream(kat_dir / "sdi.txt")]
+    expected = read_kat_stream(kat_dir / "do.txt")
+    files = dict(pdi=work_dir / "pdi.bin", sdi=work_dir / "sdi.bin", do=work_dir / "do.bin")
+    write_stream(files["pdi"], pdi)
+    write_stream(files["sdi"], sdi)
+    write_expected(files["do"], expected)
+    stats = stream_stats(pdi)
+    return dict(files=files, pdi_words=len(pdi), sdi_words=len(sdi), do_words=len(expected), **stats)
+
+
+def run_bench(exe: PathLike, streams: dict, repeat=1, max_idle=100000, plus_args: Iterable[str] = ()) -> dict:
+    """run the benchmark executable on `prepare_streams` output; returns its summary with throughput figures"""
+    files = streams["files"]
+    cmd = [str(exe), str(files["pdi"]), str(files["sdi"]), str(files["do"]), str(repeat), str(max_idle)]
+    proc = subprocess.run(cmd + list(plus_args), stdout=subprocess.PIPE, text=True)
+    if proc.returncode not in (0, 1, 2):
+        raise subprocess.CalledProcessError(proc.returncode, cmd, proc.stdout)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    cycles, seconds = result["cycles"], result["wall_seconds"]
+    num_bytes = streams["bytes"] * repeat
+    result.update(
+        ops={op: n * repeat for op, n in streams["ops"].items()},
+        bytes=num_bytes,
+        expected_do_words=streams["do_words"] * repeat,
+        cycles_per_byte=cycles / num_bytes if num_bytes else None,
+        sim_cycles_per_sec=cycles / seconds if seconds else None,
+        passed=proc.returncode == 0 and result["do_words"] == streams["do_words"] * repeat,
+    )
+    return result
+
+
+def format_bench(result: dict) -> str:
+    ops = ", ".join(f"{op}={n}" for op, n in result["ops"].items())
+    lines = [
+        f"{sum(result['ops'].values())} operations ({ops}), {result['bytes']} bytes, {result['cycles']} cycles",
+        f"  do words: {result['do_words']} of {result['expected_do_words']}, {result['mismatches']} mismatches"
+        + (" TIMEOUT" if result["timeout"] else ""),
+        f"  cycles/byte: {result['cycles_per_byte'] or 0:.3f}",
+        f"  simulation: {result['wall_seconds']:.3f} s, {result['sim_cycles_per_sec'] or 0:,.0f} cycles/s",
+    ]
+    return "\n".join(lines)
@@ -0,0 +1,172 @@
+// Standalone throughput benchmark of a Verilated LWC core (see cocolight/bench.py), without cocotb.
+//
+// Streams pdi and sdi words from binary files into the `lwc` top, with `do_ready` always asserted, and
+// checks every `do` word against the expected stream. Stream files hold little-endian 32-bit words; the
+// expected `do` file holds (word, mask) pairs, compared as (do_data & mask) == word.
+//
+//   bench PDI.bin SDI.bin DO.bin [REPEAT [MAX_IDLE_CYCLES]] [+verilator+...]
+//
+// The streams are sent REPEAT times back-to-back. A summary is printed as a JSON object on stdout.
+// Exit status: 0 all words matched, 1 mismatches, 2 timeout (no handshake in MAX_IDLE_CYCLES), 3 usage.
+//
+// Tops with an active-low `rst_n` port instead of `rst` are built with -DRESET_N (detected by bench.py).
+
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+
+#include <chrono>
+#include <memory>
+#include <vector>
+
+#include "Vtop.h"
+#include "verilated.h"
+
+#ifdef RESET_N
+#define SET_RESET(top, active) ((top)->rst_n = !(active))
+#else
+#define SET_RESET(top, active) ((top)->rst = (active))
+#endif
+
+static vluint64_t main_time = 0;
+
+double sc_time_stamp() { return main_time; }
+
+static bool read_words(const char* path, std::vector<uint32_t>& words) {
+    FILE* f = fopen(path, "rb");
+    if (!f) {
+        perror(path);
+        return false;
+    }
+    unsigned char b[4];
+    while (fread(b, 1, 4, f) == 4) {
+        words.push_back(b[0] | (b[1] << 8) | (b[2] << 16) | ((uint32_t)b[3] << 24));
+    }
+    fclose(f);
+    return true;
+}
+
+struct Stream {
+    std::vector<uint32_t> words;
+    size_t index = 0;
+    uint64_t pass = 0;
+    uint64_t passes = 1;
+
+    bool done() const { return words.empty() || pass >= passes; }
+    uint32_t peek() const { return words[index]; }
+    void next() {
+        if (++index == words.size()) {
+            index = 0;
+            pass++;
+        }
+    }
+};
+
+int main(int argc, char** argv) {
+    std::vector<const char*> args;
+    for (int i = 1; i < argc; i++) {
+        if (argv[i][0] != '+') args.push_back(argv[i]);
+    }
+    if (args.size() < 3) {
+        fprintf(stderr, "usage: %s PDI.bin SDI.bin DO.bin [REPEAT [MAX_IDLE_CYCLES]]\n", argv[0]);
+        return 3;
+    }
+    uint64_t repeat = args.size() > 3 ? strtoull(args[3], nullptr, 10) : 1;
+    uint64_t max_idle = args.size() > 4 ? strtoull(args[4], nullptr, 10) : 100000;
+
+    Stream pdi, sdi, expected;
+    std::vector<uint32_t> do_pairs;
+    if (!read_words(args[0], pdi.words) || !read_words(args[1], sdi.words) || !read_words(args[2], do_pairs)) {
+        return 3;
+    }
+    std::vector<uint32_t> do_masks;
+    for (size_t i = 0; i + 1 < do_pairs.size(); i += 2) {
+        expected.words.push_back(do_pairs[i]);
+        do_masks.push_back(do_pairs[i + 1]);
+    }
+    pdi.passes = sdi.passes = expected.passes = repeat;
+
+    Verilated::commandArgs(argc, argv);
+    const std::unique_ptr<Vtop> top{new Vtop{"top"}};
+
+    // hold reset for a few cycles, as cocolight.Tb does
+    top->clk = 0;
+    SET_RESET(top, 1);
+    top->pdi_valid = 0;
+    top->sdi_valid = 0;
+    top->do_ready = 0;
+    for (int i = 0; i < 4; i++) {
+        top->clk = 0;
+        top->eval();
+        main_time += 5;
+        top->clk = 1;
+        top->eval();
+        main_time += 5;
+    }
+    SET_RESET(top, 0);
+
+    uint64_t cycles = 0, idle = 0, do_words = 0, mismatches = 0;
+    int64_t first_mismatch = -1;
+    bool timeout = false;
+    auto start = std::chrono::steady_clock::now();
+
+    while (!expected.done() || !pdi.done() || !sdi.done()) {
+        top->clk = 0;
+        top->pdi_valid = !pdi.done();
+        top->pdi_data = pdi.done() ? 0 : pdi.peek();
+        top->sdi_valid = !sdi.done();
+        top->sdi_data = sdi.done() ? 0 : sdi.peek();
+        top->do_ready = 1;
+        top->eval();
+        main_time += 5;
+
+        // handshakes of this cycle, sampled before the rising edge
+        bool pdi_fire = top->pdi_valid && top->pdi_ready;
+        bool sdi_fire = top->sdi_valid && top->sdi_ready;
+        bool do_fire = top->do_valid;
+        uint32_t do_data = top->do_data;
+
+        top->clk = 1;
+        top->eval();
+        main_time += 5;
+        cycles++;
+
+        if (pdi_fire) pdi.next();
+        if (sdi_fire) sdi.next();
+        if (do_fire) {
+            if (expected.done()) {
+                if (first_mismatch < 0) first_mismatch = do_words;
+                mismatches++;
+            } else {
+                uint32_t mask = do_masks[expected.index];
+                if ((do_data & mask) != (expected.peek() & mask)) {
+                    if (first_mismatch < 0) {
+                        first_mismatch = do_words;
+                        fprintf(stderr, "do word %llu: got %08X expected %08X (mask %08X)\n",
+                                (unsigned long long)do_words, do_data, expected.peek(), mask);
+                    }
+                    mismatches++;
+                }
+                expected.next();
+            }
+            do_words++;
+        }
+        if (pdi_fire || sdi_fire || do_fire) {
+            idle = 0;
+        } else if (++idle >= max_idle) {
+            timeout = true;
+            break;
+        }
+    }
+    double seconds = std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count();
+    top->final();
+
+    printf("{\"cycles\": %llu, \"pdi_words\": %llu, \"sdi_words\": %llu, \"do_words\": %llu, ",
+           (unsigned long long)cycles, (unsigned long long)(pdi.pass * pdi.words.size() + pdi.index),
+           (unsigned long long)(sdi.pass * sdi.words.size() + sdi.index), (unsigned long long)do_words);
+    printf("\"mismatches\": %llu, \"first_mismatch\": %lld, \"timeout\": %s, \"repeat\": %llu, ",
+           (unsigned long long)mismatches, (long long)first_mismatch, timeout ? "true" : "false",
+           (unsigned long long)repeat);
+    printf("\"wall_seconds\": %.6f}\n", seconds);
+    return timeout ? 2 : mismatches ? 1 : 0;
+}
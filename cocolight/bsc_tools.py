@@ -0,0 +1,108 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+from functools import lru_cache
+from pathlib import Path
+from subprocess import PIPE
+from typing import Dict, Iterable, List, Optional, Union
+
+from .build_cache import executable_id, hash_items
+
+# Helpers for locating the Verilog modules used by bsc-generated Verilog
+
+PathLike = Union[str, os.PathLike]
+
+
+def _convert_flag_value(v: str):
+    list_regex = re.compile(r"\s*\[(.*)\]\s*")
+    str_regex = re.compile(r'\s*"(.*)"\s*')
+    match = list_regex.match(v)
+    if match:
+        return [_convert_flag_value(s) for s in match.group(1).split(",")]
+    match = str_regex.match(v)
+    if match:
+        return match.group(1)
+    return v
+
+
+@lru_cache(maxsize=None)
+def _bsc_flags(bsc: str) -> dict:
+    kv_regex = re.compile(r"^\s+(\w+)\s=\s(.*),\s*$")
+    flags = {}
+    out = subprocess.run([bsc, "-print-flags-raw"], stdout=PIPE, check=True).stdout
+    for line in out.decode("utf-8").splitlines():
+        match = kv_regex.match(line)
+        if match:
+            flags[match.group(1)] = _convert_flag_value(match.group(2))
+    return flags
+
+
+def get_bsc_flags(bsc: PathLike = "bsc", cache_file: Optional[PathLike] = None) -> dict:
+    """Default flags of `bsc` (output of `bsc -print-flags-raw`).
+    If `cache_file` is given, flags are stored there per bsc executable and only queried again
+    when the executable changes."""
+    if not cache_file:
+        return _bsc_flags(str(bsc))
+    cache_file = Path(cache_file)
+    key = hash_items(executable_id(shutil.which(str(bsc)) or bsc))
+    cache = {}
+    if cache_file.exists():
+        try:
+            with open(cache_file) as f:
+                cache = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            cache = {}
+    if key not in cache:
+        cache = {key: _bsc_flags(str(bsc))}  # flags of other (e.g. replaced) executables are dropped
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_suffix(cache_file.suffix + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(cache, f, indent=1)
+        os.replace(tmp, cache_file)
+    return cache[key]
+
+
+def index_verilog_files(paths: Iterable[PathLike]) -> Dict[str, Path]:
+    """file name -> path of all .v files under `paths`. Earlier paths take precedence, as in bsc's vPath"""
+    index: Dict[str, Path] = {}
+    for vpath in paths:
+        for vfile in sorted(Path(vpath).glob(os.path.join("**", "*.v"))):
+            index.setdefault(vfile.name, vfile)
+    return index
+
+
+def get_used_mods(use_dir: PathLike, mod: str) -> List[str]:
+    """All modules (transitively) instantiated by `mod`, according to the .use files generated by bsc.
+    Each module is listed once, in topological order: modules come before the modules they instantiate."""
+    use_dir = Path(use_dir)
+    uses: Dict[str, List[str]] = {}
+    stack = [mod]
+    while stack:
+        m = stack.pop()
+        if m in uses:
+            continue
+        uses[m] = []
+        use_path = use_dir / f"{m}.use"
+        if use_path.exists():
+            with open(use_path) as f:
+                used = (l.strip() for l in f)
+                uses[m] = list(dict.fromkeys(u for u in used if u))
+        stack.extend(u for u in uses[m] if u not in uses)
+
+    # reverse post-order of a depth-first walk
+    order: List[str] = []
+    visited = {mod}
+    stack = [(mod, iter(uses[mod]))]
+    while stack:
+        m, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            order.append(m)
+        elif child not in visited:
+            visited.add(child)
+            stack.append((child, iter(uses[child])))
+    order.reverse()
+    return order[1:]  # excluding `mod` itself
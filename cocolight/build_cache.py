@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Union
+
+# Content-based stamps for incremental generation/build stages
+
+PathLike = Union[str, os.PathLike]
+
+
+def hash_items(*items) -> str:
+    """digest of JSON-serializable items (lists, dicts, strings, numbers)"""
+    return hashlib.sha256(json.dumps(items, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def hash_files(paths: Iterable[PathLike], chunk_size=1 << 20) -> str:
+    """digest of names and contents of files (missing files are hashed as such)"""
+    h = hashlib.sha256()
+    for p in paths:
+        p = Path(p)
+        h.update(str(p).encode("utf-8") + b"\0")
+        if not p.is_file():
+            h.update(b"<missing>\0")
+            continue
+        with open(p, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                h.update(chunk)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def executable_id(path: Optional[PathLike]) -> Optional[list]:
+    """cheap identity of an installed executable (resolved path, size, mtime), used instead of its version"""
+    if not path:
+        return None
+    p = Path(path).resolve()
+    try:
+        st = p.stat()
+    except OSError:
+        return [str(p)]
+    return [str(p), st.st_size, int(st.st_mtime)]
+
+
+class StageStamps:
+    """Input digests of build stages, persisted in a JSON file.
+    A stage is skipped if its inputs digest matches the stored one and all of its outputs exist."""
+
+    def __init__(self, path: PathLike) -> None:
+        self.path = Path(path)
+        self.stamps: Dict[str, str] = {}
+        if self.path.exists():
+            try:
+                with open(self.path) as f:
+                    self.stamps = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self.stamps = {}
+
+    def get(self, stage: str) -> Optional[str]:
+        return self.stamps.get(stage)
+
+    def is_fresh(self, stage: str, digest: str, outputs: Iterable[PathLike] = ()) -> bool:
+        return self.stamps.get(stage) == digest and all(Path(o).exists() for o in outputs)
+
+    def update(self, stage: str, digest: str):
+        self.stamps[stage] = digest
+        self._save()
+
+    def invalidate(self, *stages: str):
+        for stage in stages:
+            self.stamps.pop(stage, None)
+        self._save()
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.stamps, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
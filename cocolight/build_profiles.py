@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+# Named Verilator build profiles of `run.py`, and a log of simulation speed (simulated cycles per wall-clock
+# second) of every test run with them, to find the fastest profile that still passes on each design.
+#
+# The log is a JSON-lines file (`run.py --sim-speed-log sim_speed.jsonl`), one record per test run, with the
+# simulated cycles counted by the testbench (see `cocolight.metrics`):
+#   {"design": "Ascon", "profile": "fast", "args": [...], "test": "test_enc_dec", "status": "passed",
+#    "sim_cycles": 123456, "wall_seconds": 4.2, "cycles_per_sec": 29394.3, "revision": ..., "time": ...}
+
+PathLike = Union[str, os.PathLike]
+
+SIM_SPEED_FILE = "sim_speed.jsonl"
+
+
+class BuildProfile(NamedTuple):
+    name: str
+    description: str
+    extra_args: Tuple[str, ...]
+    waves: bool = False
+    split: bool = False  # many small C++ files: compile them with parallel make jobs
+    instrumented: bool = False  # slowed down by design (tracing, coverage), not a candidate for speed
+
+    def args(self, threads: int = 1) -> List[str]:
+        args = list(self.extra_args)
+        if threads > 1:
+            args += ["--threads", str(threads)]
+        return args
+
+    def make_args(self) -> List[str]:
+        return ["-j", str(os.cpu_count() or 1)] if self.split else []
+
+
+PROFILES: Dict[str, BuildProfile] = {
+    p.name: p
+    for p in (
+        BuildProfile("default", "optimized model (-O3), Verilator's default X handling", ("-O3",)),
+        BuildProfile(
+            "fast",
+            "-O3, fast X assignment, split output compiled in parallel",
+            (
+                "-O3",
+                "--x-assign",
+                "fast",
+                "--x-initial",
+                "unique",  # still randomized by +verilator+rand+reset+2
+                "--output-split",
+                "20000",
+                "--output-split-cfuncs",
+                "20000",
+            ),
+            split=True,
+        ),
+        BuildProfile(
+            "debug",
+            "unoptimized model, X assignments randomized at runtime",
+            ("-O0", "--x-assign", "unique", "--x-initial", "unique"),
+        ),
+        BuildProfile(
+            "trace",
+            "waveform tracing of all signals",
+            (
+                "--trace",
+                "--trace-structs",
+                "--trace-max-array",
+                "64",
+                "--trace-underscore",
+                "--trace-max-width",
+                "512",
+            ),
+            waves=True,
+            instrumented=True,
+        ),
+        BuildProfile(
+            "coverage", "line and toggle coverage (coverage.dat)", ("-O3", "--coverage"), instrumented=True
+        ),
+    )
+}
+
+
+def read_results(results_file: Optional[PathLike]) -> List[dict]:
+    """test name, status, wall time and sim time of the test cases in a cocotb results.xml"""
+    if not results_file or not Path(results_file).is_file():
+        return []
+    try:
+        testcases = ET.parse(results_file).iter("testcase")
+    except ET.ParseError:
+        return []
+    results = []
+    for tc in testcases:
+        if tc.find("failure") is not None or tc.find("error") is not None:
+            status = "failed"
+        elif tc.find("skipped") is not None:
+            status = "skipped"
+        else:
+            status = "passed"
+        results.append(
+            dict(
+                test=tc.get("name"),
+                status=status,
+                time=float(tc.get("time", 0)),
+                sim_time_ns=float(tc.get("sim_time_ns", 0)),
+            )
+        )
+    return results
+
+
+def record_sim_speed(
+    path: PathLike,
+    design: str,
+    profile: str,
+    args: List[str],
+    results: Iterable[dict],
+    cycles: Dict[str, int],
+    revision: Optional[str] = None,
+) -> List[dict]:
+    """append a record per test of `results` (see `read_results`) to the log at `path`.
+    cycles: simulated cycles by test name (or name of the sharded job), tests without a count are skipped"""
+    records = []
+    now = int(time.time())
+    for r in results:
+        test_cycles = cycles.get(r.get("name", r["test"]))
+        if r["status"] == "skipped" or test_cycles is None:
+            continue
+        records.append(
+            dict(
+                design=design,
+                profile=profile,
+                args=args,
+                test=r["test"],
+                status=r["status"],
+                sim_cycles=test_cycles,
+                wall_seconds=r["time"],
+                cycles_per_sec=test_cycles / r["time"] if r["time"] else None,
+                revision=revision,
+                time=now,
+            )
+        )
+    with open(path, "a") as f:
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+    return records
+
+
+def load_sim_speed(path: PathLike) -> List[dict]:
+    if not Path(path).exists():
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records: Iterable[dict]) -> Dict[str, Dict[str, dict]]:
+    """design -> profile -> runs, failures and overall cycles/s (total simulated cycles / total wall time)"""
+    summary: Dict[str, Dict[str, dict]] = {}
+    for r in records:
+        s = summary.setdefault(r["design"], {}).setdefault(
+            r["profile"], dict(runs=0, failed=0, sim_cycles=0, wall_seconds=0.0)
+        )
+        s["runs"] += 1
+        s["failed"] += r["status"] != "passed"
+        s["sim_cycles"] += r["sim_cycles"]
+        s["wall_seconds"] += r["wall_seconds"]
+    for profiles in summary.values():
+        for s in profiles.values():
+            s["cycles_per_sec"] = s["sim_cycles"] / s["wall_seconds"] if s["wall_seconds"] else None
+    return summary
+
+
+def fastest_safe(profiles: Dict[str, dict]) -> Optional[str]:
+    """fastest profile of a design without failed runs, excluding instrumented builds (trace, coverage)"""
+    candidates = [
+        (s["cycles_per_sec"], name)
+        for name, s in profiles.items()
+        if not s["failed"] and s["cycles_per_sec"] and name in PROFILES and not PROFILES[name].instrumented
+    ]
+    return max(candidates)[1] if candidates else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="simulation speed of Verilator build profiles")
+    parser.add_argument("log", nargs="?", default=SIM_SPEED_FILE, help="sim_speed.jsonl written by run.py")
+    parser.add_argument("--design", help="only show this design")
+    args = parser.parse_args(argv)
+
+    summary = summarize(r for r in load_sim_speed(args.log) if not args.design or r["design"] == args.design)
+    if not summary:
+        sys.exit(f"no simulation speed records in {args.log}")
+    for design, profiles in sorted(summary.items()):
+        print(design)
+        for name, s in sorted(profiles.items(), key=lambda kv: -(kv[1]["cycles_per_sec"] or 0)):
+            failed = f", {s['failed']} failed" if s["failed"] else ""
+            print(
+                f"  {name:10} {s['cycles_per_sec'] or 0:12,.0f} cycles/s"
+                f"  ({s['runs']} runs, {s['sim_cycles']} cycles in {s['wall_seconds']:.1f} s{failed})"
+            )
+        best = fastest_safe(profiles)
+        if best:
+            print(f"  fastest passing profile: {best}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
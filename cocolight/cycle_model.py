@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Union
+
+from .journal import Vector
+from .workload import format_report, load_histogram, sample_workload, workload_report
+
+# Analytical cycle model of an LWC core, fitted to latencies measured by `LwcRefCheckerTb.measure_op`:
+#
+#   cycles = overhead[op] + ad_block * AD blocks + xt_block * PT/CT blocks + hm_block * HM blocks
+#            + key_load * (new key loaded)
+#
+# with blocks = ceil(bytes / block size) and a fixed overhead per operation (enc, dec, dec_fail, hash).
+# Models of all designs of a project are stored in `cycle_models.json` next to its xedaproject.toml,
+# keyed by design variant (`perf_db.design_key`: design name and parameters).
+
+PathLike = Union[str, os.PathLike]
+
+CYCLE_MODEL_ENV = "COCOLIGHT_CYCLE_MODEL"  # path of the project's cycle_models.json
+CYCLE_MODEL_TOLERANCE_ENV = "COCOLIGHT_CYCLE_MODEL_TOLERANCE"
+CYCLE_MODEL_UPDATE_ENV = "COCOLIGHT_CYCLE_MODEL_UPDATE"  # "1": replace a stored model even if measurements deviate
+MODELS_FILE = "cycle_models.json"
+
+TERMS = ("ad_block", "xt_block", "hm_block", "key_load")
+
+
+class OpSample(NamedTuple):
+    op: str
+    ad_size: int
+    xt_size: int
+    hm_size: int
+    new_key: bool
+    cycles: int
+
+    def __str__(self) -> str:
+        if self.op == "hash":
+            return f"hash hm={self.hm_size}"
+        return f"{self.op} ad={self.ad_size} xt={self.xt_size}" + ("" if self.new_key else " (reused key)")
+
+
+class Deviation(NamedTuple):
+    sample: OpSample
+    predicted: float
+    allowed: float
+
+    def __str__(self) -> str:
+        diff = self.sample.cycles - self.predicted
+        return (
+            f"{self.sample}: measured {self.sample.cycles} cycles, model {self.predicted:.1f}"
+            f" ({diff:+.1f}, allowed ±{self.allowed:.1f})"
+        )
+
+
+def _blocks(size: Optional[int], block_bytes: int) -> int:
+    return -(-(size or 0) // block_bytes) if block_bytes else 0
+
+
+def _solve_least_squares(rows: List[List[float]], y: List[float]) -> List[Optional[float]]:
+    """Least-squares solution of rows * x = y, using the normal equations.
+    Coefficients of columns that are not determined by the data (all zero or linearly dependent on
+    earlier columns) are None."""
+    n = len(rows[0])
+    ata = [[sum(r[i] * r[j] for r in rows) for j in range(n)] for i in range(n)]
+    aty = [sum(r[i] * v for r, v in zip(rows, y)) for i in range(n)]
+    m = [row[:] + [b] for row, b in zip(ata, aty)]
+    undetermined = set()
+    # Gauss-Jordan elimination on the symmetric positive semi-definite system, in column order
+    for c in range(n):
+        pivot = m[c][c]
+        if pivot <= 1e-9 * max(ata[c][c], 1.0):
+            undetermined.add(c)
+            continue
+        for r in range(n):
+            if r != c and m[r][c]:
+                f = m[r][c] / pivot
+                m[r] = [a - f * b for a, b in zip(m[r], m[c])]
+    return [None if c in undetermined else m[c][n] / m[c][c] for c in range(n)]
+
+
+class CycleModel:
+    def __init__(
+        self,
+        block_bytes: Dict[str, int],
+        overhead: Dict[str, float],
+        coefficients: Dict[str, Optional[float]],
+        max_error: float = 0.0,
+        samples: int = 0,
+        **info,
+    ) -> None:
+        self.block_bytes = block_bytes  # "AD", "XT" and "HM" block sizes in bytes
+        self.overhead = overhead  # op -> fixed cycles
+        self.coefficients = coefficients  # term -> cycles, None: not determined by the samples
+        self.max_error = max_error  # largest absolute residual of the fit
+        self.samples = samples
+        self.info = info  # e.g. revision and time of the calibration
+
+    def _features(self, op: str, ad_size=0, xt_size=0, hm_size=0, new_key=True) -> Dict[str, int]:
+        bb = self.block_bytes
+        if op == "hash":
+            return dict(hm_block=_blocks(hm_size, bb.get("HM", 0)))
+        return dict(
+            ad_block=_blocks(ad_size, bb.get("AD", 0)),
+            xt_block=_blocks(xt_size, bb.get("XT", 0)),
+            key_load=int(bool(new_key)),
+        )
+
+    @classmethod
+    def fit(cls, samples: Iterable[OpSample], block_bytes: Dict[str, int], **info) -> "CycleModel":
+        samples = list(samples)
+        if not samples:
+            raise ValueError("no samples to fit")
+        ops = sorted({s.op for s in samples})
+        model = cls(block_bytes, {}, {}, samples=len(samples), **info)
+        columns = ops + list(TERMS)
+        rows = []
+        for s in samples:
+            features = model._features(s.op, s.ad_size, s.xt_size, s.hm_size, s.new_key)
+            rows.append([float(s.op == c) for c in ops] + [float(features.get(t, 0)) for t in TERMS])
+        solution = dict(zip(columns, _solve_least_squares(rows, [float(s.cycles) for s in samples])))
+        model.overhead = {op: solution[op] or 0.0 for op in ops}
+        model.coefficients = {t: solution[t] for t in TERMS}
+        model.max_error = max(abs(s.cycles - model.predict_sample(s)) for s in samples)
+        return model
+
+    def predict(self, op: str, ad_size=0, xt_size=0, hm_size=0, new_key=True) -> float:
+        """cycles of an operation. Raises KeyError for operations the model was not calibrated for."""
+        if op not in self.overhead:
+            raise KeyError(f"no {op} samples in the calibration of this model")
+        cycles = self.overhead[op]
+        for term, n in self._features(op, ad_size, xt_size, hm_size, new_key).items():
+            cycles += (self.coefficients.get(term) or 0.0) * n
+        return cycles
+
+    def predict_sample(self, s: OpSample) -> float:
+        return self.predict(s.op, s.ad_size, s.xt_size, s.hm_size, s.new_key)
+
+    def predict_vector(self, v: Vector) -> float:
+        return self.predict(v.op, v.ad_size, v.xt_size, v.hm_size, v.new_key is not False)
+
+    def deviations(self, samples: Iterable[OpSample], tolerance: float = 0.05) -> List[Deviation]:
+        """Samples whose cycles differ from the prediction by more than the fit's own error plus
+        `tolerance` (relative) of the prediction. Operations unknown to the model are skipped."""
+        deviations = []
+        for s in samples:
+            if s.op not in self.overhead:
+                continue
+            predicted = self.predict_sample(s)
+            allowed = self.max_error + tolerance * abs(predicted)
+            if abs(s.cycles - predicted) > allowed:
+                deviations.append(Deviation(s, predicted, allowed))
+        return deviations
+
+    def as_dict(self) -> dict:
+        return dict(
+            block_bytes=self.block_bytes,
+            overhead=self.overhead,
+            coefficients=self.coefficients,
+            max_error=self.max_error,
+            samples=self.samples,
+            **self.info,
+        )
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "CycleModel":
+        return cls(**d)
+
+    def __str__(self) -> str:
+        overhead = " ".join(f"{op}={c:.1f}" for op, c in self.overhead.items())
+        terms = " ".join(f"{t}={c:.2f}" for t, c in self.coefficients.items() if c is not None)
+        return f"overhead {overhead}; {terms}  (max error {self.max_error:.1f}, {self.samples} samples)"
+
+
+def load_models(path: PathLike) -> Dict[str, CycleModel]:
+    if not Path(path).exists():
+        return {}
+    with open(path) as f:
+        return {design: CycleModel.from_dict(d) for design, d in json.load(f).items()}
+
+
+def load_model(path: PathLike, design: str) -> Optional[CycleModel]:
+    return load_models(path).get(design)
+
+
+def save_model(path: PathLike, design: str, model: CycleModel):
+    """store `model` of `design`, keeping the models of other designs in `path`"""
+    path = Path(path)
+    models = {}
+    if path.exists():
+        with open(path) as f:
+            models = json.load(f)
+    models[design] = dict(model.as_dict(), time=int(time.time()))
+    # unique temporary file: simulations running in parallel may save models to the same file
+    fd, tmp = tempfile.mkstemp(prefix=path.name + ".", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(models, f, indent=1)
+            f.write("\n")
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="predict LWC operation cycles from a calibrated cycle model")
+    parser.add_argument("design", help="design variant, e.g. Ascon or Ascon[ASCON128A=1,UNROLL_FACTOR=2]")
+    parser.add_argument("--models", default=MODELS_FILE, help="cycle models file (next to xedaproject.toml)")
+    parser.add_argument("--op", choices=("enc", "dec", "dec_fail", "hash"))
+    parser.add_argument("--ad", type=int, default=0, help="AD bytes")
+    parser.add_argument("--xt", type=int, default=0, help="PT/CT bytes")
+    parser.add_argument("--hm", type=int, default=0, help="hash message bytes")
+    parser.add_argument("--reuse-key", action="store_true")
+    parser.add_argument("--workload", metavar="CSV", help="estimate the throughput of a workload histogram")
+    parser.add_argument("--workload-ops", type=int, default=100000)
+    parser.add_argument("--clock-mhz", type=float, default=100.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    model = load_model(args.models, args.design)
+    if model is None:
+        sys.exit(f"no cycle model of {args.design} in {args.models}, run the design's measure_timings first")
+    print(f"{args.design}: {model}")
+    if args.op:
+        cycles = model.predict(args.op, args.ad, args.xt, args.hm, new_key=not args.reuse_key)
+        print(f"{args.op} ad={args.ad} xt={args.xt} hm={args.hm}: {cycles:.1f} cycles")
+    if args.workload:
+        vectors = sample_workload(load_histogram(args.workload), args.workload_ops, random.Random(args.seed))
+        cycles = int(round(sum(model.predict_vector(v) for v in vectors)))
+        print(format_report(workload_report(vectors, cycles, args.clock_mhz)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
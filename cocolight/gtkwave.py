@@ -0,0 +1,337 @@
+import hashlib
+import inspect
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+# GTKWave translations of Bluespec types, generated from the type definitions in Bluespec sources:
+#  - enums: translate filter files (<Package>::<Type>.gwtr)
+#  - structs and tagged unions: translate filter processes (<Package>::<Type>.py)
+# Parsed sources and generated filters are cached, so only translations of changed types are rewritten.
+
+PathLike = Union[str, os.PathLike]
+
+CACHE_FILE = ".translations.json"
+CACHE_VERSION = 2
+
+_comment_re = re.compile(r"//[^\n]*|/\*.*?\*/", re.DOTALL)
+_package_re = re.compile(r"\bpackage\s+(\w+)\s*;")
+_typedef_enum_re = re.compile(r"\btypedef\s+enum\s*{([^}]*)}\s*(\w+)")
+_typedef_struct_re = re.compile(
+    r"\btypedef\s+struct\s*{([^{}]*)}\s*(\w+)\s*(#\s*\([^)]*\))?\s*(?:deriving\s*\(([^)]*)\))?"
+)
+_typedef_union_re = re.compile(
+    r"\btypedef\s+union\s+tagged\s*{([^{}]*)}\s*(\w+)\s*(#\s*\([^)]*\))?\s*(?:deriving\s*\(([^)]*)\))?"
+)
+_typedef_numeric_re = re.compile(r"\btypedef\s+(\d+)\s+(\w+)\s*;")
+_typedef_alias_re = re.compile(r"\btypedef\s+((?:\w+::)?\w+(?:\s*#\s*\([^;]*\))?)\s+(\w+)\s*;")
+_member_re = re.compile(r"^(.*\S)\s+(\w+)$", re.DOTALL)
+_based_literal_re = re.compile(r"(\d*)\s*'\s*([bdhoBDHO])\s*([0-9a-fA-F_]+)")
+_bits_type_re = re.compile(r"^(Bit|UInt|Int)\s*#\s*\(\s*(\w+)\s*\)$")
+_maybe_type_re = re.compile(r"^Maybe\s*#\s*\((.*)\)$")
+_vector_type_re = re.compile(r"^Vector\s*#\s*\(\s*(\w+)\s*,(.*)\)$")
+
+COLORS = [
+    "dark blue",
+    "deep sky blue",
+    "yellow green",
+    "orange",
+    "firebrick",
+    "blue violet",
+    "brown",
+    "dark green",
+    "dark magenta",
+    "dark orange",
+    "medium sea green",
+    "royal blue",
+    "tomato",
+    "dark cyan",
+    "olive drab",
+    "hot pink",
+]
+
+
+def _literal_value(v: str):
+    """value and size (None if unsized) of a Bluespec integer literal: decimal (`010` is ten), or based with an
+    optional size (`'h3`, `4'b0011`). Raises ValueError if `v` is not an integer literal."""
+    v = v.strip()
+    m = _based_literal_re.fullmatch(v)
+    if m:
+        base = dict(b=2, d=10, h=16, o=8)[m.group(2).lower()]
+        return int(m.group(3).replace("_", ""), base), int(m.group(1)) if m.group(1) else None
+    return int(v.replace("_", ""), 10), None
+
+
+def _members(body: str) -> List[List[str]]:
+    """[type, name] of `Type name;` members of a struct or union body"""
+    members = []
+    for decl in body.split(";"):
+        decl = decl.strip()
+        m = _member_re.match(decl)
+        if m:
+            members.append([" ".join(m.group(1).split()), m.group(2)])
+    return members
+
+
+def parse_bsv_types(content: str) -> dict:
+    """package name and (JSON-serializable) definitions of the types declared in Bluespec source `content`"""
+    content = _comment_re.sub("", content)
+    m = _package_re.search(content)
+    types = {}
+    for td in _typedef_enum_re.finditer(content):
+        values = []
+        width = 0
+        next_value = 0
+        for item in td.group(1).split(","):
+            sym, _, val = item.partition("=")
+            sym = sym.strip()
+            if not sym:
+                continue
+            try:
+                value, size = _literal_value(val) if val.strip() else (next_value, None)
+            except ValueError:
+                print(f"Skipping GTKWave translation of {td.group(2)}: can't parse value {val.strip()} of {sym}")
+                values = []
+                break
+            width = max(width, size or 0, value.bit_length())
+            values.append([sym, value])
+            next_value = value + 1
+        if values:
+            types[td.group(2)] = dict(kind="enum", values=values, width=max(width, 1))
+    for kind, regex in (("struct", _typedef_struct_re), ("union", _typedef_union_re)):
+        for td in regex.finditer(content):
+            if td.group(3):  # polymorphic types (e.g. `WithLast#(type w__)`) are not translated
+                continue
+            if "Bits" not in re.findall(r"\w+", td.group(4) or ""):  # unknown layout (custom Bits instance)
+                continue
+            types[td.group(2)] = dict(kind=kind, members=_members(td.group(1)))
+    for td in _typedef_numeric_re.finditer(content):
+        types.setdefault(td.group(2), dict(kind="numeric", value=int(td.group(1))))
+    for td in _typedef_alias_re.finditer(content):
+        types.setdefault(td.group(2), dict(kind="alias", type=" ".join(td.group(1).split())))
+    return dict(package=m.group(1) if m else None, types=types)
+
+
+class TypeResolver:
+    """Bit layouts of Bluespec types, from the parsed definitions of all packages"""
+
+    def __init__(self, packages: Iterable[dict]) -> None:
+        self.types: Dict[str, dict] = {}
+        for pkg in packages:
+            for name, td in pkg["types"].items():
+                self.types.setdefault(name, td)
+                if pkg["package"]:
+                    self.types[f"{pkg['package']}::{name}"] = td
+
+    def numeric(self, n: str) -> Optional[int]:
+        if n.isdigit():
+            return int(n)
+        td = self.types.get(n)
+        return td["value"] if td and td["kind"] == "numeric" else None
+
+    def layout(self, typ: str, _depth=0) -> Optional[dict]:
+        """bit layout of type `typ`, or None if its width can't be determined"""
+        if _depth > 32:
+            return None
+        typ = typ.strip()
+        if typ == "Bool":
+            return dict(kind="bool", width=1)
+        m = _bits_type_re.match(typ)
+        if m:
+            width = self.numeric(m.group(2))
+            return dict(kind="bits", width=width) if width else None
+        m = _maybe_type_re.match(typ)
+        if m:
+            inner = self.layout(m.group(1), _depth + 1)
+            if inner is None:
+                return None
+            members = [["Invalid", None], ["Valid", inner]]
+            return dict(kind="union", width=1 + inner["width"], tag_width=1, members=members)
+        m = _vector_type_re.match(typ)
+        if m:
+            n = self.numeric(m.group(1))
+            inner = self.layout(m.group(2), _depth + 1)
+            if not n or inner is None:
+                return None
+            fields = [[f"[{i}]", inner] for i in reversed(range(n))]  # element 0 is at the LSB
+            return dict(kind="struct", width=n * inner["width"], fields=fields)
+        td = self.types.get(typ)
+        if td is None:
+            return None
+        if td["kind"] == "alias":
+            return self.layout(td["type"], _depth + 1)
+        if td["kind"] == "enum":
+            values = {str(v): s for s, v in td["values"]}
+            return dict(kind="enum", width=td["width"], values=values)
+        if td["kind"] == "struct":
+            fields = []
+            for ftype, fname in td["members"]:
+                flayout = self.layout(ftype, _depth + 1)
+                if flayout is None:
+                    return None
+                fields.append([fname, flayout])
+            return dict(kind="struct", width=sum(f["width"] for _, f in fields), fields=fields)
+        if td["kind"] == "union":
+            members = []
+            for mtype, mname in td["members"]:
+                mlayout = None if mtype == "void" else self.layout(mtype, _depth + 1)
+                if mtype != "void" and mlayout is None:
+                    return None
+                members.append([mname, mlayout])
+            tag_width = (len(members) - 1).bit_length()
+            width = tag_width + max((ml["width"] for _, ml in members if ml), default=0)
+            return dict(kind="union", width=width, tag_width=tag_width, members=members)
+        return None
+
+
+def decode_value(layout: dict, value: int) -> str:
+    """text representation of `value` (unsigned integer) of a type with bit layout `layout`"""
+    kind = layout["kind"]
+    if kind == "bool":
+        return "True" if value else "False"
+    if kind == "enum":
+        return layout["values"].get(str(value), f"?{value}")
+    if kind == "struct":
+        parts = []
+        shift = layout["width"]
+        for name, field in layout["fields"]:  # first field is at the MSB
+            shift -= field["width"]
+            parts.append(f"{name}: {decode_value(field, (value >> shift) & ((1 << field['width']) - 1))}")
+        return "{" + ", ".join(parts) + "}"
+    if kind == "union":
+        data_width = layout["width"] - layout["tag_width"]
+        tag = value >> data_width
+        if tag >= len(layout["members"]):
+            return f"?tag {tag}"
+        name, member = layout["members"][tag]
+        if member is None:
+            return name
+        return f"{name} {decode_value(member, value & ((1 << member['width']) - 1))}"
+    return f"'h{value:x}"
+
+
+_PROCESS_FILTER = '''#!/usr/bin/env python3
+# GTKWave translate filter process for {type_name}, generated from the Bluespec sources
+import sys
+
+LAYOUT = {layout}
+
+
+{decode_source}
+
+def main():
+    for line in sys.stdin:
+        line = line.strip()
+        try:
+            if len(line) == LAYOUT["width"] and set(line) <= set("01"):
+                value = int(line, 2)
+            else:
+                value = int(line, 16)
+            line = decode_value(LAYOUT, value)
+        except ValueError:  # x/z
+            pass
+        sys.stdout.write(line + "\\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
+'''
+
+
+def render_translation(type_name: str, layout: dict) -> str:
+    """contents of the translation filter (file or process) of a type"""
+    if layout["kind"] == "enum":
+        import vcd.gtkw
+
+        width = layout["width"]
+        datafmt = "hex" if width >= 4 else "bin"
+        translations = [(int(v), s) for v, s in layout["values"].items()]  # in declaration order
+        if len(translations) <= len(COLORS):
+            translations = [(v, f"?{COLORS[i]}?{s}") for i, (v, s) in enumerate(translations)]
+        return vcd.gtkw.make_translation_filter(translations, datafmt=datafmt, size=width)
+    return _PROCESS_FILTER.format(
+        type_name=type_name,
+        layout=json.dumps(layout, indent=1),
+        decode_source=inspect.getsource(decode_value),
+    )
+
+
+def _file_digest(path: Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def generate_translations(bluespec_sources: Iterable[PathLike], out_dir: PathLike) -> List[Path]:
+    """(Re)generate translation filters of all enum, struct and tagged union types in `bluespec_sources`.
+    Sources with unchanged mtime or content are not parsed again, and only filters whose content
+    changed are written. Returns the written files."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    cache_path = out_dir / CACHE_FILE
+    cache = dict(version=CACHE_VERSION, sources={}, outputs={})
+    if cache_path.exists():
+        try:
+            with open(cache_path) as f:
+                cached = json.load(f)
+            if cached.get("version") == CACHE_VERSION:
+                cache = cached
+        except (OSError, json.JSONDecodeError):
+            pass
+
+    sources = {}
+    for src in bluespec_sources:
+        src = Path(src)
+        key = str(src.resolve())
+        st = src.stat()
+        entry = cache["sources"].get(key)
+        if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            sources[key] = entry
+            continue
+        digest = _file_digest(src)
+        if not entry or entry["digest"] != digest:
+            with open(src) as f:
+                entry = dict(parse_bsv_types(f.read()), digest=digest)
+        sources[key] = dict(entry, mtime_ns=st.st_mtime_ns, size=st.st_size)
+    cache["sources"] = sources
+
+    resolver = TypeResolver(sources.values())
+    outputs = {}
+    written = []
+    for entry in sources.values():
+        pkg = entry["package"]
+        for name, td in entry["types"].items():
+            if td["kind"] not in ("enum", "struct", "union"):
+                continue
+            type_name = f"{pkg}::{name}" if pkg else name
+            layout = resolver.layout(type_name)
+            if layout is None:
+                print(f"Skipping GTKWave translation of {type_name}: unknown bit width")
+                continue
+            suffix = ".gwtr" if td["kind"] == "enum" else ".py"
+            out_file = out_dir / (type_name + suffix)
+            content = render_translation(type_name, layout)
+            digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+            outputs[out_file.name] = digest
+            if cache["outputs"].get(out_file.name) == digest and out_file.exists():
+                continue
+            print(f"writing translation of {type_name} into {out_file}")
+            with open(out_file, "w") as f:
+                f.write(content)
+            if suffix == ".py":
+                out_file.chmod(0o755)
+            written.append(out_file)
+    # remove filters of types that no longer exist
+    for stale in set(cache["outputs"]) - set(outputs):
+        stale_file = out_dir / stale
+        if stale_file.exists():
+            stale_file.unlink()
+    cache["outputs"] = outputs
+
+    tmp = cache_path.with_suffix(cache_path.suffix + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(cache, f, indent=1)
+    os.replace(tmp, cache_path)
+    return written
@@ -46,7 +46,7 @@ class SegmentHeader():
     @classmethod
     def from_word32(cls, w: int) -> 'SegmentHeader':
         sn = (w >> 24) & 0xf
-        return SegmentHeader(SegmentType.from_byte((w >> 28) & 0xf), len=(w >> 16) & 0xffff, last=sn & 1, eot=(sn >> 1) & 1, eoi=(sn >> 2) & 1, partial=(sn >> 3) & 1)
+        return SegmentHeader(SegmentType.from_byte((w >> 28) & 0xf), len=w & 0xffff, last=sn & 1, eot=(sn >> 1) & 1, eoi=(sn >> 2) & 1, partial=(sn >> 3) & 1)
 
     # FIXME IO_WIDTH != 32
     # ...  def from_words to_words
@@ -0,0 +1,152 @@
+import json
+import os
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+# Journal of the test vectors issued by `LwcRefCheckerTb`, for replaying and minimizing failures.
+#
+# Every vector is recorded with everything needed to reproduce it (operation, sizes and the seeds of its
+# payload and stall schedules), followed by one line per test listing the ids of failed and unfinished
+# vectors. Lines are JSON objects:
+#   {"test": "test_enc_dec", "plan": {"seed": 123, "test": "test_enc_dec"}}  (the test's `RngStreams`)
+#   {"test": "test_enc_dec", "id": 12, "op": "dec", "ad_size": 3, "xt_size": 17, "seed": ..., ...}
+#   {"test": "test_enc_dec", "failed": [12], "incomplete": [13, 14]}
+#
+# A replay file uses the same vector lines; a testbench run with COCOLIGHT_REPLAY set issues only the
+# vectors of its test from that file, in place of the vectors of the test itself.
+
+PathLike = Union[str, os.PathLike]
+
+JOURNAL_ENV = "COCOLIGHT_JOURNAL"
+REPLAY_ENV = "COCOLIGHT_REPLAY"
+
+
+class Vector(NamedTuple):
+    op: str  # "enc", "dec", "dec_fail" (forged decryption) or "hash"
+    ad_size: Optional[int] = None
+    xt_size: Optional[int] = None
+    hm_size: Optional[int] = None
+    seed: Optional[int] = None  # payload (key, nonce, AD, PT/HM)
+    in_seed: Optional[int] = None  # input stalls
+    out_seed: Optional[int] = None  # output stalls
+    new_key: Optional[bool] = None  # enc/dec: load the key (ACTKEY + LDKEY) before the operation
+    key_seed: Optional[int] = None  # enc/dec: key
+    corrupt: Optional[str] = None  # dec_fail: forged "tag" or "ct"
+    corrupt_bit: Optional[int] = None  # dec_fail: inverted bit of the tag or ciphertext, from the MSB of byte 0
+
+    def as_dict(self) -> dict:
+        return {k: v for k, v in self._asdict().items() if v is not None}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Vector":
+        return cls(**{k: d[k] for k in cls._fields if k in d})
+
+    def __str__(self) -> str:
+        if self.op == "hash":
+            return f"hash hm={self.hm_size}"
+        key = " (reused key)" if self.new_key is False else ""
+        if self.op == "dec_fail" and self.corrupt is not None:
+            key += f" ({self.corrupt} bit {self.corrupt_bit} inverted)"
+        return f"{self.op} ad={self.ad_size} xt={self.xt_size}{key}"
+
+
+class JournalEntry(NamedTuple):
+    test: str
+    id: int
+    vector: Vector
+    status: str  # "passed", "failed", "incomplete" or "unknown" (test did not finish)
+
+
+class VectorJournal:
+    def __init__(self, path: PathLike, test: str) -> None:
+        self.path = path
+        self.test = test
+        self._file = open(path, "a")
+
+    @classmethod
+    def from_env(cls, test: str) -> Optional["VectorJournal"]:
+        path = os.environ.get(JOURNAL_ENV)
+        return cls(path, test) if path else None
+
+    def _write(self, entry: dict):
+        self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self._file.flush()  # keep the record if the simulation crashes
+
+    def plan(self, streams: dict):
+        self._write(dict(test=self.test, plan=streams))
+
+    def issued(self, msg_id: int, vector: Vector):
+        self._write(dict(test=self.test, id=msg_id, **vector.as_dict()))
+
+    def finished(self, failed: Iterable[int], incomplete: Iterable[int]):
+        self._write(dict(test=self.test, failed=sorted(set(failed)), incomplete=sorted(set(incomplete))))
+
+    def close(self):
+        self._file.close()
+
+
+def load_journal(path: PathLike) -> List[JournalEntry]:
+    vectors: Dict[Tuple[str, int], Vector] = {}
+    status: Dict[Tuple[str, int], str] = {}
+    with open(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            test = entry["test"]
+            if "id" in entry:
+                key = (test, entry["id"])
+                vectors[key] = Vector.from_dict(entry)
+                status[key] = "unknown"
+                continue
+            if "plan" in entry:
+                continue
+            for key, s in status.items():
+                if key[0] == test and s == "unknown":
+                    status[key] = "passed"
+            for s in ("failed", "incomplete"):
+                for msg_id in entry.get(s, []):
+                    status[(test, msg_id)] = s
+    return [JournalEntry(test, msg_id, v, status[(test, msg_id)]) for (test, msg_id), v in vectors.items()]
+
+
+def failing_entries(entries: Iterable[JournalEntry]) -> List[JournalEntry]:
+    """Failed vectors, or if there are none, vectors that were not completed (e.g. after a hang),
+    or vectors of tests that did not finish (e.g. the simulator crashed)"""
+    entries = list(entries)
+    for status in ("failed", "incomplete", "unknown"):
+        selected = [e for e in entries if e.status == status]
+        if selected:
+            return selected
+    return []
+
+
+def write_replay(path: PathLike, test: str, vectors: Iterable[Vector]):
+    with open(path, "w") as f:
+        for v in vectors:
+            f.write(json.dumps(dict(test=test, **v.as_dict())) + "\n")
+
+
+def load_replay(path: PathLike, test: str) -> List[Vector]:
+    with open(path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return [Vector.from_dict(e) for e in entries if e.get("test", test) == test and "op" in e]
+
+
+def shrink_candidates(n: int) -> List[int]:
+    """smaller sizes to try in place of size `n` of a failing vector, smallest first"""
+    return sorted({0, n // 4, n // 2, n - 1} - {n}) if n > 0 else []
+
+
+def shrink_vector(vector: Vector, fails: Callable[[Vector], bool]) -> Vector:
+    """`vector` with its sizes reduced as long as `fails` (e.g. a simulation of the vector) still holds.
+    Sizes are shrunk one at a time, each to the smallest of its `shrink_candidates` that fails, until none does."""
+    fields = ["hm_size"] if vector.op == "hash" else ["ad_size", "xt_size"]
+    improved = True
+    while improved:
+        improved = False
+        for field in fields:
+            for n in shrink_candidates(getattr(vector, field) or 0):
+                candidate = vector._replace(**{field: n})
+                if fails(candidate):
+                    vector = candidate
+                    improved = True
+                    break
+    return vector
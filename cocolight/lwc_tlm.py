@@ -0,0 +1,354 @@
+import argparse
+import importlib
+import sys
+from enum import Enum, auto
+from typing import Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from .cycle_model import CycleModel, load_model
+from .hw_api import API_BYTEORDER, OpCode, SegmentHeader, SegmentType, Status
+from .lwc_api import LwcAead, LwcHash
+from .utils import bytes_to_words
+
+# Transaction-level model of bluelight's `mkLwc` (bluelight/LwcApi.bsv).
+#
+# Consumes the pdi/sdi word streams of the LWC hardware API and produces the exact `do` word stream of the
+# hardware, with a reference `LwcAead`/`LwcHash` implementation in place of the crypto core. The PDI and SDI
+# state machines follow the ones of LwcApi.bsv word by word. The crypto core is called once per operation,
+# when all of its inputs have been received, and the do message of the operation is then assembled at once
+# from the output headers queued by the PDI state machine (headersFifo), the core's output and the status.
+#
+# As in LwcApi.bsv, the plaintext of a decryption is sent out before the tag is verified. When verification
+# fails, the reference implementation does not return the plaintext, and its words are None (unknown).
+#
+# Only 32-bit pdi/sdi/do buses are supported, same as LwcApi.bsv.
+
+WIDTH = 32
+WORD_BYTES = WIDTH // 8
+
+
+class PdiState(Enum):
+    Pdi_GetInstruction = auto()
+    Pdi_Header = auto()
+    Pdi_Data = auto()
+    Pdi_GetTagHeader = auto()
+    Pdi_GetTagData = auto()
+
+
+class SdiState(Enum):
+    SdiIdle = auto()
+    SdiInstruction = auto()
+    SdiHeader = auto()
+    SdiData = auto()
+
+
+class TlmOp(NamedTuple):
+    """an ENC, DEC or HASH operation processed by the model"""
+
+    op: str  # "enc", "dec", "dec_fail" (tag verification failed) or "hash"
+    new_key: bool
+    ad_size: int
+    xt_size: int
+    hm_size: int
+    in_words: int  # pdi and sdi words, including preceding ACTKEY/LDKEY
+    out_words: int
+    cycles: Optional[float]  # estimated by the timing model
+
+    @property
+    def status(self) -> Status:
+        return Status.Failure if self.op == "dec_fail" else Status.Success
+
+
+# do message: (line type, words) with line types "HDR", "DAT" and "STT" as in do.txt
+DoMessage = List[Tuple[str, List[Optional[int]]]]
+
+
+class CoreTiming:
+    """Pluggable timing model of the crypto core.
+    The default takes one cycle per pdi/sdi and do word, without any overlap."""
+
+    def cycles(self, op: TlmOp) -> float:
+        return op.in_words + op.out_words
+
+
+class CycleModelTiming(CoreTiming):
+    """latencies predicted by a calibrated `CycleModel` of the design"""
+
+    def __init__(self, model: CycleModel) -> None:
+        self.model = model
+
+    def cycles(self, op: TlmOp) -> float:
+        name = op.op if op.op in self.model.overhead else op.op.replace("_fail", "")
+        return self.model.predict(name, op.ad_size, op.xt_size, op.hm_size, op.new_key)
+
+
+def _is_ptct(typ: SegmentType) -> bool:
+    return int(typ) >> 1 == 0b010
+
+
+def _to_bytes(words: List[int], length: int) -> bytes:
+    return b"".join(w.to_bytes(WORD_BYTES, API_BYTEORDER) for w in words)[:length]
+
+
+class LwcTlm:
+    def __init__(self, core: Union[LwcAead, LwcHash], timing: Optional[CoreTiming] = None) -> None:
+        self.core = core
+        self.timing = timing
+        self.crypto_key_bytes = getattr(core, "CRYPTO_KEYBYTES", None)
+        self.crypto_abytes = getattr(core, "CRYPTO_ABYTES", None)
+        self.crypto_hash_bytes = getattr(core, "CRYPTO_HASH_BYTES", None)
+        self.pdi_state = PdiState.Pdi_GetInstruction
+        self.sdi_state = SdiState.SdiIdle
+        self.new_key = False
+        self.key: Optional[bytes] = None
+        self.ops: List[TlmOp] = []
+        self.cycles = 0.0
+        self._sdi: List[int] = []
+        self._start_op()
+
+    def _start_op(self):
+        self.op: Optional[OpCode] = None
+        self.op_new_key = False
+        self.in_words = 0
+        self.headers: List[SegmentHeader] = []  # output headers (headersFifo)
+        self.inputs = {t: b"" for t in SegmentType}  # received segment data, by type
+        self.tag_words: List[int] = []
+        self.seg_header: Optional[SegmentHeader] = None
+        self.seg_words: List[int] = []
+        self.remaining = 0
+
+    # ------------------------------------------------ SDI ------------------------------------------------
+    def put_sdi(self, word: int):
+        self._sdi.append(word)
+
+    def _load_key(self):
+        """sdi rules of LwcApi.bsv, which only fire while an operation is in progress"""
+        words = []
+        while self.sdi_state != SdiState.SdiIdle:
+            if not self._sdi:
+                raise ValueError("ACTKEY without a key (LDKEY) on sdi")
+            w = self._sdi.pop(0)
+            self.in_words += 1
+            if self.sdi_state == SdiState.SdiInstruction:
+                self.sdi_state = SdiState.SdiHeader
+            elif self.sdi_state == SdiState.SdiHeader:
+                self.sdi_state = SdiState.SdiData
+            else:
+                words.append(w)
+                if len(words) == self.crypto_key_bytes // WORD_BYTES:
+                    self.sdi_state = SdiState.SdiIdle
+        self.key = _to_bytes(words, self.crypto_key_bytes)
+
+    # ------------------------------------------------ PDI ------------------------------------------------
+    def put_pdi(self, word: int) -> List[DoMessage]:
+        """Process a pdi word. Returns the do messages of operations completed by this word."""
+        self.in_words += 1
+        state = self.pdi_state
+        if state == PdiState.Pdi_GetInstruction:
+            op = OpCode(word >> (WIDTH - 4))
+            if op == OpCode.ACTKEY:
+                self.sdi_state = SdiState.SdiInstruction
+                self.new_key = True
+                return []
+            self.op, self.op_new_key, self.new_key = op, self.new_key, False
+            if self.sdi_state != SdiState.SdiIdle:
+                self._load_key()
+            self.pdi_state = PdiState.Pdi_Header
+        elif state == PdiState.Pdi_Header:
+            hdr = SegmentHeader.from_word32(word)
+            self.seg_header = hdr
+            self.remaining = -(-hdr.len // WORD_BYTES)
+            if _is_ptct(hdr.type):
+                decrypt = self.op == OpCode.DEC
+                out_type = SegmentType.PT if decrypt else SegmentType.CT
+                self.headers.append(SegmentHeader(out_type, hdr.len, last=int(decrypt), eot=hdr.eot, eoi=0))
+            elif hdr.eot and hdr.type == SegmentType.HM:
+                digest_len = self.crypto_hash_bytes
+                self.headers.append(SegmentHeader(SegmentType.DIGEST, digest_len, last=1, eot=1, eoi=0))
+            if self.remaining == 0:  # Pdi_SendEmpty
+                return self._end_of_segment()
+            self.pdi_state = PdiState.Pdi_Data
+        elif state == PdiState.Pdi_Data:
+            self.seg_words.append(word)
+            self.remaining -= 1
+            if self.remaining == 0:
+                return self._end_of_segment()
+        elif state == PdiState.Pdi_GetTagHeader:
+            self.remaining = -(-SegmentHeader.from_word32(word).len // WORD_BYTES)
+            self.pdi_state = PdiState.Pdi_GetTagData
+        elif state == PdiState.Pdi_GetTagData:
+            self.tag_words.append(word)
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.pdi_state = PdiState.Pdi_GetInstruction
+                return [self._complete()]
+        return []
+
+    def _end_of_segment(self) -> List[DoMessage]:
+        hdr = self.seg_header
+        self.inputs[hdr.type] += _to_bytes(self.seg_words, hdr.len)
+        self.seg_words = []
+        if not hdr.eot:
+            self.pdi_state = PdiState.Pdi_Header
+        elif hdr.type == SegmentType.PT:  # Pdi_EnqTagHeader
+            self.headers.append(SegmentHeader(SegmentType.TAG, self.crypto_abytes, last=1, eot=1, eoi=0))
+            self.pdi_state = PdiState.Pdi_GetInstruction
+            return [self._complete()]
+        elif hdr.type == SegmentType.CT:  # verify tag
+            self.pdi_state = PdiState.Pdi_GetTagHeader
+        elif hdr.last:
+            self.pdi_state = PdiState.Pdi_GetInstruction
+            return [self._complete()]
+        else:
+            self.pdi_state = PdiState.Pdi_Header
+        return []
+
+    # ----------------------------------------------- Output -----------------------------------------------
+    def _core(self) -> Tuple[List[Optional[int]], bool]:
+        """words of all output segments, computed by the reference, and whether tag verification failed"""
+        inp = self.inputs
+        npub, ad = inp[SegmentType.NPUB], inp[SegmentType.AD]
+        if self.op == OpCode.HASH:
+            return bytes_to_words(self.core.hash(inp[SegmentType.HM]), WIDTH, API_BYTEORDER), False
+        if self.key is None:
+            raise ValueError(f"{self.op.name} before any key was loaded")
+        if self.op == OpCode.ENC:
+            ct, tag = self.core.encrypt(inp[SegmentType.PT], ad, npub, self.key)
+            return self._segment_words(ct) + bytes_to_words(tag, WIDTH, API_BYTEORDER), False
+        tag = _to_bytes(self.tag_words, self.crypto_abytes)
+        pt = self.core.decrypt(inp[SegmentType.CT], ad, npub, self.key, tag)
+        if pt is None:
+            return [None] * sum(-(-h.len // WORD_BYTES) for h in self.headers), True
+        return self._segment_words(pt), False
+
+    def _segment_words(self, data: bytes) -> List[int]:
+        """`data` split into the text segments of the output headers, each padded to whole words"""
+        words, offset = [], 0
+        for h in self.headers:
+            if h.type in (SegmentType.PT, SegmentType.CT):
+                words += bytes_to_words(data[offset : offset + h.len], WIDTH, API_BYTEORDER)
+                offset += h.len
+        return words
+
+    def _complete(self) -> DoMessage:
+        data, failure = self._core()
+        message: DoMessage = []
+        for i, h in enumerate(self.headers):
+            message.append(("HDR", [h.to_word32()]))
+            n = -(-h.len // WORD_BYTES)
+            if n:
+                message.append(("DAT", data[:n]))
+                data = data[n:]
+            if h.last and i != len(self.headers) - 1:
+                # LwcApi.bsv marks every plaintext segment as last, and sends the status after the first one
+                raise ValueError("decryption with multiple plaintext segments is not supported by LwcApi")
+        status = Status.Failure if failure else Status.Success
+        message.append(("STT", status.to_words(WIDTH)))
+
+        inp = self.inputs
+        op = TlmOp(
+            op={OpCode.ENC: "enc", OpCode.DEC: "dec_fail" if failure else "dec", OpCode.HASH: "hash"}[self.op],
+            new_key=self.op_new_key,
+            ad_size=len(inp[SegmentType.AD]),
+            xt_size=len(inp[SegmentType.PT]) + len(inp[SegmentType.CT]),
+            hm_size=len(inp[SegmentType.HM]),
+            in_words=self.in_words,
+            out_words=sum(len(words) for _, words in message),
+            cycles=None,
+        )
+        if self.timing is not None:
+            op = op._replace(cycles=self.timing.cycles(op))
+            self.cycles += op.cycles
+        self.ops.append(op)
+        self._start_op()
+        return message
+
+    def run(self, pdi: Iterable[int], sdi: Iterable[int] = ()) -> List[DoMessage]:
+        """do messages of all operations in the pdi/sdi word streams"""
+        for w in sdi:
+            self.put_sdi(w)
+        messages = []
+        for w in pdi:
+            messages += self.put_pdi(w)
+        if self.pdi_state != PdiState.Pdi_GetInstruction:
+            raise ValueError(f"pdi stream ended in {self.pdi_state.name}")
+        return messages
+
+
+def do_words(messages: Iterable[DoMessage]) -> List[Optional[int]]:
+    return [w for m in messages for _, words in m for w in words]
+
+
+def read_kat_words(path) -> List[int]:
+    """words of a pdi.txt/sdi.txt/do.txt test vector file (`INS = 70000000`, `DAT = ...` lines)"""
+    words = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            _, sep, value = line.partition("=")
+            if not sep:
+                continue
+            value = value.strip()
+            digits = WIDTH // 4
+            words += [int(value[i : i + digits], 16) for i in range(0, len(value), digits)]
+    return words
+
+
+def write_do_txt(path, messages: Iterable[DoMessage]):
+    """do.txt in the format of the LWC test vectors; unknown words are written as X"""
+    digits = WIDTH // 4
+    with open(path, "w") as f:
+        for m in messages:
+            f.write("\n")
+            for line_type, words in m:
+                value = "".join("X" * digits if w is None else f"{w:0{digits}X}" for w in words)
+                f.write(f"{line_type} = {value}\n")
+
+
+def _load_ref(spec: str):
+    """reference implementation given as `module:attribute` (an instance, or a class to instantiate)"""
+    module_name, _, attr = spec.partition(":")
+    ref = getattr(importlib.import_module(module_name), attr)
+    return ref() if isinstance(ref, type) else ref
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="expected do stream of LWC test vectors, without simulation")
+    parser.add_argument("pdi", help="pdi.txt")
+    parser.add_argument("sdi", help="sdi.txt")
+    parser.add_argument("--ref", required=True, help="reference implementation, module:attribute")
+    parser.add_argument("--output", "-o", help="write the expected do.txt")
+    parser.add_argument("--check", metavar="DO_TXT", help="compare against the words of an existing do.txt")
+    parser.add_argument("--cycle-model", metavar="JSON", help="estimate cycles using this cycle_models.json")
+    parser.add_argument("--design", help="design variant in --cycle-model, e.g. Ascon[UNROLL_FACTOR=2]")
+    args = parser.parse_args(argv)
+
+    timing = CoreTiming()
+    if args.cycle_model:
+        model = load_model(args.cycle_model, args.design) if args.design else None
+        if model is None:
+            parser.error(f"no cycle model of design {args.design} in {args.cycle_model}")
+        timing = CycleModelTiming(model)
+    tlm = LwcTlm(_load_ref(args.ref), timing)
+    messages = tlm.run(read_kat_words(args.pdi), read_kat_words(args.sdi))
+    failures = sum(op.status == Status.Failure for op in tlm.ops)
+    print(f"{len(tlm.ops)} operations ({failures} failed verification), estimated {tlm.cycles:.0f} cycles")
+    if args.output:
+        write_do_txt(args.output, messages)
+    if args.check:
+        expected = read_kat_words(args.check)
+        actual = do_words(messages)
+        for i, (a, e) in enumerate(zip(actual, expected)):
+            if a is not None and a != e:
+                print(f"do word {i}: model {a:08X}, {args.check} {e:08X}")
+                return 1
+        if len(actual) != len(expected):
+            print(f"model produced {len(actual)} do words, {args.check} has {len(expected)}")
+            return 1
+        print(f"all {len(expected)} do words match {args.check}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
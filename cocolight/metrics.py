@@ -0,0 +1,150 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Union
+
+# Per-test metrics of `ValidReadyTester`: simulated cycles, wall-clock time and the part of it spent in the
+# testbench's own Python code, by category:
+#   ref_model      calls of the reference implementation
+#   hw_api         encoding of instructions and segments into bus words
+#   driver:<bus>   driver coroutines, between their awaits (includes setting signal values through GPI)
+#   monitor:<bus>  monitor coroutines, between their awaits (includes reading signal values through GPI)
+# The remainder of the wall time ("other") is spent in the simulator (RTL evaluation), GPI callbacks and
+# cocotb's scheduler.
+#
+# With COCOLIGHT_METRICS set, snapshots are appended to that JSON-lines file whenever a tester joins its
+# monitors; `summarize_metrics` keeps the last snapshot of each tester.
+
+PathLike = Union[str, os.PathLike]
+
+METRICS_ENV = "COCOLIGHT_METRICS"
+
+
+def _sim_steps() -> float:
+    """simulation time in simulator steps, the unit of the tester's clock period"""
+    try:
+        from cocotb.utils import get_sim_time
+
+        return get_sim_time("step")
+    except Exception:  # outside of a simulation
+        return 0.0
+
+
+class TestMetrics:
+    _testers = 0
+
+    def __init__(self, test: str, clock_period: float) -> None:
+        TestMetrics._testers += 1
+        self.test = test
+        self.tester = TestMetrics._testers  # several testers may be created by one test
+        self.clock_period = clock_period
+        self.seconds: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.path = os.environ.get(METRICS_ENV)
+        self.start()
+
+    def start(self):
+        self._wall_start = time.perf_counter()
+        self._sim_start = _sim_steps()
+
+    def add(self, name: str, seconds: float, calls: int = 1):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    @contextmanager
+    def timed(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def snapshot(self, bus_seconds: Dict[str, float]) -> dict:
+        wall = time.perf_counter() - self._wall_start
+        cycles = int((_sim_steps() - self._sim_start) / self.clock_period)
+        seconds = dict(self.seconds, **bus_seconds)
+        return dict(
+            test=self.test,
+            tester=self.tester,
+            sim_cycles=cycles,
+            wall_seconds=wall,
+            cycles_per_sec=cycles / wall if wall else None,
+            seconds=dict(seconds, other=max(wall - sum(seconds.values()), 0.0)),
+            calls=self.calls,
+        )
+
+    def save(self, bus_seconds: Dict[str, float]):
+        if self.path:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(self.snapshot(bus_seconds)) + "\n")
+
+
+class TimedCalls:
+    """proxy of `obj`, with calls of its methods timed as `name` in `metrics`"""
+
+    def __init__(self, obj, metrics: TestMetrics, name: str) -> None:
+        self._obj = obj
+        self._metrics = metrics
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(self._obj, attr)
+        if not callable(value):
+            return value
+
+        def timed(*args, **kwargs):
+            with self._metrics.timed(self._name):
+                return value(*args, **kwargs)
+
+        return timed
+
+
+def load_metrics(paths: Iterable[PathLike]) -> List[dict]:
+    """last snapshot of each tester in the metrics files"""
+    last: Dict[tuple, dict] = {}
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    m = json.loads(line)
+                    last[(str(path), m["test"], m["tester"])] = m
+    return list(last.values())
+
+
+def summarize_metrics(snapshots: Iterable[dict]) -> dict:
+    """per-test metrics (testers of a test added up) and totals of all tests"""
+    tests: Dict[str, dict] = {}
+    for m in snapshots:
+        t = tests.setdefault(m["test"], dict(sim_cycles=0, wall_seconds=0.0, seconds={}, calls={}))
+        t["sim_cycles"] += m["sim_cycles"]
+        t["wall_seconds"] += m["wall_seconds"]
+        for k, v in m["seconds"].items():
+            t["seconds"][k] = t["seconds"].get(k, 0.0) + v
+        for k, v in m["calls"].items():
+            t["calls"][k] = t["calls"].get(k, 0) + v
+    total = dict(sim_cycles=0, wall_seconds=0.0, seconds={})
+    for t in tests.values():
+        t["cycles_per_sec"] = t["sim_cycles"] / t["wall_seconds"] if t["wall_seconds"] else None
+        total["sim_cycles"] += t["sim_cycles"]
+        total["wall_seconds"] += t["wall_seconds"]
+        for k, v in t["seconds"].items():
+            total["seconds"][k] = total["seconds"].get(k, 0.0) + v
+    total["cycles_per_sec"] = total["sim_cycles"] / total["wall_seconds"] if total["wall_seconds"] else None
+    return dict(tests=tests, total=total)
+
+
+def format_metrics(summary: dict) -> str:
+    lines = []
+    for name, t in list(summary["tests"].items()) + [("total", summary["total"])]:
+        wall = t["wall_seconds"] or 1.0
+        parts = ", ".join(
+            f"{k} {100 * v / wall:.0f}%" for k, v in sorted(t["seconds"].items(), key=lambda kv: -kv[1])
+        )
+        lines.append(
+            f"{name}: {t['sim_cycles']} cycles in {t['wall_seconds']:.1f} s"
+            f" ({t['cycles_per_sec'] or 0:,.0f} cycles/s): {parts}"
+        )
+    return "\n".join(lines)
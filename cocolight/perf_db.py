@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import subprocess
+import time
+from pathlib import Path
+from subprocess import DEVNULL, PIPE
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+# Persistent store of measured cycle counts (JSON lines, one record per measurement)
+# Records are keyed by (design, op, label), e.g. ("Ascon", "enc", "AD 1536") or ("Ascon", "enc", "AD Long"),
+# where design is the `design_key` of the variant, e.g. "Ascon[ASCON128A=1,UNROLL_FACTOR=2]"
+
+PERF_DB_ENV = "COCOLIGHT_PERF_DB"
+DESIGN_ENV = "COCOLIGHT_DESIGN"
+REVISION_ENV = "COCOLIGHT_REVISION"
+PERF_BASELINE_ENV = "COCOLIGHT_PERF_BASELINE"
+PERF_TOLERANCE_ENV = "COCOLIGHT_PERF_TOLERANCE"
+
+PerfKey = Tuple[str, str]  # (op, label)
+
+
+def design_key(design: str, params: Dict[str, object]) -> str:
+    """name of a design variant: the design with its (sorted) parameters, or just the design without any"""
+    if not params:
+        return design
+    return f"{design}[{','.join(f'{k}={v}' for k, v in sorted(params.items()))}]"
+
+
+def git_revision(cwd=None) -> Optional[str]:
+    """current git revision of the working tree (with '-dirty' suffix if modified), or None if not available"""
+    try:
+        out = subprocess.run(
+            ["git", "describe", "--always", "--dirty", "--abbrev=12"],
+            cwd=cwd,
+            stdout=PIPE,
+            stderr=DEVNULL,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.decode("utf-8").strip() or None
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """--perf-db/--perf-check/--perf-tolerance arguments of the run.py scripts"""
+    parser.add_argument(
+        "--perf-db",
+        metavar="FILE",
+        help="JSON-lines file storing timing measurements (not stored if not given)",
+    )
+    parser.add_argument(
+        "--perf-check",
+        nargs="?",
+        const="",
+        metavar="REVISION",
+        help="fail if any measured timing regressed compared to REVISION (default: latest stored)",
+    )
+    parser.add_argument(
+        "--perf-tolerance",
+        type=float,
+        default=0.0,
+        help="allowed relative increase in cycles for --perf-check, e.g. 0.02 for 2%%",
+    )
+
+
+def check_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    if args.perf_check is not None and not args.perf_db:
+        parser.error("--perf-check needs the database of earlier timings (--perf-db FILE)")
+
+
+def env(args: argparse.Namespace, design: str) -> Dict[str, str]:
+    """testbench environment of the perf arguments, `design`: key of the design variant"""
+    env = {DESIGN_ENV: design, REVISION_ENV: git_revision() or "unknown"}
+    if args.perf_db:
+        env[PERF_DB_ENV] = str(Path(args.perf_db).absolute())
+        if args.perf_check is not None:
+            env[PERF_BASELINE_ENV] = args.perf_check
+            env[PERF_TOLERANCE_ENV] = str(args.perf_tolerance)
+    return env
+
+
+class PerfRegression(NamedTuple):
+    op: str
+    label: str
+    cycles: int
+    baseline: int
+    baseline_revision: Optional[str]
+
+    def __str__(self) -> str:
+        increase = self.cycles - self.baseline
+        rel = f" ({100 * increase / self.baseline:+.1f}%)" if self.baseline else ""
+        return (
+            f"{self.op} {self.label}: {self.cycles} cycles, baseline {self.baseline}"
+            f" @ {self.baseline_revision}{rel}"
+        )
+
+
+class PerfDb:
+    def __init__(
+        self,
+        path: Union[str, os.PathLike],
+        design: str,
+        revision: Optional[str] = None,
+        baseline_revision: Optional[str] = None,
+        tolerance: Optional[float] = None,
+    ) -> None:
+        """
+        baseline_revision: revision to compare against, "" for the most recent record of each measurement
+        tolerance: allowed relative increase in cycles (e.g. 0.02 = 2%). Comparison is disabled if None.
+        """
+        self.path = Path(path)
+        self.design = design
+        self.revision = revision
+        self.baseline_revision = baseline_revision
+        self.tolerance = tolerance
+        self.pending: List[dict] = []
+
+    @classmethod
+    def from_env(cls) -> Optional["PerfDb"]:
+        path = os.environ.get(PERF_DB_ENV)
+        design = os.environ.get(DESIGN_ENV)
+        if not path or not design:
+            return None
+        tolerance = os.environ.get(PERF_TOLERANCE_ENV)
+        return cls(
+            path,
+            design,
+            revision=os.environ.get(REVISION_ENV),
+            baseline_revision=os.environ.get(PERF_BASELINE_ENV),
+            tolerance=float(tolerance) if tolerance else None,
+        )
+
+    @property
+    def check(self) -> bool:
+        return self.tolerance is not None
+
+    def records(self) -> Iterator[dict]:
+        """all stored records of this design, oldest first"""
+        if not self.path.exists():
+            return
+        with open(self.path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if rec.get("design") == self.design:
+                    yield rec
+
+    def baseline(self, revision: Optional[str] = None) -> Dict[PerfKey, dict]:
+        """most recent stored record for each (op, label), optionally only from `revision` (prefix match)"""
+        base = {}
+        for rec in self.records():
+            if revision and not str(rec.get("revision", "")).startswith(revision):
+                continue
+            base[(rec["op"], rec["label"])] = rec
+        return base
+
+    def record(self, op: str, label: str, cycles: int, **kwargs) -> dict:
+        rec = dict(
+            design=self.design,
+            revision=self.revision,
+            op=op,
+            label=label,
+            cycles=cycles,
+            time=int(time.time()),
+            **kwargs,
+        )
+        self.pending.append(rec)
+        return rec
+
+    def compare(self, baseline: Dict[PerfKey, dict], tolerance: float = 0.0) -> List[PerfRegression]:
+        """pending records whose cycle count exceeds baseline by more than `tolerance` (relative)"""
+        regressions = []
+        for rec in self.pending:
+            base = baseline.get((rec["op"], rec["label"]))
+            if base is None:
+                continue
+            if rec["cycles"] > base["cycles"] * (1 + tolerance):
+                regressions.append(
+                    PerfRegression(
+                        rec["op"], rec["label"], rec["cycles"], base["cycles"], base.get("revision")
+                    )
+                )
+        return regressions
+
+    def discard(self):
+        self.pending = []
+
+    def commit(self):
+        if not self.pending:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            for rec in self.pending:
+                f.write(json.dumps(rec, sort_keys=False) + "\n")
+        self.pending = []
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import random
+from typing import Dict, Iterable, Iterator, Optional, TypeVar
+
+from .utils import shard_items
+
+# Independent random streams of a test, all derived from cocotb's RANDOM_SEED and the test's name:
+#   sizes       vector sizes and order, drawn by the test while building its plan
+#   payload     keys, nonces and messages
+#   in_stalls   stall schedules of the input drivers
+#   out_stalls  stall schedules of the output monitors
+#
+# Seeds of the payload and stall streams are derived per vector from its position in the test plan (index of
+# the item of `RngStreams.shard_items` it belongs to), operation, sizes and occurrence within that item,
+# instead of being drawn in issue order. A vector gets the same data and stalls whether the full plan,
+# a shard of it or only that vector is run, and changing e.g. the stall limits doesn't affect the payload.
+
+STREAMS = ("sizes", "payload", "in_stalls", "out_stalls")
+
+T = TypeVar("T")
+
+
+def derive_seed(*items) -> int:
+    """64-bit seed from the string representation of `items`"""
+    digest = hashlib.blake2b(repr(items).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def random_seed() -> int:
+    """cocotb's RANDOM_SEED, when running in a simulation"""
+    try:
+        import cocotb
+
+        seed = getattr(cocotb, "RANDOM_SEED", None)
+    except ImportError:
+        seed = None
+    if seed is None:
+        seed = int(os.environ.get("RANDOM_SEED", 0))
+    return seed
+
+
+class RngStreams:
+    def __init__(self, seed: int, test: str = "") -> None:
+        self.seed = seed
+        self.test = test
+        self.sizes = random.Random(derive_seed(seed, test, "sizes"))
+        self._plans = 0  # number of `shard_items` loops started
+        self._position: Optional[tuple] = None  # (loop, item index in the full plan), (loop, "end") after a loop
+        self._occurrences: Dict[tuple, int] = {}
+
+    @classmethod
+    def from_env(cls, test: str = "") -> "RngStreams":
+        return cls(random_seed(), test)
+
+    def _enter(self, position: tuple):
+        self._position = position
+        self._occurrences = {}
+
+    def shard_items(self, items: Iterable[T]) -> Iterator[T]:
+        """`utils.shard_items`, seeding the vectors issued while an item is processed by its index in `items`"""
+        self._plans += 1
+        plan = self._plans
+        for index, item in shard_items(items):
+            self._enter((plan, index))
+            yield item
+        self._enter((plan, "end"))
+
+    def vector_seeds(self, *key) -> Dict[str, int]:
+        """seeds of the payload and stall streams of a vector identified by `key` (e.g. operation and sizes).
+        Repeated vectors with the same key (of the same plan item) get different seeds."""
+        n = self._occurrences.get(key, 0)
+        self._occurrences[key] = n + 1
+        position = (self._position, key, n)
+        return dict(
+            seed=derive_seed(self.seed, self.test, "payload", position),
+            in_seed=derive_seed(self.seed, self.test, "in_stalls", position),
+            out_seed=derive_seed(self.seed, self.test, "out_stalls", position),
+        )
+
+    def as_dict(self) -> dict:
+        """serializable description, from which the streams can be recreated"""
+        return dict(seed=self.seed, test=self.test)
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "RngStreams":
+        return cls(d["seed"], d.get("test", ""))
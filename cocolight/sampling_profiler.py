@@ -0,0 +1,81 @@
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional, Union
+
+# Sampling profiler of the Python code running in the simulator process.
+#
+# `run.py --profile` prepends this module to cocotb's MODULE. Importing it with COCOLIGHT_PROFILE set starts
+# a thread that samples the stack of the main thread, and writes the samples as folded stacks (input of
+# flamegraph.pl, speedscope, ...) when the simulation exits. Samples taken while the main thread runs no
+# Python code (the simulator evaluating the RTL, or GPI between callbacks) are counted as `[simulator]`.
+
+PROFILE_ENV = "COCOLIGHT_PROFILE"  # folded stacks output
+PROFILE_RATE_ENV = "COCOLIGHT_PROFILE_RATE"  # samples per second
+
+SIMULATOR = "[simulator]"
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, rate: float = 200, thread_id: Optional[int] = None) -> None:
+        self.interval = 1.0 / rate
+        self.thread_id = thread_id if thread_id is not None else threading.main_thread().ident
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="cocolight-profiler", daemon=True)
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(_frame_label(frame))
+            frame = frame.f_back
+        self.stacks[";".join(reversed(stack)) if stack else SIMULATOR] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def num_samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def write_folded(self, path: Union[str, os.PathLike]):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _start_from_env() -> Optional[SamplingProfiler]:
+    path = os.environ.get(PROFILE_ENV)
+    if not path:
+        return None
+    profiler = SamplingProfiler(float(os.environ.get(PROFILE_RATE_ENV, 200)))
+    t0 = time.perf_counter()
+
+    def finish():
+        profiler.stop()
+        profiler.write_folded(path)
+        print(f"profiler: {profiler.num_samples} samples in {time.perf_counter() - t0:.1f} s written to {path}")
+
+    profiler.start()
+    atexit.register(finish)
+    return profiler
+
+
+profiler = _start_from_env()
@@ -0,0 +1,126 @@
+import ast
+import json
+import os
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from .utils import SHARD_ENV
+
+# Splitting cocotb tests of a testbench module over multiple simulator processes, and merging their results
+
+
+def _is_cocotb_test(decorator: ast.expr) -> bool:
+    if isinstance(decorator, ast.Call):
+        decorator = decorator.func
+    if isinstance(decorator, ast.Attribute):
+        return decorator.attr == "test"
+    return isinstance(decorator, ast.Name) and decorator.id == "test"
+
+
+def discover_tests(module_file: Union[str, os.PathLike]) -> Dict[str, bool]:
+    """Find cocotb tests in a testbench module without importing it.
+    Returns test name -> whether the test splits its vectors using `shard_items`"""
+    with open(module_file) as f:
+        tree = ast.parse(f.read(), filename=str(module_file))
+    tests = {}
+    for node in tree.body:
+        if not isinstance(node, (ast.AsyncFunctionDef, ast.FunctionDef)):
+            continue
+        if not any(_is_cocotb_test(d) for d in node.decorator_list):
+            continue
+        tests[node.name] = any(
+            (isinstance(n, ast.Name) and n.id == "shard_items")
+            or (isinstance(n, ast.Attribute) and n.attr == "shard_items")
+            for n in ast.walk(node)
+        )
+    return tests
+
+
+class ShardJob(NamedTuple):
+    test: str
+    seed: str
+    shard: Optional[Tuple[int, int]] = None  # (index, number of shards)
+
+    @property
+    def name(self) -> str:
+        name = f"{self.test}[seed={self.seed}]"
+        if self.shard:
+            name += f"[{self.shard[0]}/{self.shard[1]}]"
+        return name
+
+    @property
+    def dirname(self) -> str:
+        name = f"{self.test}-s{self.seed}"
+        if self.shard:
+            name += f"-{self.shard[0]}of{self.shard[1]}"
+        return name
+
+    def env(self) -> Dict[str, str]:
+        env = dict(TESTCASE=self.test, RANDOM_SEED=str(self.seed))
+        if self.shard:
+            env[SHARD_ENV] = f"{self.shard[0]}/{self.shard[1]}"
+        return env
+
+
+def plan_jobs(tests: Dict[str, bool], seeds: Sequence[str], num_shards: int) -> List[ShardJob]:
+    """one job per test and seed; tests using `shard_items` are further split into `num_shards` jobs"""
+    jobs = []
+    for seed in seeds:
+        for test, shardable in tests.items():
+            if shardable and num_shards > 1:
+                jobs.extend(ShardJob(test, seed, (i, num_shards)) for i in range(num_shards))
+            else:
+                jobs.append(ShardJob(test, seed))
+    return jobs
+
+
+def merge_results(
+    results: List[Tuple[ShardJob, Optional[Union[str, os.PathLike]]]],
+    xml_out: Union[str, os.PathLike],
+    json_out: Union[str, os.PathLike],
+) -> dict:
+    """Merge cocotb JUnit result files of all jobs into a single JUnit file and a JSON summary"""
+    suites = ET.Element("testsuites", name="results")
+    suite = ET.SubElement(suites, "testsuite", name="all", package="all")
+    summary = dict(passed=0, failed=0, skipped=0, tests=[])
+    for job, results_file in results:
+        testcases = []
+        if results_file and Path(results_file).is_file():
+            try:
+                testcases = list(ET.parse(results_file).iter("testcase"))
+            except ET.ParseError:
+                pass
+        if not testcases:
+            tc = ET.Element("testcase", name=job.test, classname="")
+            ET.SubElement(tc, "error", message="Simulation terminated abnormally, no results")
+            testcases = [tc]
+        for tc in testcases:
+            tc.set("name", job.name)
+            suite.append(tc)
+            if tc.find("failure") is not None or tc.find("error") is not None:
+                status = "failed"
+            elif tc.find("skipped") is not None:
+                status = "skipped"
+            else:
+                status = "passed"
+            summary[status] += 1
+            summary["tests"].append(
+                dict(
+                    name=job.name,
+                    test=job.test,
+                    seed=job.seed,
+                    shard=job.shard,
+                    status=status,
+                    time=float(tc.get("time", 0)),
+                    sim_time_ns=float(tc.get("sim_time_ns", 0)),
+                    results_file=str(results_file) if results_file else None,
+                )
+            )
+    suite.set("tests", str(len(summary["tests"])))
+    suite.set("failures", str(summary["failed"]))
+    suite.set("skipped", str(summary["skipped"]))
+    ET.ElementTree(suites).write(xml_out, encoding="UTF-8", xml_declaration=True)
+    with open(json_out, "w") as f:
+        json.dump(summary, f, indent=1)
+    return summary
@@ -0,0 +1,98 @@
+import fcntl
+import shutil
+from pathlib import Path
+from typing import List, Optional
+
+import cocotb
+from cocotb_test.simulator import Verilator
+
+from .build_cache import StageStamps, executable_id, hash_files, hash_items
+
+# Verilator main with runtime trace control, replacing cocotb's when `trace_control` is enabled
+TRACE_MAIN = Path(__file__).parent / "verilator_main.cpp"
+
+
+class CachedVerilator(Verilator):
+    """Verilator simulator with content-addressed model builds.
+    The Verilated model is built in a sub-directory of `cache_dir` named after the digest of the Verilog sources,
+    toplevel, compile arguments and tool versions, and is reused by all runs with the same inputs
+    (e.g. different seeds, test selections or plusargs, which are only used at runtime).
+
+    Concurrent runs hold a lock on the model while building it, so that it is built only once.
+
+    With `trace_control`, the model is built with tracing and a main that lets the testbench pause and resume
+    dumping (see `cocolight.trace_control`).
+    """
+
+    def __init__(
+        self,
+        verilog_sources: List,
+        toplevel: str,
+        extra_args: Optional[List[str]] = None,
+        cache_dir="sim_build",
+        trace_control=False,
+        **kwargs,
+    ) -> None:
+        extra_args = list(extra_args or [])
+        self.trace_control = trace_control
+        if trace_control:
+            kwargs["waves"] = True
+        self.model_digest = hash_items(
+            executable_id(shutil.which("verilator")),
+            cocotb.__version__,
+            toplevel,
+            extra_args,
+            {k: kwargs.get(k) for k in ("compile_args", "defines", "includes", "parameters", "waves")},
+            hash_files(verilog_sources),
+            hash_files([TRACE_MAIN]) if trace_control else None,
+        )
+        sim_build = Path(cache_dir) / f"{toplevel}-{self.model_digest[:16]}"
+        super().__init__(
+            verilog_sources=verilog_sources,
+            toplevel=toplevel,
+            extra_args=extra_args,
+            sim_build=str(sim_build),
+            **kwargs,
+        )
+        self.model_file = Path(self.sim_dir) / toplevel
+        if trace_control:
+            self.plus_args.append("--trace-windowed")  # dumping starts paused
+        self.model_stamps = StageStamps(Path(self.sim_dir) / "model.json")
+
+    @property
+    def model_fresh(self) -> bool:
+        return self.model_stamps.is_fresh("model", self.model_digest, [self.model_file])
+
+    def _commands(self):
+        cmds = super().build_command()
+        if self.trace_control:
+            verilate = cmds[0]
+            main = next(i for i, arg in enumerate(verilate) if arg.endswith("verilator.cpp"))
+            verilate[main] = str(TRACE_MAIN)
+            # export `cocolight_trace` to the Python interpreter embedded in the executable
+            verilate[main:main] = ["-LDFLAGS", "-rdynamic"]
+        return cmds
+
+    def build_command(self):
+        cmds = self._commands()
+        if self.model_fresh:
+            self.logger.info(f"Reusing Verilated model {self.model_file}")
+            # the last command runs the model, all others build it
+            return [] if self.compile_only else cmds[-1:]
+        return cmds
+
+    def build_model(self):
+        """build the model unless it is up to date, waiting for other runs building the same model"""
+        with open(Path(self.sim_dir).with_name(Path(self.sim_dir).name + ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self.model_fresh:
+                return
+            self.set_env()
+            cmds = self._commands()
+            self.execute(cmds if self.compile_only else cmds[:-1])
+            if self.model_file.exists():
+                self.model_stamps.update("model", self.model_digest)
+
+    def run(self):
+        self.build_model()
+        return super().run()
@@ -0,0 +1,246 @@
+import argparse
+import atexit
+import os
+import struct
+import subprocess
+import sys
+from bisect import bisect_right
+from collections import defaultdict
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+# Compact binary trace of permutation states of the Python reference models, and
+# comparison against the corresponding state register of an RTL simulation waveform.
+#
+# States are stored as bytes of the little-endian integer value of the state register, i.e.
+# byte 0 holds bits [7:0] of the register.
+#
+# Models record into a `StateTrace` assigned to their `trace` attribute (None by default, so disabled
+# tracing costs one attribute check per permutation round):
+#   Xoodoo.trace = StateTrace(48)
+#   Subterranean.trace = StateTrace(33)
+# In a simulation, `run.py --state-trace FILE` sets COCOLIGHT_STATE_TRACE, and the testbenches of these
+# designs trace their Python reference model with `trace_from_env`, saving the trace when the simulation exits.
+
+PathLike = Union[str, os.PathLike]
+
+STATE_TRACE_ENV = "COCOLIGHT_STATE_TRACE"  # output file of the reference model's state trace
+
+PERM_IN = 0  # permutation input
+ROUND_OUT = 1  # output of a single round
+PERM_OUT = 2  # permutation output
+
+EVENT_NAMES = {PERM_IN: "perm_in", ROUND_OUT: "round_out", PERM_OUT: "perm_out"}
+
+_MAGIC = b"CLST"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHHII")  # magic, version, state bytes, capacity, number of recorded states
+_RECORD = struct.Struct("<IBH")  # sequence number, event, round
+
+
+class TraceRecord(NamedTuple):
+    seq: int
+    event: int
+    round: int
+    state: bytes
+
+    def __str__(self) -> str:
+        return f"#{self.seq} {EVENT_NAMES.get(self.event, self.event)} round={self.round}"
+
+
+class StateTrace:
+    """Ring buffer of the last `capacity` recorded states"""
+
+    def __init__(self, state_bytes: int, capacity: int = 1 << 16) -> None:
+        self.state_bytes = state_bytes
+        self.capacity = capacity
+        self.record_size = _RECORD.size + state_bytes
+        self.buffer = bytearray(capacity * self.record_size)
+        self.count = 0
+
+    def record(self, event: int, round: int, state: bytes):
+        offset = (self.count % self.capacity) * self.record_size
+        _RECORD.pack_into(self.buffer, offset, self.count & 0xFFFFFFFF, event, round)
+        offset += _RECORD.size
+        self.buffer[offset : offset + self.state_bytes] = state
+        self.count += 1
+
+    def record_int(self, event: int, round: int, value: int):
+        self.record(event, round, value.to_bytes(self.state_bytes, "little"))
+
+    def clear(self):
+        self.count = 0
+
+    def _ordered(self) -> bytes:
+        """buffer contents, oldest record first"""
+        if self.count <= self.capacity:
+            return bytes(self.buffer[: self.count * self.record_size])
+        split = (self.count % self.capacity) * self.record_size
+        return bytes(self.buffer[split:] + self.buffer[:split])
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def __iter__(self) -> Iterator[TraceRecord]:
+        data = self._ordered()
+        for offset in range(0, len(data), self.record_size):
+            seq, event, rnd = _RECORD.unpack_from(data, offset)
+            state = data[offset + _RECORD.size : offset + self.record_size]
+            yield TraceRecord(seq, event, rnd, state)
+
+    def save(self, path: PathLike):
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, self.state_bytes, self.capacity, self.count))
+            f.write(self._ordered())
+
+    @classmethod
+    def load(cls, path: PathLike) -> "StateTrace":
+        with open(path, "rb") as f:
+            magic, version, state_bytes, capacity, count = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f"{path} is not a state trace (version {_VERSION})")
+            trace = cls(state_bytes, capacity)
+            data = f.read()
+        n = len(data) // trace.record_size
+        trace.buffer[: len(data)] = data
+        trace.count = n
+        return trace
+
+
+def trace_from_env(state_bytes: int, capacity: int = 1 << 16) -> Optional[StateTrace]:
+    """a trace saved to COCOLIGHT_STATE_TRACE at exit, None if tracing is not enabled"""
+    path = os.environ.get(STATE_TRACE_ENV)
+    if not path:
+        return None
+    trace = StateTrace(state_bytes, capacity)
+
+    def save():
+        trace.save(path)
+        print(f"state trace: {len(trace)} of {trace.count} states written to {path}")
+
+    atexit.register(save)
+    return trace
+
+
+def _open_waveform(path: str):
+    if path.endswith(".fst"):
+        # convert on the fly using fst2vcd (part of GTKWave)
+        proc = subprocess.Popen(["fst2vcd", "-f", path], stdout=subprocess.PIPE)
+        return proc.stdout, proc
+    return open(path, "rb"), None
+
+
+def signal_changes(wave_file: str, signal: str) -> List[Tuple[int, int]]:
+    """(time, value) of all changes of `signal` (full hierarchical name, e.g. 'TOP.lwc.xoodyak_xoodooState')
+    in a VCD or FST waveform. Values containing x/z bits are skipped."""
+    from vcd.reader import TokenKind, tokenize
+
+    scope: List[str] = []
+    ids = set()
+    changes = []
+    t = 0
+    stream, proc = _open_waveform(wave_file)
+    try:
+        for token in tokenize(stream):
+            kind = token.kind
+            if kind is TokenKind.CHANGE_TIME:
+                t = token.time_change
+            elif kind is TokenKind.CHANGE_VECTOR or kind is TokenKind.CHANGE_SCALAR:
+                change = token.vector_change if kind is TokenKind.CHANGE_VECTOR else token.scalar_change
+                if change.id_code in ids and isinstance(change.value, int):
+                    changes.append((t, change.value))
+            elif kind is TokenKind.SCOPE:
+                scope.append(token.scope.ident)
+            elif kind is TokenKind.UPSCOPE:
+                scope.pop()
+            elif kind is TokenKind.VAR:
+                name = ".".join(scope + [token.var.reference])
+                if name == signal or name.endswith("." + signal):
+                    ids.add(token.var.id_code)
+    finally:
+        stream.close()
+        if proc:
+            proc.wait()
+    if not ids:
+        raise ValueError(f"signal {signal} not found in {wave_file}")
+    return changes
+
+
+class Divergence(NamedTuple):
+    record: TraceRecord
+    matched: int  # number of matched trace records
+    last_match: Optional[Tuple[TraceRecord, int]]  # (record, time) of the last matched record
+    rtl: Optional[Tuple[int, int]]  # (time, value) of the first RTL state after the last match
+
+
+def first_divergence(
+    trace: StateTrace, changes: List[Tuple[int, int]], events=(PERM_IN, PERM_OUT)
+) -> Optional[Divergence]:
+    """Match trace records of `events` in order against the sequence of RTL register values.
+    Returns the first record not found in the RTL sequence after the previously matched record."""
+    positions: Dict[int, List[int]] = defaultdict(list)
+    for i, (_, value) in enumerate(changes):
+        positions[value].append(i)
+    pos = -1
+    matched = 0
+    last_match = None
+    for rec in trace:
+        if rec.event not in events:
+            continue
+        value = int.from_bytes(rec.state, "little")
+        candidates = positions.get(value, [])
+        j = bisect_right(candidates, pos)
+        if j == len(candidates):
+            rtl = changes[pos + 1] if pos + 1 < len(changes) else None
+            return Divergence(rec, matched, last_match, rtl)
+        pos = candidates[j]
+        matched += 1
+        last_match = (rec, changes[pos][0])
+    return None
+
+
+def _fmt_state(value: int, nbytes: int) -> str:
+    s = f"{value:0{2 * nbytes}x}"
+    return " ".join(s[max(i - 8, 0) : i] for i in range(len(s), 0, -8))  # 32-bit words, LSW first
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="compare a reference model state trace with a waveform")
+    parser.add_argument("trace", help="state trace file (saved StateTrace)")
+    parser.add_argument("waveform", nargs="?", help="VCD or FST waveform of the RTL simulation")
+    parser.add_argument("--signal", help="hierarchical name of the RTL state register")
+    parser.add_argument(
+        "--rounds", action="store_true", help="also match outputs of individual rounds"
+    )
+    args = parser.parse_args(argv)
+
+    trace = StateTrace.load(args.trace)
+    if not args.waveform:
+        for rec in trace:
+            print(f"{str(rec):32} {_fmt_state(int.from_bytes(rec.state, 'little'), trace.state_bytes)}")
+        return 0
+    if not args.signal:
+        parser.error("--signal is required to compare against a waveform")
+
+    changes = signal_changes(args.waveform, args.signal)
+    events = (PERM_IN, ROUND_OUT, PERM_OUT) if args.rounds else (PERM_IN, PERM_OUT)
+    div = first_divergence(trace, changes, events)
+    if div is None:
+        print(f"all {len(trace)} trace records found in {args.signal} ({len(changes)} changes)")
+        return 0
+    expected = int.from_bytes(div.record.state, "little")
+    print(f"first divergence after {div.matched} matching states: {div.record}")
+    if div.last_match:
+        print(f"  last match: {div.last_match[0]} at t={div.last_match[1]}")
+    print(f"  expected:   {_fmt_state(expected, trace.state_bytes)}")
+    if div.rtl:
+        t, actual = div.rtl
+        diff = expected ^ actual
+        print(f"  RTL t={t}: {_fmt_state(actual, trace.state_bytes)}")
+        print(f"  xor:        {_fmt_state(diff, trace.state_bytes)} ({bin(diff).count('1')} bits)")
+    else:
+        print("  no RTL state changes after the last match")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
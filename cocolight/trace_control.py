@@ -0,0 +1,155 @@
+import ctypes
+import os
+from contextlib import contextmanager
+from logging import Logger
+from typing import Iterable, List, NamedTuple, Optional, Set
+
+import cocotb
+from cocotb.triggers import Timer
+from cocotb.utils import get_sim_time
+
+# Windowed waveform tracing: dumping is paused, except around selected messages or sim-time windows.
+#
+# Requires a model built with `CachedVerilator(trace_control=True)` (`run.py --trace-window`), whose main
+# exports `cocolight_trace(int on)`. Without it, all requests are ignored.
+#
+# Windows are given as a comma-separated list in COCOLIGHT_TRACE_WINDOW:
+#   msg:12        message (LWC operation) #12 of each test, as numbered in the monitor's log
+#   msg:12-14     messages #12 to #14
+#   1000-5000     sim time window in ns, also `t:1000-5000`; `t:1000` traces from 1000 ns to the end
+
+TRACE_WINDOW_ENV = "COCOLIGHT_TRACE_WINDOW"
+
+
+class TraceWindow(NamedTuple):
+    kind: str  # "msg" or "time"
+    start: int
+    end: Optional[int]  # inclusive, None: until the end of the simulation
+
+    def __str__(self) -> str:
+        if self.kind == "msg":
+            return f"messages {self.start}..{self.end}"
+        return f"{self.start}..{'' if self.end is None else self.end} ns"
+
+
+def parse_windows(spec: str) -> List[TraceWindow]:
+    windows = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        kind, sep, rng = item.partition(":")
+        if not sep:
+            kind, rng = "t", item
+        kind = {"t": "time", "time": "time", "m": "msg", "msg": "msg"}.get(kind)
+        first, _, last = rng.partition("-")
+        try:
+            start = int(first)
+            end = int(last) if last else (start if kind == "msg" else None)
+        except ValueError:
+            kind = None
+        if kind is None or (end is not None and end < start):
+            raise ValueError(f"invalid trace window: {item}")
+        windows.append(TraceWindow(kind, start, end))
+    return windows
+
+
+def _trace_hook():
+    try:
+        hook = ctypes.CDLL(None).cocolight_trace
+    except (OSError, AttributeError):
+        return None
+    hook.argtypes = [ctypes.c_int]
+    hook.restype = ctypes.c_int
+    return hook
+
+
+class TraceControl:
+    """Pauses and resumes dumping of the simulator's waveform.
+    Tracing is on while any of: a selected message is in flight, a time window is open, or `enable` was called
+    (more times than `disable`)."""
+
+    def __init__(self, windows: Iterable[TraceWindow] = (), log: Optional[Logger] = None) -> None:
+        self.windows = list(windows)
+        self.log = log
+        self.on = False
+        self._hook = _trace_hook()
+        # the model starts with dumping paused; -1: no trace control in this model
+        self.available = self._hook is not None and self._hook(0) >= 0
+        self._messages: Set[int] = set()  # in-flight selected messages
+        self._open_windows = 0
+        self._enabled = 0
+
+    @classmethod
+    def from_env(cls, log: Optional[Logger] = None) -> "TraceControl":
+        return cls(parse_windows(os.environ.get(TRACE_WINDOW_ENV, "")), log)
+
+    def _update(self):
+        on = bool(self._messages) or self._open_windows > 0 or self._enabled > 0
+        if on == self.on:
+            return
+        self.on = on
+        if self.available:
+            self._hook(int(on))
+            if self.log:
+                self.log.info(f"waveform tracing {'resumed' if on else 'paused'} at {get_sim_time('ns')} ns")
+
+    def selected(self, msg_id: Optional[int]) -> bool:
+        return msg_id is not None and any(
+            w.kind == "msg" and w.start <= msg_id <= w.end for w in self.windows
+        )
+
+    def add_messages(self, first: int, last: Optional[int] = None):
+        """also trace messages `first`..`last`"""
+        self.windows.append(TraceWindow("msg", first, first if last is None else last))
+
+    def message_started(self, msg_id: Optional[int]):
+        if self.selected(msg_id):
+            self._messages.add(msg_id)
+            self._update()
+
+    def message_done(self, msg_id: Optional[int]):
+        if msg_id in self._messages:
+            self._messages.discard(msg_id)
+            self._update()
+
+    def enable(self):
+        self._enabled += 1
+        self._update()
+
+    def disable(self):
+        self._enabled = max(self._enabled - 1, 0)
+        self._update()
+
+    @contextmanager
+    def window(self):
+        """trace while inside the `with` block"""
+        self.enable()
+        try:
+            yield self
+        finally:
+            self.disable()
+
+    async def _time_window(self, window: TraceWindow):
+        now = get_sim_time("ns")
+        if window.end is not None and window.end < now:
+            return
+        if window.start > now:
+            await Timer(window.start - now, units="ns")
+        self._open_windows += 1
+        self._update()
+        if window.end is None:
+            return
+        remaining = window.end - get_sim_time("ns")
+        if remaining > 0:
+            await Timer(remaining, units="ns")
+        self._open_windows -= 1
+        self._update()
+
+    def start(self):
+        """schedule the sim-time windows"""
+        if self.windows and not self.available and self.log:
+            self.log.warning("trace windows requested, but the model was not built with trace control")
+        for window in self.windows:
+            if window.kind == "time":
+                cocotb.start_soon(self._time_window(window))
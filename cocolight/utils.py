@@ -1,7 +1,22 @@
+import os
 import random
+from typing import Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+SHARD_ENV = "COCOLIGHT_SHARD"  # "<index>/<number of shards>"
+
+
+def rand_bytes(num_bytes: int, rng=random) -> bytes:
+    return bytes(rng.getrandbits(8) for _ in range(num_bytes))
+
+
+def flip_bit(data: bytes, bit: int) -> bytes:
+    """`data` with bit number `bit` inverted, counting from the MSB of the first byte"""
+    data = bytearray(data)
+    data[bit // 8] ^= 0x80 >> (bit % 8)
+    return bytes(data)
 
-def rand_bytes(num_bytes: int) -> bytes:
-    return bytes(random.getrandbits(8) for _ in range(num_bytes))
     
 def bytes_to_words(x: bytes, width, byteorder):
     assert width % 8 == 0
@@ -14,3 +29,22 @@ def bytes_to_words(x: bytes, width, byteorder):
            ]
     # print(f'bytes_to_words: {x.hex()} -> {[hex(r) for r in  ret]}')
     return ret
+
+
+def current_shard() -> Optional[Tuple[int, int]]:
+    """(index, number of shards) of this simulation process, or None if not sharded"""
+    shard = os.environ.get(SHARD_ENV)
+    if not shard:
+        return None
+    index, num_shards = (int(x) for x in shard.split("/"))
+    assert 0 <= index < num_shards, f"invalid {SHARD_ENV}={shard}"
+    return index, num_shards
+
+
+def shard_items(items: Iterable[T]) -> Iterator[Tuple[int, T]]:
+    """Items assigned to this shard (round-robin), or all items if not sharded, with their index in `items`.
+    All shards need to be given the same items in the same order."""
+    shard = current_shard()
+    for i, item in enumerate(items):
+        if shard is None or i % shard[1] == shard[0]:
+            yield i, item
@@ -1,15 +1,22 @@
 import random
+import time
 from logging import Logger
 from math import ceil
 from queue import Queue
 from types import SimpleNamespace
-from typing import List
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import cocotb
 from cocotb.clock import Clock
 from cocotb.handle import SimHandleBase
+from cocotb.queue import Queue as StreamQueue
 from cocotb.result import TestError, TestFailure
 from cocotb.triggers import First, Join, ReadOnly, RisingEdge, Timer, FallingEdge
+from cocotb.utils import get_sim_time
+
+from .metrics import TestMetrics
+from .rng import derive_seed, random_seed
+from .trace_control import TraceControl
 
 
 def chunks(l, n):
@@ -17,12 +24,69 @@ def chunks(l, n):
         yield l[i : i + n]
 
 
+class Message(list):
+    """List of words with optional named spans (e.g. LWC segments).
+    Expected words of monitors can be None, to accept any received value.
+    Drivers and monitors record the sim time of the first and last handshake of each span."""
+
+    def __init__(self, words: Iterable[int] = ()) -> None:
+        super().__init__(words)
+        self.id: Optional[int] = None  # e.g. index of the LWC operation, for selective tracing
+        self.stall_seed: Optional[int] = None  # if set, stalls are drawn from an RNG with this seed
+        self.spans: List[Tuple[str, int, int]] = []  # (name, first index, last index)
+        self.timestamps: Dict[str, Tuple[int, int]] = {}  # name -> (first, last) handshake time
+        self._marks: Optional[Dict[int, List[str]]] = None
+
+    def add_span(self, name: str, words: Iterable[int]):
+        first = len(self)
+        self.extend(words)
+        if len(self) > first:
+            self.spans.append((name, first, len(self) - 1))
+            self._marks = None
+
+    def handshake(self, idx: int, t: int):
+        if self._marks is None:
+            self._marks = {}
+            for name, first, last in self.spans:
+                self._marks.setdefault(first, []).append(name)
+                self._marks.setdefault(last, []).append(name)
+        for name in self._marks.get(idx, ()):
+            t0, t1 = self.timestamps.get(name, (t, t))
+            self.timestamps[name] = (min(t0, t), max(t1, t))
+
+
+def stall_rng(message, default: random.Random) -> random.Random:
+    seed = getattr(message, "stall_seed", None)
+    return default if seed is None else random.Random(seed)
+
+
 class ForkJoinBase:
     def __init__(self, dut: SimHandleBase, name: str) -> None:
         self._forked = None
         self.dut = dut
         self.name: str = name
         self.log: Logger = dut._log
+        self.trace: Optional[TraceControl] = None
+        self.queue: Queue[List[int]] = Queue()
+        # when set, messages are taken from this (bounded) queue as they are produced, until a `None`
+        self.stream: Optional[StreamQueue] = None
+        self.busy_seconds = 0.0  # wall time spent in `run`, between its awaits
+        self._resumed = 0.0
+
+    async def _wait(self, trigger):
+        """await `trigger`, accounting the time since the previous resumption as busy"""
+        self.busy_seconds += time.perf_counter() - self._resumed
+        result = await trigger
+        self._resumed = time.perf_counter()
+        return result
+
+    async def next_message(self) -> Optional[List[int]]:
+        """next message to send or verify, None if there are no more"""
+        if not self.queue.empty():
+            return self.queue.get()
+        if self.stream is not None:
+            return await self.stream.get()
+        return None
 
     async def run(self) -> None:
         ...
@@ -64,39 +128,47 @@ class ValidReadyDriver(ForkJoinBase):
         self.clock = clock
         self._debug = debug
         self.clock_edge = RisingEdge(clock)
-        self.queue: Queue[List[int]] = Queue()
         self.max_stalls = max_stalls
         self.min_stalls = max_stalls
+        # stalls of messages without their own seed; independent of the global `random`
+        self.rng = random.Random(derive_seed(random_seed(), "in_stalls", name))
         # dut._id(f"{sig_name}", extended=False) ?
         self._data_sig = getattr(self.dut, f"{self.name}_data")
         self.width = len(self._data_sig)
         self._valid.setimmediatevalue(0)
 
     async def run(self):
+        self._resumed = time.perf_counter()
         signal_name = self._data_sig._name
-        while not self.queue.empty():
-            message = self.queue.get()
+        while (message := await self._wait(self.next_message())) is not None:
             l = len(message)
             u = "word"
             if l > 1:
                 u += "s"
             self.log.debug(f"Putting {l} {u} on {signal_name}")
-            for word in message:
-                r = random.randint(self.min_stalls, self.max_stalls)
+            timed = isinstance(message, Message) and message.spans
+            if self.trace is not None and isinstance(message, Message):
+                self.trace.message_started(message.id)
+            rng = stall_rng(message, self.rng)
+            for idx, word in enumerate(message):
+                r = rng.randint(self.min_stalls, self.max_stalls)
                 if r > 0:
                     self._valid.value = 0
                     for _ in range(r):
-                        await self.clock_edge
+                        await self._wait(self.clock_edge)
 
                 self._valid.value = 1
                 word = int(word)
                 self._data_sig.value = word
-                await ReadOnly()
+                await self._wait(ReadOnly())
                 while not self._ready.value:
-                    await self.clock_edge
-                    await ReadOnly()
-                await self.clock_edge
+                    await self._wait(self.clock_edge)
+                    await self._wait(ReadOnly())
+                if timed:
+                    message.handshake(idx, get_sim_time())
+                await self._wait(self.clock_edge)
             self._valid.value = 0
+        self.busy_seconds += time.perf_counter() - self._resumed
 
 
 class ValidReadyMonitor(ForkJoinBase):
@@ -117,11 +189,13 @@ class ValidReadyMonitor(ForkJoinBase):
         self._data_signal = getattr(self.dut, f"{self.name}_data")
         self.width = len(self._data_signal)
         self.failures = 0
+        self.failed_ids: List[int] = []  # ids of messages with mismatches
+        self.last_id: Optional[int] = None  # id of the last completely received message
         self.num_received_words = 0
         self._debug = debug
-        self.queue: Queue[List[int]] = Queue()
         self.max_stalls = max_stalls
         self.min_stalls = min_stalls if min_stalls is not None else -self.max_stalls
+        self.rng = random.Random(derive_seed(random_seed(), "out_stalls", name))
         self._ready.setimmediatevalue(0)
 
     # TODO just single "data" field implemented
@@ -132,33 +206,41 @@ class ValidReadyMonitor(ForkJoinBase):
 
         num_verified_messages = 0
 
-        if self.queue.empty():
+        if self.stream is None and self.queue.empty():
             self.log.error(f"Monitor {self.name} is not expecting any data!")
             raise TestError
 
+        self._resumed = time.perf_counter()
         # await ReadOnly()
-        while not self.queue.empty():
-            message = self.queue.get()
+        while (message := await self._wait(self.next_message())) is not None:
             num_verified_messages += 1
-            self.log.info(
-                f"Verifying message #{num_verified_messages} ({len(message)} words) on '{self.name}'"
-            )
-            for exp in message:
+            msg_id = getattr(message, "id", None) or num_verified_messages
+            self.log.info(f"Verifying message #{msg_id} ({len(message)} words) on '{self.name}'")
+            timed = isinstance(message, Message) and message.spans
+            msg_failed = False
+            rng = stall_rng(message, self.rng)
+            for idx, exp in enumerate(message):
                 # TODO add custom ready generator
-                r = random.randint(self.min_stalls, self.max_stalls)
+                r = rng.randint(self.min_stalls, self.max_stalls)
                 if r > 0:
                     self._ready.value = 0
                     for _ in range(r):
-                        await self.clock_edge
+                        await self._wait(self.clock_edge)
 
                 self._ready.value = 1
-                await ReadOnly()
+                await self._wait(ReadOnly())
                 while self._valid.value != 1:
-                    await self.clock_edge  # TODO optimize by wait for valid = 1 if valid was != 0 ?
-                    await ReadOnly()
+                    await self._wait(self.clock_edge)  # TODO optimize by wait for valid = 1 if valid was != 0 ?
+                    await self._wait(ReadOnly())
 
                 received = self._data_signal.value
                 self.num_received_words += 1
+                if timed:
+                    message.handshake(idx, get_sim_time())
+
+                if exp is None:  # don't care
+                    await self._wait(self.clock_edge)
+                    continue
 
                 exp = f"{exp:0{digits}x}"
                 try:
@@ -166,15 +248,22 @@ class ValidReadyMonitor(ForkJoinBase):
                 except:  # has Xs etc
                     received = str(received)  # Note: binary string with Xs
 
-                # TODO add support for don't cares (X/-) in the expected words (should be binary string then?)
+                # TODO add support for don't care bits (X/-) in the expected words (should be binary string then?)
                 if received != exp:
                     self.log.error(
                         f"[monitor:{self.name}] received: {received} expected: {exp}"
                     )
                     self.failures += 1
-                await self.clock_edge
+                    if not msg_failed:
+                        msg_failed = True
+                        self.failed_ids.append(msg_id)
+                await self._wait(self.clock_edge)
+            self.last_id = msg_id
+            if self.trace is not None and isinstance(message, Message):
+                self.trace.message_done(message.id)
 
         self._ready.value = 0
+        self.busy_seconds += time.perf_counter() - self._resumed
 
     async def join(self, timeout=None):
         await super().join(timeout=timeout)
@@ -245,6 +334,20 @@ class ValidReadyTester:
         )
 
         self._forked_clock = None
+        self.trace = TraceControl.from_env(self.log)
+        for bus in list(self.drivers.__dict__.values()) + list(self.monitors.__dict__.values()):
+            bus.trace = self.trace
+        test = getattr(cocotb.regression_manager, "_test", None)
+        self.metrics = TestMetrics(getattr(test, "__qualname__", "unknown"), clk_period)
+
+    def bus_seconds(self) -> Dict[str, float]:
+        """time spent in the driver and monitor coroutines"""
+        seconds = {f"driver:{k}": d.busy_seconds for k, d in self.drivers.__dict__.items()}
+        seconds.update({f"monitor:{k}": m.busy_seconds for k, m in self.monitors.__dict__.items()})
+        return seconds
+
+    def save_metrics(self):
+        self.metrics.save(self.bus_seconds())
 
     async def reset_dut(self, duration):
         self.log.info(f"asserting reset to {self.reset_val} for {duration} time units.")
@@ -261,6 +364,7 @@ class ValidReadyTester:
             # clock = Clock(self.clock, period=self.clock_period)
             # self._forked_clock = await cocotb.start(clock.start())
             await cocotb.start(Clock(self.dut.clk, self.clock_period).start())
+            self.trace.start()
             await RisingEdge(self.clock)
             await FallingEdge(self.clock)
             await RisingEdge(self.clock)
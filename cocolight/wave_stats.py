@@ -0,0 +1,337 @@
+import argparse
+import json
+import sys
+from collections import deque
+from typing import Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .hw_api import OpCode, SegmentHeader, Status
+from .state_trace import _open_waveform
+
+# Streaming analysis of the LWC pdi/sdi/do valid-ready buses in a VCD or FST waveform.
+#
+# The waveform is read token by token and only the current values of the bus signals are kept, so
+# memory use does not depend on the length of the simulation. Words transferred on each bus are
+# decoded into LWC messages (instruction, segment headers, data, status), from which per-message
+# latencies are derived. Per-bus statistics (transfers, stalls, utilization) are accumulated on the fly.
+
+BUSES = ("pdi", "sdi", "do")
+_SIGNALS = ("data", "valid", "ready")
+KEY_OPS = (OpCode.ACTKEY, OpCode.LDKEY)
+
+
+class BusStats:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.transfers = 0  # valid & ready
+        self.stalls = 0  # valid & !ready: back-pressure from the receiver
+        self.starved = 0  # ready & !valid: receiver waiting for data
+        self.first: Optional[int] = None  # cycle of the first transfer
+        self.last: Optional[int] = None  # cycle of the last transfer
+
+    @property
+    def active_cycles(self) -> int:
+        return 0 if self.first is None or self.last is None else self.last - self.first + 1
+
+    @property
+    def utilization(self) -> float:
+        """fraction of cycles with a transfer, between the first and last transfers"""
+        return self.transfers / self.active_cycles if self.active_cycles else 0.0
+
+    def as_dict(self) -> dict:
+        return dict(
+            transfers=self.transfers,
+            stalls=self.stalls,
+            starved=self.starved,
+            first=self.first,
+            last=self.last,
+            utilization=round(self.utilization, 4),
+        )
+
+
+class MessageStats(NamedTuple):
+    index: int
+    op: str
+    status: str
+    key_reload: bool  # ACTKEY/LDKEY instructions preceded this operation
+    in_words: int  # pdi (+ sdi, for key reloads) words
+    out_words: int
+    start: int  # cycle of the first input transfer
+    end: int  # cycle of the status transfer
+    t_start: int  # waveform time of `start`
+    t_end: int
+    segments: Tuple[Tuple[str, int], ...]  # (type, length in bytes) of input segments
+
+    @property
+    def latency(self) -> int:
+        return self.end - self.start
+
+    def as_dict(self) -> dict:
+        d = self._asdict()
+        d["latency"] = self.latency
+        return d
+
+
+class _Decoded(NamedTuple):
+    op: Optional[OpCode]
+    status: Optional[Status]
+    words: int
+    start: int
+    t_start: int
+    segments: Tuple[Tuple[str, int], ...]
+
+
+class MessageDecoder:
+    """Incrementally decodes words of one bus into messages.
+    Input messages start with an instruction and end after the segment marked `last`.
+    Output messages end with a status word."""
+
+    def __init__(self, width: int, output: bool) -> None:
+        assert width in (8, 16, 32), "unsupported bus width"
+        self.width = width
+        self.output = output
+        self.header_words = 32 // width
+        self.word_bytes = width // 8
+        self.errors = 0
+        self._reset()
+
+    def _reset(self):
+        self.state = "header" if self.output else "instr"
+        self.op: Optional[OpCode] = None
+        self.words = 0
+        self.start = self.t_start = 0
+        self.segments: List[Tuple[str, int]] = []
+        self.header = 0
+        self.header_count = 0
+        self.remaining = 0
+        self.last = False
+
+    def _done(self, status: Optional[Status] = None) -> _Decoded:
+        msg = _Decoded(self.op, status, self.words, self.start, self.t_start, tuple(self.segments))
+        self._reset()
+        return msg
+
+    def feed(self, word: int, cycle: int, t: int) -> Optional[_Decoded]:
+        """returns the decoded message if `word` completed it"""
+        if self.words == 0:
+            self.start, self.t_start = cycle, t
+        self.words += 1
+        nibble = (word >> (self.width - 4)) & 0xF
+        try:
+            if self.state == "instr":
+                self.op = OpCode(nibble)
+                if self.op == OpCode.ACTKEY:
+                    return self._done()
+                self.state = "header"
+            elif self.state == "header":
+                if self.output and self.header_count == 0 and nibble in (Status.Success, Status.Failure):
+                    return self._done(Status(nibble))
+                self.header = (self.header << self.width) | word
+                self.header_count += 1
+                if self.header_count < self.header_words:
+                    return None
+                header = SegmentHeader.from_word32(self.header)
+                self.header = self.header_count = 0
+                self.segments.append((header.type.name, header.len))
+                self.last = bool(header.last)
+                self.remaining = -(-header.len // self.word_bytes)
+                if self.remaining:
+                    self.state = "data"
+                elif self.last and not self.output:
+                    return self._done()
+            else:
+                self.remaining -= 1
+                if self.remaining == 0:
+                    self.state = "header"
+                    if self.last and not self.output:
+                        return self._done()
+        except ValueError:
+            # not a valid instruction, header or status: resynchronize on the next word
+            self.errors += 1
+            self._reset()
+        return None
+
+
+def _find_signals(stream, scope_prefix: Optional[str]):
+    """id_code -> list of (bus, signal) roles, from the VCD header. Returns the tokenizer to continue reading."""
+    from vcd.reader import TokenKind, tokenize
+
+    wanted = {f"{bus}_{sig}": (bus, sig) for bus in BUSES for sig in _SIGNALS}
+    wanted["clk"] = ("clk", "clk")
+    found: Dict[Tuple[str, str], Tuple[int, str]] = {}  # role -> (depth, id_code)
+    scope: List[str] = []
+    tokens = tokenize(stream)
+    for token in tokens:
+        kind = token.kind
+        if kind is TokenKind.SCOPE:
+            scope.append(token.scope.ident)
+        elif kind is TokenKind.UPSCOPE:
+            scope.pop()
+        elif kind is TokenKind.VAR:
+            role = wanted.get(token.var.reference)
+            if role is None:
+                continue
+            path = ".".join(scope)
+            if scope_prefix and not (path == scope_prefix or path.endswith("." + scope_prefix)):
+                continue
+            # prefer the signals closest to the top of the hierarchy
+            if role not in found or len(scope) < found[role][0]:
+                found[role] = (len(scope), token.var.id_code)
+        elif kind is TokenKind.ENDDEFINITIONS:
+            break
+    roles: Dict[str, List[Tuple[str, str]]] = {}
+    for role, (_, id_code) in found.items():
+        roles.setdefault(id_code, []).append(role)
+    return roles, set(found), tokens
+
+
+def analyze(
+    wave_file: str,
+    width: int = 32,
+    scope: Optional[str] = None,
+    bus_stats: Optional[Dict[str, BusStats]] = None,
+) -> Iterator[MessageStats]:
+    """Yields statistics of each completed operation (ENC/DEC/HASH) in `wave_file`.
+    Per-bus statistics are accumulated in `bus_stats` (bus name -> BusStats), if given."""
+    from vcd.reader import TokenKind
+
+    if bus_stats is None:
+        bus_stats = {}
+    stream, proc = _open_waveform(wave_file)
+    try:
+        roles, found, tokens = _find_signals(stream, scope)
+        if ("clk", "clk") not in found:
+            raise ValueError(f"no clock signal 'clk' found in {wave_file}")
+        buses = [b for b in BUSES if all((b, s) in found for s in _SIGNALS)]
+        if "pdi" not in buses or "do" not in buses:
+            raise ValueError(f"pdi and do bus signals not found in {wave_file}")
+        for b in buses:
+            bus_stats.setdefault(b, BusStats(b))
+        decoders = {b: MessageDecoder(width, output=(b == "do")) for b in buses}
+
+        cur: Dict[Tuple[str, str], object] = {role: None for role in found}
+        prev = dict(cur)
+        clk_rose = False
+        cycle = 0
+        t = t_edge = 0
+        pending: Deque[_Decoded] = deque()  # decoded ENC/DEC/HASH instructions awaiting their output
+        key_msgs: List[_Decoded] = []  # key instructions since the last operation
+        index = 0
+
+        def sample() -> Iterator[MessageStats]:
+            nonlocal index
+            for b in buses:
+                valid = prev[(b, "valid")] == 1
+                ready = prev[(b, "ready")] == 1
+                stats = bus_stats[b]
+                if valid and ready:
+                    stats.transfers += 1
+                    if stats.first is None:
+                        stats.first = cycle
+                    stats.last = cycle
+                    data = prev[(b, "data")]
+                    if not isinstance(data, int):
+                        decoders[b].errors += 1
+                        continue
+                    msg = decoders[b].feed(data, cycle, t_edge)
+                    if msg is None:
+                        continue
+                    if b != "do":
+                        if msg.op in KEY_OPS:
+                            key_msgs.append(msg)
+                        else:
+                            pending.append(msg)
+                    elif pending:
+                        inp = pending.popleft()
+                        keys = [k for k in key_msgs if k.start <= inp.start]
+                        del key_msgs[: len(keys)]
+                        first = min([inp] + keys, key=lambda m: m.start)
+                        yield MessageStats(
+                            index=index,
+                            op=inp.op.name if inp.op is not None else "?",
+                            status=msg.status.name if msg.status is not None else "?",
+                            key_reload=bool(keys),
+                            in_words=inp.words + sum(k.words for k in keys),
+                            out_words=msg.words,
+                            start=first.start,
+                            end=cycle,
+                            t_start=first.t_start,
+                            t_end=t_edge,
+                            segments=inp.segments,
+                        )
+                        index += 1
+                elif valid:
+                    stats.stalls += 1
+                elif ready:
+                    stats.starved += 1
+
+        for token in tokens:
+            kind = token.kind
+            if kind is TokenKind.CHANGE_TIME:
+                # sample bus values as they were just before the rising clock edge
+                if clk_rose:
+                    yield from sample()
+                    cycle += 1
+                    clk_rose = False
+                prev.update(cur)
+                t = token.time_change
+            elif kind is TokenKind.CHANGE_SCALAR or kind is TokenKind.CHANGE_VECTOR:
+                change = token.scalar_change if kind is TokenKind.CHANGE_SCALAR else token.vector_change
+                rs = roles.get(change.id_code)
+                if rs is None:
+                    continue
+                value = change.value
+                if isinstance(value, str) and value in "01":
+                    value = int(value)
+                for role in rs:
+                    if role[0] == "clk" and value == 1 and cur[role] == 0:
+                        clk_rose = True
+                        t_edge = t
+                    cur[role] = value
+        if clk_rose:
+            yield from sample()
+    finally:
+        stream.close()
+        if proc:
+            proc.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LWC bus handshake and latency statistics of a waveform")
+    parser.add_argument("waveform", help="VCD or FST waveform of an LWC simulation")
+    parser.add_argument("--width", type=int, default=32, help="pdi/sdi/do data width")
+    parser.add_argument("--scope", help="scope (suffix of the hierarchical name) of the bus signals")
+    parser.add_argument("--json", help="write per-message and per-bus statistics to this JSON file")
+    parser.add_argument("--quiet", "-q", action="store_true", help="only print the summary")
+    args = parser.parse_args(argv)
+
+    bus_stats: Dict[str, BusStats] = {}
+    messages = []
+    count = latency_sum = 0
+    for m in analyze(args.waveform, args.width, args.scope, bus_stats):
+        count += 1
+        latency_sum += m.latency
+        if args.json:
+            messages.append(m.as_dict())
+        if not args.quiet:
+            segments = " ".join(f"{ty}:{n}" for ty, n in m.segments)
+            key = " +key" if m.key_reload else ""
+            print(
+                f"[{m.index}] {m.op:<4} {m.status:<7} latency={m.latency:<6} "
+                f"cycles {m.start}..{m.end} in={m.in_words} out={m.out_words}{key}  {segments}"
+            )
+    print(f"{count} operations" + (f", average latency {latency_sum / count:.1f} cycles" if count else ""))
+    for name, s in bus_stats.items():
+        print(
+            f"  {name:<3} transfers={s.transfers} stalls={s.stalls} starved={s.starved} "
+            f"utilization={100 * s.utilization:.1f}%"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                dict(messages=messages, buses={n: s.as_dict() for n, s in bus_stats.items()}), f, indent=1
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+import csv
+import os
+import random
+from typing import Dict, Iterable, List, NamedTuple, Optional, Union
+
+from .journal import Vector
+
+# Throughput estimation for a production workload, given as a histogram of operations and sizes.
+#
+# The histogram is a CSV file with one row per bin:
+#   op,adBytes,msgBytes,count[,newKey]
+#   enc,16,64,120
+#   dec,0,1500,30,0
+#   hash,,64,5
+# `op` is enc, dec or hash, `msgBytes` the PT/CT size (message size for hash) and `count` the number (or
+# relative frequency) of operations in the bin. `newKey` (default 1) selects whether the operation loads a
+# new key or reuses the previously loaded one.
+
+PathLike = Union[str, os.PathLike]
+
+WORKLOAD_ENV = "COCOLIGHT_WORKLOAD"  # histogram CSV
+WORKLOAD_OPS_ENV = "COCOLIGHT_WORKLOAD_OPS"  # number of operations in the sampled stream
+WORKLOAD_REPORT_ENV = "COCOLIGHT_WORKLOAD_REPORT"  # JSON report
+CLOCK_MHZ_ENV = "COCOLIGHT_CLOCK_MHZ"  # clock frequency of the ops/sec estimates
+
+_OPS = ("enc", "dec", "hash")
+
+
+class WorkloadBin(NamedTuple):
+    op: str
+    ad_size: int
+    msg_size: int
+    count: float
+    new_key: bool = True
+
+    def vector(self) -> Vector:
+        if self.op == "hash":
+            return Vector("hash", hm_size=self.msg_size)
+        return Vector(self.op, ad_size=self.ad_size, xt_size=self.msg_size, new_key=self.new_key)
+
+
+def _int(value: Optional[str], default: int = 0) -> int:
+    value = (value or "").strip()
+    return int(value) if value else default
+
+
+def load_histogram(path: PathLike) -> List[WorkloadBin]:
+    bins = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            op = row["op"].strip().lower()
+            if op not in _OPS:
+                raise ValueError(f"{path}: unknown operation {row['op']!r}")
+            count = float(row["count"])
+            if count < 0:
+                raise ValueError(f"{path}: negative count {count}")
+            if count > 0:
+                new_key = bool(_int(row.get("newKey"), 1))
+                ad_size, msg_size = _int(row.get("adBytes")), _int(row.get("msgBytes"))
+                bins.append(WorkloadBin(op, ad_size, msg_size, count, new_key))
+    if not bins:
+        raise ValueError(f"{path}: empty workload histogram")
+    return bins
+
+
+def sample_workload(bins: List[WorkloadBin], num_ops: int, rng: random.Random) -> List[Vector]:
+    """Stream of `num_ops` operations with the mix of `bins`, in random order.
+    The number of operations of each bin is its share of `num_ops`, rounded by largest remainder, so small
+    streams still match the histogram as closely as possible."""
+    total = sum(b.count for b in bins)
+    if not total:
+        raise ValueError("empty workload")
+    shares = [b.count * num_ops / total for b in bins]
+    counts = [int(s) for s in shares]
+    by_remainder = sorted(range(len(bins)), key=lambda i: shares[i] - counts[i], reverse=True)
+    for i in by_remainder[: num_ops - sum(counts)]:
+        counts[i] += 1
+    vectors = [b.vector() for b, n in zip(bins, counts) for _ in range(n)]
+    rng.shuffle(vectors)
+    return vectors
+
+
+def payload_bytes(v: Vector) -> int:
+    return (v.hm_size or 0) if v.op == "hash" else (v.ad_size or 0) + (v.xt_size or 0)
+
+
+def workload_report(vectors: Iterable[Vector], cycles: int, clock_mhz: float) -> dict:
+    """effective throughput of `vectors` processed back-to-back in `cycles`"""
+    vectors = list(vectors)
+    num_bytes = sum(payload_bytes(v) for v in vectors)
+    mix: Dict[str, int] = {}
+    for v in vectors:
+        mix[v.op] = mix.get(v.op, 0) + 1
+    seconds = cycles / (clock_mhz * 1e6)
+    return dict(
+        ops=len(vectors),
+        bytes=num_bytes,
+        cycles=cycles,
+        mix=mix,
+        key_loads=sum(1 for v in vectors if v.op != "hash" and v.new_key is not False),
+        cycles_per_byte=cycles / num_bytes if num_bytes else None,
+        cycles_per_op=cycles / len(vectors) if vectors else None,
+        clock_mhz=clock_mhz,
+        ops_per_sec=len(vectors) / seconds if seconds else None,
+        mbytes_per_sec=num_bytes / seconds / 1e6 if seconds else None,
+    )
+
+
+def format_report(report: dict) -> str:
+    mix = ", ".join(f"{op}={n}" for op, n in report["mix"].items())
+    lines = [
+        f"{report['ops']} operations ({mix}), {report['bytes']} bytes, {report['cycles']} cycles",
+        f"  cycles/byte: {report['cycles_per_byte'] or 0:.3f}  cycles/op: {report['cycles_per_op'] or 0:.1f}",
+        f"  at {report['clock_mhz']} MHz: {report['ops_per_sec'] or 0:,.0f} ops/s, "
+        f"{report['mbytes_per_sec'] or 0:.2f} MB/s",
+    ]
+    return "\n".join(lines)
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# Regression of all Bluespec designs of the repository and their parameter variants.
+# Each design goes through bsc generation -> Verilator build -> test shards, all run by `run.py`,
+# scheduled as a DAG on a shared pool of workers.
+import argparse
+import fnmatch
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import toml
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+# all designs are built by the top-level run.py; it adds the bsc flags of designs with their own build script
+# (xoodyak, subterranean) from the [cocolight] table of their xedaproject.toml
+RUN_PY = SCRIPT_DIR / "run.py"
+
+sys.path.append(str(SCRIPT_DIR))
+
+from cocolight.build_cache import StageStamps, hash_files, hash_items
+from cocolight.perf_db import PerfDb, design_key, git_revision
+from cocolight.sharding import ShardJob, discover_tests, merge_results, plan_jobs
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "designs", nargs="*", help="only run designs matching these patterns, e.g. 'Ascon/*'"
+)
+parser.add_argument(
+    "--jobs", "-j", type=int, default=os.cpu_count() or 1, help="number of parallel workers"
+)
+parser.add_argument(
+    "--shards", type=int, default=1, help="split vectors of sharded tests into N simulations"
+)
+parser.add_argument("--seeds", nargs="+", default=["123"], help="random seeds of test runs")
+parser.add_argument("--tests", nargs="+", help="only run these test functions")
+parser.add_argument("--out-dir", default="regress_build", help="output directory")
+parser.add_argument("--gen-only", action="store_true", help="only generate Verilog")
+parser.add_argument(
+    "--force", action="store_true", help="re-run tests even if their inputs are unchanged"
+)
+parser.add_argument("--list", action="store_true", help="list discovered designs and exit")
+
+
+class Target(NamedTuple):
+    name: str  # <directory>/<name>
+    root: Path  # directory of xedaproject.toml
+    design: str  # design name in xedaproject.toml
+    params: Dict[str, Optional[str]]  # None: leave the parameter undefined
+    tb_module: Optional[str]
+
+    def run_args(self, out_dir: Path) -> List[str]:
+        cmd = [self.design, "--out-dir", str(out_dir)]
+        for k, v in self.params.items():
+            cmd += ["--unset-param", k] if v is None else ["--param", f"{k}={v}"]
+        if self.tb_module:
+            cmd += ["--tb-module", self.tb_module]
+        return cmd
+
+    def rtl_settings(self) -> dict:
+        """`rtl` settings of the design in xedaproject.toml, with the target's parameters applied"""
+        designs = toml.load(self.root / "xedaproject.toml").get("design", [])
+        if not isinstance(designs, list):
+            designs = [designs]
+        rtl = dict(next((d for d in designs if d.get("name") == self.design), {}).get("rtl", {}))
+        params = dict(rtl.get("parameters", {}))
+        for k, v in self.params.items():
+            if v is None:
+                params.pop(k, None)
+            else:
+                params[k] = v
+        rtl["parameters"] = params
+        return rtl
+
+    @property
+    def design_key(self) -> str:
+        """key of the target's timings and cycle model, as stored by run.py"""
+        return design_key(self.design, self.rtl_settings()["parameters"])
+
+    @property
+    def tb_file(self) -> Optional[Path]:
+        if not self.tb_module:
+            return None
+        return self.root.joinpath(*self.tb_module.split(".")).with_suffix(".py")
+
+
+def _tb_module(design: dict, root: Path) -> Optional[str]:
+    tb = design.get("tb", {})
+    cocotb_settings = tb.get("cocotb")
+    module = None
+    if isinstance(cocotb_settings, dict) and "module" in cocotb_settings:
+        module = cocotb_settings["module"]
+    elif cocotb_settings:
+        module = next((Path(f).stem for f in tb.get("sources", []) if f.endswith(".py")), None)
+    if module and root.joinpath(*module.split(".")).with_suffix(".py").exists():
+        return module
+    return None
+
+
+def _parse_generator(command: str):
+    """design name and parameter overrides of a `xeda run bsc` generator command"""
+    design, params = None, {}
+    tokens = shlex.split(command)
+    for i, tok in enumerate(tokens):
+        if tok == "--design-name" and i + 1 < len(tokens):
+            design = tokens[i + 1]
+        elif tok == "--design-overrides":
+            for ovr in tokens[i + 1 :]:
+                if ovr.startswith("--"):
+                    break
+                key, _, value = ovr.partition("=")
+                if key.startswith("rtl.parameters."):
+                    params[key[len("rtl.parameters.") :]] = value
+    return design, params
+
+
+def discover_targets(root: Path) -> List[Target]:
+    """Bluespec designs in all xedaproject.toml files, and variants defined by generator commands
+    of the other toml files in the same directory"""
+    targets = []
+    seen = set()
+
+    def add(target: Target):
+        key = (target.root, target.design, tuple(sorted(target.params.items())), target.tb_module)
+        if key not in seen:
+            seen.add(key)
+            targets.append(target)
+
+    for project_file in sorted(root.glob("*/xedaproject.toml")):
+        design_root = project_file.parent
+        designs = toml.load(project_file).get("design", [])
+        if not isinstance(designs, list):
+            designs = [designs]
+        bsc_designs = {}
+        for d in designs:
+            sources = d.get("rtl", {}).get("sources", [])
+            if not any(f.endswith(".bsv") or f.endswith(".bs") for f in sources):
+                continue
+            module = _tb_module(d, design_root)
+            bsc_designs[d["name"]] = module
+            add(Target(f"{design_root.name}/{d['name']}", design_root, d["name"], {}, module))
+        for variant_file in sorted(design_root.glob("*.toml")):
+            if variant_file == project_file:
+                continue
+            variant = toml.load(variant_file)
+            generator = variant.get("rtl", {}).get("generator")
+            if isinstance(generator, dict):
+                generator = generator.get("command")
+            if not generator:
+                continue
+            design, params = _parse_generator(generator)
+            if design not in bsc_designs:
+                continue
+            name = variant.get("name", variant_file.stem)
+            module = _tb_module(variant, design_root) or bsc_designs[design]
+            add(Target(f"{design_root.name}/{name}", design_root, design, params, module))
+    return targets
+
+
+class Task:
+    def __init__(
+        self,
+        name: str,
+        cmd: List[str],
+        cwd: Path,
+        log: Path,
+        deps=(),
+        env: Optional[Dict[str, str]] = None,
+        cache: Optional[Callable[[], Optional[str]]] = None,
+        stamps: Optional[StageStamps] = None,
+        outputs=(),
+    ) -> None:
+        """cache: returns the digest of the task's inputs, evaluated once its dependencies are done"""
+        self.name = name
+        self.cmd = cmd
+        self.cwd = cwd
+        self.log = log
+        self.deps: List["Task"] = list(deps)
+        self.env = env or {}
+        self.cache = cache
+        self.stamps = stamps
+        self.outputs = list(outputs)
+        self.status = "pending"
+        self.elapsed = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.status in ("passed", "cached")
+
+    def run(self):
+        digest = self.cache() if self.cache else None
+        if digest and self.stamps and self.stamps.is_fresh("task", digest, self.outputs):
+            self.status = "cached"
+            return
+        if self.stamps:
+            self.stamps.invalidate("task")
+        self.log.parent.mkdir(parents=True, exist_ok=True)
+        start = time.time()
+        with open(self.log, "w") as log:
+            log.write(f"$ {' '.join(self.cmd)}\n")
+            log.flush()
+            proc = subprocess.run(
+                self.cmd,
+                cwd=self.cwd,
+                env=dict(os.environ, **self.env),
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+        self.elapsed = time.time() - start
+        self.status = "passed" if proc.returncode == 0 else "failed"
+        if self.ok and digest and self.stamps:
+            self.stamps.update("task", digest)
+
+
+def run_dag(tasks: List[Task], workers: int):
+    pending = list(tasks)  # in dependency order
+    running = {}
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        while pending or running:
+            for t in list(pending):
+                if any(d.status in ("failed", "blocked") for d in t.deps):
+                    t.status = "blocked"
+                    pending.remove(t)
+                    done += 1
+                elif all(d.ok for d in t.deps):
+                    running[pool.submit(t.run)] = t
+                    pending.remove(t)
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for f in finished:
+                t = running.pop(f)
+                try:
+                    f.result()
+                except Exception as e:
+                    t.status = "failed"
+                    print(f"{t.name}: {e}")
+                done += 1
+                print(f"[{done}/{len(tasks)}] {t.status.upper():7} {t.name} ({t.elapsed:.1f}s)")
+
+
+def main():
+    args = parser.parse_args()
+    out_dir = Path(args.out_dir).absolute()
+    targets = discover_targets(SCRIPT_DIR)
+    if args.designs:
+        targets = [t for t in targets if any(fnmatch.fnmatch(t.name, p) for p in args.designs)]
+    if args.list:
+        for t in targets:
+            params = " ".join(f"{k}={v}" for k, v in t.params.items())
+            print(f"{t.name:32} design={t.design} tb={t.tb_module} {params}")
+        return
+    if not targets:
+        sys.exit("no designs found")
+
+    revision = git_revision(SCRIPT_DIR) or "unknown"
+    tb_deps = sorted((SCRIPT_DIR / "cocolight").glob("*.py"))
+    tasks: List[Task] = []
+    target_tasks: Dict[str, Dict[str, List[Task]]] = {}
+    test_jobs: Dict[Task, ShardJob] = {}
+
+    for target in targets:
+        target_dir = out_dir / target.name
+        base_cmd = [sys.executable, str(RUN_PY)] + target.run_args(target_dir)
+        # timings and cycle models of each target in its own files, parallel tasks of variants of a design
+        # would otherwise share the design directory's files
+        base_cmd += ["--perf-db", str(target_dir / "perf_db.jsonl")]
+        base_cmd += ["--cycle-models", str(target_dir / "cycle_models.json")]
+        logs = target_dir / "logs"
+        gen = Task(f"{target.name}: gen", base_cmd + ["--gen"], target.root, logs / "gen.log")
+        stages = dict(gen=[gen], build=[], tests=[])
+        tasks.append(gen)
+        if target.tb_module and not args.gen_only:
+            build = Task(
+                f"{target.name}: build",
+                base_cmd + ["--compile-only"],
+                target.root,
+                logs / "build.log",
+                deps=[gen],
+            )
+            stages["build"].append(build)
+            tasks.append(build)
+            tests = discover_tests(target.tb_file)
+            if args.tests:
+                tests = {t: s for t, s in tests.items() if t in args.tests}
+            for job in plan_jobs(tests, args.seeds, args.shards):
+                work_dir = target_dir / "tests" / job.dirname
+                results_file = work_dir / "results.xml"
+                cmd = base_cmd + ["--tests", job.test, "--seed", str(job.seed)]
+                cmd += ["--work-dir", str(work_dir)]
+                if job.shard:
+                    cmd += ["--shard", f"{job.shard[0]}/{job.shard[1]}"]
+
+                def test_digest(target_dir=target_dir, target=target, job=job, cmd=cmd):
+                    if args.force:
+                        return None
+                    return hash_items(
+                        cmd,
+                        hash_files(sorted((target_dir / "gen_rtl").glob("*.v"))),
+                        hash_files([target.tb_file] + tb_deps),
+                    )
+
+                test = Task(
+                    f"{target.name}: {job.name}",
+                    cmd,
+                    target.root,
+                    work_dir / "run.log",
+                    deps=[build],
+                    env=dict(COCOTB_RESULTS_FILE=str(results_file)),
+                    cache=test_digest,
+                    stamps=StageStamps(work_dir / "stamps.json"),
+                    outputs=[results_file],
+                )
+                stages["tests"].append(test)
+                test_jobs[test] = job
+                tasks.append(test)
+        target_tasks[target.name] = stages
+
+    print(f"Running {len(tasks)} tasks of {len(targets)} designs on {args.jobs} workers")
+    run_dag(tasks, args.jobs)
+
+    summary = dict(revision=revision, designs={})
+    failed = False
+    print(f"\n{'design':32} {'gen':8} {'build':8} tests")
+    for target in targets:
+        target_dir = out_dir / target.name
+        stages = target_tasks[target.name]
+        gen_status = stages["gen"][0].status
+        build_status = stages["build"][0].status if stages["build"] else "-"
+        results = [
+            (test_jobs[t], t.env["COCOTB_RESULTS_FILE"])
+            for t in stages["tests"]
+            if t.status != "blocked"
+        ]
+        tests = None
+        if results:
+            tests = merge_results(results, target_dir / "results.xml", target_dir / "results.json")
+        perf = PerfDb(target_dir / "perf_db.jsonl", target.design_key).baseline()
+        cycles = {f"{op} {label}": rec["cycles"] for (op, label), rec in sorted(perf.items())}
+        blocked = sum(t.status == "blocked" for t in stages["tests"])
+        tests_str = []
+        if tests:
+            tests_str += [f"{tests['passed']} passed", f"{tests['failed']} failed"]
+        if blocked:
+            tests_str.append(f"{blocked} blocked")
+        tests_str = ", ".join(tests_str) or "-"
+        print(f"{target.name:32} {gen_status:8} {build_status:8} {tests_str}")
+        for k, v in cycles.items():
+            print(f"    {k}: {v} cycles")
+        all_tasks = stages["gen"] + stages["build"] + stages["tests"]
+        failed |= any(not t.ok for t in all_tasks) or bool(tests and tests["failed"])
+        summary["designs"][target.name] = dict(
+            design=target.design,
+            params=target.params,
+            gen=gen_status,
+            build=build_status,
+            tests={k: tests[k] for k in ("passed", "failed", "skipped")} if tests else None,
+            cycles=cycles,
+        )
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with open(out_dir / "summary.json", "w") as f:
+        json.dump(summary, f, indent=1)
+    print(f"summary: {out_dir / 'summary.json'}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
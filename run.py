@@ -1,23 +1,52 @@
 #!/usr/bin/env python3
 import argparse
 import inspect
+import json
 import os
-import re
 import shutil
 import subprocess
 import sys
-from math import ceil, log2
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from subprocess import PIPE
 
 import toml
-from cocotb_test.simulator import Verilator
 
 SCRIPT_DIR = os.path.realpath(os.path.dirname(inspect.getfile(inspect.currentframe())))
 
 sys.path.append(SCRIPT_DIR)
 sys.path.append(os.path.curdir)
 
+from cocolight import perf_db
+from cocolight.bench import BenchBuild, format_bench, prepare_streams, run_bench
+from cocolight.bsc_tools import get_bsc_flags, get_used_mods, index_verilog_files
+from cocolight.build_cache import StageStamps, executable_id, hash_files, hash_items
+from cocolight.build_profiles import PROFILES, SIM_SPEED_FILE, read_results, record_sim_speed
+from cocolight.cycle_model import CYCLE_MODEL_ENV, CYCLE_MODEL_UPDATE_ENV, MODELS_FILE
+from cocolight.gtkwave import generate_translations
+from cocolight.journal import (
+    JOURNAL_ENV,
+    REPLAY_ENV,
+    VectorJournal,
+    failing_entries,
+    load_journal,
+    shrink_vector,
+    write_replay,
+)
+from cocolight.metrics import METRICS_ENV, format_metrics, load_metrics, summarize_metrics
+from cocolight.sampling_profiler import PROFILE_ENV
+from cocolight.sharding import discover_tests, merge_results, plan_jobs
+from cocolight.simulator import CachedVerilator
+from cocolight.state_trace import STATE_TRACE_ENV
+from cocolight.trace_control import TRACE_WINDOW_ENV, parse_windows
+from cocolight.utils import SHARD_ENV
+from cocolight.workload import (
+    CLOCK_MHZ_ENV,
+    WORKLOAD_ENV,
+    WORKLOAD_OPS_ENV,
+    WORKLOAD_REPORT_ENV,
+    load_histogram,
+)
+
 parser = argparse.ArgumentParser()
 parser.add_argument("design")
 parser.add_argument("--gen", action="store_true")
@@ -25,11 +54,133 @@ parser.add_argument(
     "--synthesis", action="store_true", help="Cleanup generated Verilog using vppreproc"
 )
 parser.add_argument("--debug", action="store_true", default=False)
+parser.add_argument(
+    "--build-profile",
+    choices=sorted(PROFILES),
+    help="Verilator build profile (default: trace with --debug, otherwise default): "
+    + "; ".join(f"{p.name}: {p.description}" for p in PROFILES.values()),
+)
+parser.add_argument(
+    "--threads", type=int, default=1, help="multi-threaded Verilated model (Verilator --threads N)"
+)
+parser.add_argument(
+    "--sim-speed-log",
+    metavar="FILE",
+    help=f"append simulated cycles per second of each test run to this JSON-lines file, e.g. {SIM_SPEED_FILE}"
+    " (not recorded if not given)",
+)
 parser.add_argument("--gtkwave", action="store_true")
 parser.add_argument("--seed", default="123", help="random seed (passed to cocotb)")
 parser.add_argument("--tests", nargs="+", help="Test functions to run")
+parser.add_argument(
+    "--jobs",
+    "-j",
+    type=int,
+    default=1,
+    help="run tests in N parallel simulations, splitting the vectors of sharded tests N-ways",
+)
+parser.add_argument(
+    "--seeds", nargs="+", help="run all tests with each of these random seeds (overrides --seed)"
+)
+parser.add_argument(
+    "--shard", metavar="I/N", help="only run the I-th of N shards of the test vectors"
+)
+parser.add_argument(
+    "--out-dir",
+    default=".",
+    help="directory of generated Verilog and bsc outputs (allows building designs side by side)",
+)
+parser.add_argument("--work-dir", help="working directory of the simulation")
+parser.add_argument(
+    "--param",
+    action="append",
+    default=[],
+    metavar="NAME=VALUE",
+    help="override a design parameter (bsc define), e.g. UNROLL_FACTOR=2",
+)
+parser.add_argument(
+    "--unset-param",
+    action="append",
+    default=[],
+    metavar="NAME",
+    help="don't define this design parameter (for `ifdef flags such as ASCON128A)",
+)
+parser.add_argument("--tb-module", help="cocotb testbench module (overrides the design's)")
+parser.add_argument(
+    "--compile-only", action="store_true", help="only build the Verilated model, don't run tests"
+)
+parser.add_argument(
+    "--replay",
+    metavar="JOURNAL",
+    help="rerun only the failing vectors recorded in a vector journal (journal.jsonl of an earlier run)",
+)
+parser.add_argument(
+    "--shrink",
+    metavar="JOURNAL",
+    help="find the smallest sizes for which the first failing vector of a journal still fails",
+)
+parser.add_argument(
+    "--trace-window",
+    action="append",
+    default=[],
+    metavar="WINDOW",
+    help="dump waveforms only around messages or sim-time windows: msg:N, msg:N-M, T0-T1 (ns)",
+)
+parser.add_argument(
+    "--workload",
+    metavar="CSV",
+    help="measure back-to-back throughput of a stream sampled from this histogram of operations and sizes"
+    " (columns: op,adBytes,msgBytes,count[,newKey])",
+)
+parser.add_argument(
+    "--workload-ops", type=int, default=1000, help="number of operations sampled from the --workload histogram"
+)
+parser.add_argument(
+    "--clock-mhz", type=float, default=100.0, help="clock frequency for the ops/sec estimate of --workload"
+)
+parser.add_argument(
+    "--bench",
+    metavar="KAT_DIR",
+    help="benchmark throughput of the Verilated model without cocotb, streaming the pdi.txt/sdi.txt of KAT_DIR"
+    " and checking its do.txt",
+)
+parser.add_argument(
+    "--bench-repeat", type=int, default=1, help="send the --bench test vectors this many times back-to-back"
+)
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="sample the Python stacks of the simulation and write a flamegraph (profile.folded, profile.svg)",
+)
+parser.add_argument(
+    "--state-trace",
+    metavar="FILE",
+    help="record the permutation states of the Python reference model into FILE (xoodyak, subterranean),"
+    " for python -m cocolight.state_trace FILE WAVEFORM",
+)
+parser.add_argument(
+    "--cycle-models",
+    default=MODELS_FILE,
+    help="cycle models file (relative to design directory) calibrated by measure_timings",
+)
+parser.add_argument(
+    "--update-cycle-model",
+    action="store_true",
+    help="store the calibrated cycle model even if measurements deviate from the stored one",
+)
+perf_db.add_arguments(parser)
 
 args = parser.parse_args()
+perf_db.check_arguments(parser, args)
+
+try:
+    trace_windows = parse_windows(",".join(args.trace_window))
+except ValueError as e:
+    parser.error(str(e))
+if args.profile and (args.jobs > 1 or args.seeds):
+    parser.error("--profile runs a single simulation, it can't be used with --jobs or --seeds")
+if args.state_trace and (args.jobs > 1 or args.seeds):
+    parser.error("--state-trace records a single simulation, it can't be used with --jobs or --seeds")
 
 with open("xedaproject.toml") as f:
     xp = toml.load(f)
@@ -43,118 +194,20 @@ if xeda_design is None:
         f"no design named {args.design} designs: {[d.get('name') for d in designs]}"
     )
 rtl_settings = xeda_design["rtl"]
+for param in args.param:
+    param_name, _, param_value = param.partition("=")
+    rtl_settings.setdefault("parameters", {})[param_name] = param_value
+for param_name in args.unset_param:
+    rtl_settings.get("parameters", {}).pop(param_name, None)
+# timings and cycle models are stored per variant (design and parameters)
+design_variant = perf_db.design_key(args.design, rtl_settings.get("parameters", {}))
 bluespec_sources = [
     f for f in rtl_settings["sources"] if f.endswith(".bsv") or f.endswith(".bs")
 ]
 
 
-def get_bsc_flags(cmd=["bsc"]):
-    def convert_value(v: str):
-        list_regex = re.compile(r"\s*\[(.*)\]\s*")
-        str_regex = re.compile(r'\s*"(.*)"\s*')
-        match = list_regex.match(v)
-        if match:
-            return [convert_value(s) for s in match.group(1).split(",")]
-        match = str_regex.match(v)
-        if match:
-            return match.group(1)
-        return v
-
-    cmd.append("-print-flags-raw")
-    kv_regex = re.compile(r"^\s+(\w+)\s=\s(.*),\s*$")
-    flags = {}
-    for line in (
-        subprocess.run(cmd, stdout=PIPE, check=True).stdout.decode("utf-8").splitlines()
-    ):
-        match = kv_regex.match(line)
-        if match:
-            flags[match.group(1)] = convert_value(match.group(2))
-    return flags
-
-
 if args.gtkwave:
-    import vcd
-    import vcd.gtkw
-
-    def tr_enum(fmt, *symbols):
-        sz = ceil(log2(len(symbols)))
-        if fmt == "hex":
-            sz = ceil(sz / 4)
-        if fmt == "dec":
-            sz = None
-
-        return fmt, sz, [(val, sym) for val, sym in enumerate(symbols)]
-
-    typedef_enum_re = re.compile(
-        r"\s*typedef\s+enum\s+{\s*([^}]+)\s*}\s*(\w+)\s*", re.MULTILINE | re.DOTALL
-    )
-
-    def val_to_int(v):
-        if isinstance(v, int):
-            return ceil(log2(v + 1)), v
-        m = re.match(r"(\d+)'(b|d|h|o)(\d+)", v)
-        if m:
-            sz = int(m.group(1))
-            base_char = m.group(2)
-            base = (
-                10
-                if base_char == "d"
-                else 2
-                if base_char == "b"
-                else 16
-                if base_char == "h"
-                else 8
-            )
-            return sz, int(m.group(3), base)
-        return None, int(v)
-
-    translations = {}
-
-    for bluespec_file in bluespec_sources:
-        with open(bluespec_file) as f:
-            content = f.read()
-
-            pkg_groups = next(re.finditer(r"\bpackage\s+(\w+)\b", content))
-            pkg = pkg_groups.group(1)
-
-            for td in typedef_enum_re.finditer(content):
-                print(f"td={td}")
-                td_body = td.group(1)
-                td_body = " ".join(
-                    [x.split("//")[0].strip() for x in td_body.split("\n")]
-                )
-                td_name = td.group(2)
-                kvs_l1 = [
-                    re.split(r"\s*=\s*", x.strip())
-                    for x in re.split(r"\s*,\s*", td_body.strip())
-                ]
-                print(f"kvs_l1={kvs_l1}")
-                kvs_l = [
-                    (x[0], x[1]) if len(x) == 2 else (x[0], i)
-                    for i, x in enumerate(kvs_l1)
-                ]
-                kvs = {k: val_to_int(v) for k, v in kvs_l}
-                print(f"kvs={kvs}")
-                values: list[int] = [v[0] for v in kvs.values() if v[0] is not None]
-                sz = max(values)
-                if not sz:
-                    print(len(kvs))
-                    sz = ceil(log2(len(kvs) + 1))
-                    print(f">>> sz={sz}")
-                fmt = "hex" if sz >= 4 else "bin"
-                translations[pkg + "::" + td_name] = (
-                    fmt,
-                    sz,
-                    [(v, k) for k, (szz, v) in kvs.items()],
-                )
-
-    for tr_type_name, (datafmt, sz, tr) in translations.items():
-        translate = vcd.gtkw.make_translation_filter(tr, datafmt=datafmt, size=sz)
-        gtkwave_dir = Path("gtkwave")
-        gtkwave_dir.mkdir(exist_ok=True, parents=True)
-        with open(gtkwave_dir / (tr_type_name + ".gwtr"), "w") as f:
-            print(f"writing translation of {tr_type_name} into {f.name}")
-            f.write(translate)
+    generate_translations(bluespec_sources, "gtkwave")
 
 BLUESPEC_PREFIX = os.environ.get("BLUESPEC_PREFIX")
 # bsc_exec = os.path.join(BLUESPEC_PREFIX, 'bin', 'bsc') if BLUESPEC_PREFIX else shutil.which("bsc")
@@ -170,8 +223,11 @@ lib_paths: list[str] = []
 
 lib_paths.insert(0, "+")
 
-vout_dir = Path.cwd() / "gen_rtl"
-bsc_out = Path.cwd() / "._bsc_"
+out_dir = Path(args.out_dir).absolute()
+vout_dir = out_dir / "gen_rtl"
+bsc_out = out_dir / "._bsc_"
+bsc_vdir = bsc_out / "verilog"  # Verilog generated by bsc, before flattening
+stamps = StageStamps(bsc_out / "stamps.json")
 
 bsc_flags = [
     "-steps-max-intervals",
@@ -230,6 +286,9 @@ else:
         "X",
     ]
 
+# project-specific flags, e.g. those of the own build scripts of xoodyak and subterranean
+bsc_flags += xp.get("cocolight", {}).get("bsc_flags", [])
+
 
 def prepend_to_file(filename, lines):
     with open(filename, "r+") as f:
@@ -238,29 +297,57 @@ def prepend_to_file(filename, lines):
         f.write("\n".join(lines) + "\n" + content)
 
 
-def get_used_mods(use_dir: Path, mod: str):
-    use_path = use_dir / f"{mod}.use"
-    uses = []
-    if use_path.exists():
-        with open(use_path) as f:
-            for l in f.readlines():
-                l = l.strip()
-                if l not in uses:
-                    uses.append(l)
-                    uses.extend([x for x in get_used_mods(use_dir, l) if x not in uses])
-    return uses
+def bluespec_dependencies(lib_dirs: list[str]) -> list[Path]:
+    """Bluespec sources of the design, and all other Bluespec files in its library directories"""
+    files = {Path(f).resolve() for f in bluespec_sources}
+    for d in [os.path.curdir] + lib_dirs:
+        if d == "+":
+            continue
+        for pattern in ("*.bsv", "*.bs"):
+            files.update(p.resolve() for p in Path(d).glob(pattern))
+    return sorted(files)
+
+
+def flatten_verilog(verilog_sources, verilog_defines, include_dir, out_file, synthesis) -> bool:
+    """Preprocess and concatenate `verilog_sources` into `out_file` using `verilator -E`,
+    optionally piped through `vppreproc --synthesis`, streaming to `out_file`.
+    Returns False if the synthesis cleanup was requested but could not be done."""
+    cmd = ["verilator", "-E", "-P", "--pp-comments"]
+    cmd += [str(src) for src in verilog_sources]
+    cmd += [f"-D{vd}" for vd in verilog_defines]
+    cmd += [f"-I{include_dir}"]
+
+    tmp_file = out_file.with_suffix(out_file.suffix + ".tmp")
+
+    if synthesis:
+        # install Verlog::Perl:  cpan install Verilog::Language
+        pp_cmd = ["vppreproc", "--noline", "--synthesis", "/dev/stdin"]
+        if shutil.which(pp_cmd[0]):
+            with open(tmp_file, "wb") as f:
+                flatten = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+                pp = subprocess.Popen(pp_cmd, stdin=flatten.stdout, stdout=f)
+                flatten.stdout.close()  # vppreproc gets SIGPIPE if verilator exits
+                pp_ret = pp.wait()
+                flatten_ret = flatten.wait()
+            if flatten_ret:
+                tmp_file.unlink()
+                raise subprocess.CalledProcessError(flatten_ret, cmd)
+            if not pp_ret:
+                os.replace(tmp_file, out_file)
+                return True
+            print(f"vppreproc failed with return code: {pp_ret}")
+        else:
+            print("vppreproc not found, skipping synthesis cleanup")
+
+    with open(tmp_file, "wb") as f:
+        subprocess.run(cmd, check=True, stdout=f)
+    os.replace(tmp_file, out_file)
+    return not synthesis
 
 
 def bsc_generate_verilog():
     top_file = bluespec_sources[-1]
     top = rtl_settings["top"]
-    # if not args.debug: pretty messed up! do not use!
-    if vout_dir.exists():
-        shutil.rmtree(vout_dir)
-    # if bsc_out.exists():
-    #     shutil.rmtree(bsc_out)
-    vout_dir.mkdir(exist_ok=True)
-    bsc_out.mkdir(exist_ok=True)
 
     for src in bluespec_sources:
         #     cmd = [bsc_exec] + bsc_flags + ['-u', src]
@@ -294,16 +381,10 @@ def bsc_generate_verilog():
             ":".join(lib_paths),
         ]
 
-    if vout_dir:
-        cmd += [
-            "-vdir",
-            str(vout_dir),
-        ]
-
     cmd += [
         # '-vsearch', ':'.join(verilog_paths),
         "-vdir",
-        str(vout_dir),
+        str(bsc_vdir),
         "-u",
         "-verilog",
         "-g",
@@ -311,98 +392,134 @@ def bsc_generate_verilog():
         top_file,
     ]
 
-    print(f'running {" ".join(cmd)}')
+    flags_digest = hash_items(executable_id(bsc_exec), cmd)
+    bsc_digest = hash_items(flags_digest, hash_files(bluespec_dependencies(lib_paths)))
 
-    try:
-        subprocess.run(cmd, check=True)
-    except Exception as e:
-        # print(f"bsc failed with return code: {e.args[0]}")
-        sys.exit(1)
+    if stamps.is_fresh("bsc", bsc_digest, [bsc_vdir / f"{top}.v"]):
+        print("Bluespec sources and bsc flags unchanged, skipping bsc")
+    else:
+        stamps.invalidate("bsc", "flatten")
+        if stamps.get("bsc-flags") != flags_digest:
+            # `bsc -u` only recompiles packages with modified sources, not on changes of flags or defines
+            for bo in bsc_out.glob("*.bo"):
+                bo.unlink()
+        if bsc_vdir.exists():
+            shutil.rmtree(bsc_vdir)
+        bsc_vdir.mkdir(parents=True)
+
+        print(f'running {" ".join(cmd)}')
 
-    flags = get_bsc_flags()
-    used_mods = get_used_mods(vout_dir, top)
+        try:
+            subprocess.run(cmd, check=True)
+        except Exception as e:
+            # print(f"bsc failed with return code: {e.args[0]}")
+            sys.exit(1)
+        stamps.update("bsc-flags", flags_digest)
+        stamps.update("bsc", bsc_digest)
+
+    out_file = vout_dir / f"{top}.v"
+
+    flags = get_bsc_flags(bsc_exec, bsc_out / "bsc_flags.json")
+    used_mods = get_used_mods(bsc_vdir, top)
     print(f"used_mods={used_mods}")
     verilog_paths = flags["vPath"]
     print(f"verilog_paths={verilog_paths}")
+    verilog_index = None
     verilog_sources = []
     used_mods = [top] + used_mods
     for use in used_mods:
         verilog_name = f"{use}.v"
-        if (vout_dir / verilog_name).exists():
-            verilog_sources.append(vout_dir / verilog_name)
+        if (bsc_vdir / verilog_name).exists():
+            verilog_sources.append(bsc_vdir / verilog_name)
         else:
-            for vpath in verilog_paths:
-                print(f"searching vpath={vpath}")
-                for vfile in Path(vpath).glob(os.path.join("**", verilog_name)):
-                    verilog_sources.append(vfile)
+            if verilog_index is None:
+                verilog_index = index_verilog_files(verilog_paths)
+            if verilog_name in verilog_index:
+                verilog_sources.append(verilog_index[verilog_name])
+            else:
+                print(f"WARNING: {verilog_name} not found in {verilog_paths}")
 
     print(f"verilog_sources={verilog_sources}")
-    # verilog_sources = list(vout_dir.glob('*.v'))
 
-    # for v in verilog_sources:
-    #     prepend_to_file(v, ['`define ' + vd for vd in verilog_defines])
-    cmd = ["verilator", "-E", "-P", "--pp-comments"]
-    cmd += [str(src) for src in verilog_sources]
-    cmd += [f"-D{vd}" for vd in verilog_defines]
-    cmd += [f"-I{vout_dir}"]
+    # keyed by the Verilog being flattened, not by the inputs of bsc: identical bsc output is reused
+    flatten_digest = hash_items(
+        executable_id(shutil.which("verilator")),
+        verilog_defines,
+        args.synthesis,
+        [str(src) for src in verilog_sources],
+        # all of bsc's output, as it's also searched for `include files
+        hash_files(sorted(set(verilog_sources) | set(bsc_vdir.glob("*.v")))),
+    )
 
-    out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE).stdout
-    out_file = vout_dir / f"{top}.v"
-    with open(out_file, "wb") as f:
-        f.write(out)
+    if stamps.is_fresh("flatten", flatten_digest, [out_file]):
+        print("Generated Verilog is up to date, skipping flattening")
+        print(f"output: {out_file}")
+        return top
 
-    if args.synthesis:
-        # install Verlog::Perl:  cpan install Verilog::Language
-        cmd = ["vppreproc", "--noline", "--synthesis", str(out_file)]
-        try:
-            out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE).stdout
-            out_file = vout_dir / f"{top}.v"
-            with open(out_file, "wb") as f:
-                f.write(out)
-        except Exception as e:
-            print(f"vppreproc failed with return code: {e.args[0]}")
+    stamps.invalidate("flatten")
+    # only the flattened Verilog is kept in vout_dir
+    vout_dir.mkdir(parents=True, exist_ok=True)
+    for f in vout_dir.glob("*.v"):
+        f.unlink()
+
+    if flatten_verilog(verilog_sources, verilog_defines, bsc_vdir, out_file, args.synthesis):
+        stamps.update("flatten", flatten_digest)
 
     print(f"output: {out_file}")
 
     return top
 
 
+def tb_module() -> str:
+    if args.tb_module:
+        return args.tb_module
+    tb_settings = xeda_design.get("tb", {})
+    cocotb_settings = tb_settings.get("cocotb")
+    if isinstance(cocotb_settings, dict) and "module" in cocotb_settings:
+        return cocotb_settings["module"]
+    tb_sources = [Path(f) for f in tb_settings.get("sources", []) if f.endswith(".py")]
+    if not tb_sources:
+        sys.exit(f"no cocotb testbench module specified for design {args.design}")
+    return tb_sources[0].stem
+
+
 def test_verilator():
     top = bsc_generate_verilog()
-    if not args.gen:
+    if args.bench:
+        run_bench_mode(top)
+    elif not args.gen:
         run_sim(top)
 
 
+def run_bench_mode(top):
+    kat_dir = Path(args.bench)
+    if not (kat_dir / "pdi.txt").exists():
+        sys.exit(f"no pdi.txt in {kat_dir}")
+    bench_dir = out_dir / "sim_build" / "bench"
+    extra_args = PROFILES[build_profile_name()].args(args.threads)
+    build = BenchBuild(list(vout_dir.glob("*.v")), top, extra_args, cache_dir=out_dir / "sim_build")
+    exe = build.build()
+    if args.compile_only:
+        return
+    streams = prepare_streams(kat_dir, bench_dir)
+    print(f"Benchmarking {kat_dir} x{args.bench_repeat} with {exe}")
+    result = run_bench(
+        exe, streams, repeat=args.bench_repeat, plus_args=["+verilator+seed+50", "+verilator+rand+reset+2"]
+    )
+    report = bench_dir / "bench.json"
+    with open(report, "w") as f:
+        json.dump(dict(result, design=args.design, kat=str(kat_dir)), f, indent=1)
+    print(format_bench(result))
+    print(f"Benchmark report: {report}")
+    if not result["passed"]:
+        sys.exit(1)
+
+
 def run_sim(top):
     verilog_sources = list(vout_dir.glob("*.v"))
-    extra_args = [
-        # '+define+BSV_POSITIVE_RESET=1',
-        # + [f'-I{p}' for p in verilog_paths],
-        # "-Wno-STMTDLY",
-        # "-Wno-INITIALDLY",
-        # "--x-assign",
-        # "unique",
-        # "--x-initial",
-        # "unique",  # perf: fast
-        # "-O3",
-    ]
-
-    if args.debug:
-        extra_args += [
-            "--trace",
-            "--trace-structs",
-            "--trace-max-array",
-            "64",
-            "--trace-underscore",
-            "--trace-max-width",
-            "512",
-        ]
-    else:
-        extra_args += [
-            "-O3",
-            # '--x-initial', 'unique',  # perf: fast, don't change
-            # '--x-assign', 'fast',  # perf: fast
-        ]
+    profile = PROFILES[build_profile_name()]
+    extra_args = profile.args(args.threads)
+    print(f"Verilator build profile: {profile.name} ({' '.join(extra_args)})")
 
     cocotb_env = dict(
         COCOTB_REDUCED_LOG_FMT="1",
@@ -410,15 +527,47 @@ def run_sim(top):
         RANDOM_SEED=args.seed,
     )
 
+    # measure_timings calibrates the cycle model of the design variant, stored next to xedaproject.toml
+    cocotb_env[CYCLE_MODEL_ENV] = str(Path(args.cycle_models).absolute())
+    if args.update_cycle_model:
+        cocotb_env[CYCLE_MODEL_UPDATE_ENV] = "1"
+    cocotb_env.update(perf_db.env(args, design_variant))
+
     test_functions = args.tests
 
+    if args.workload:
+        workload = Path(args.workload).absolute()
+        try:
+            load_histogram(workload)
+        except (OSError, ValueError, KeyError) as e:
+            sys.exit(f"invalid workload histogram {args.workload}: {e}")
+        report = out_dir / "sim_build" / "workload.json"
+        report.parent.mkdir(parents=True, exist_ok=True)
+        cocotb_env[WORKLOAD_ENV] = str(workload)
+        cocotb_env[WORKLOAD_OPS_ENV] = str(args.workload_ops)
+        cocotb_env[CLOCK_MHZ_ENV] = str(args.clock_mhz)
+        cocotb_env[WORKLOAD_REPORT_ENV] = str(report)
+        print(f"Workload report: {report}")
+        if not test_functions:
+            test_functions = ["workload_throughput"]
+
     if test_functions:
         print(f"Running the following test functions: {test_functions}")
         cocotb_env["TESTCASE"] = ",".join(test_functions)
 
-    if args.debug:
+    if args.shard:
+        cocotb_env[SHARD_ENV] = args.shard
+
+    if profile.waves:
         cocotb_env["WAVES"] = "1"
 
+    if args.state_trace:
+        cocotb_env[STATE_TRACE_ENV] = str(Path(args.state_trace).absolute())
+
+    if trace_windows:
+        print(f"Tracing only {', '.join(map(str, trace_windows))}")
+        cocotb_env[TRACE_WINDOW_ENV] = ",".join(args.trace_window)
+
     # COMPILE_ARGS
     # SIM_ARGS
     # RUN_ARGS
@@ -429,16 +578,221 @@ def run_sim(top):
     # PLUSARGS
     # SIM_BUILD
 
-    sim = Verilator(
+    sim_kwargs = dict(
         extra_args=extra_args,
-        extra_env=cocotb_env,
+        make_args=profile.make_args(),
         plus_args=["+verilator+seed+50", "+verilator+rand+reset+2"],
         verilog_sources=verilog_sources,
         toplevel=top,
-        module=xeda_design["tb"]["cocotb"]["module"],
+        module=tb_module(),
+        trace_control=bool(trace_windows),
+        cache_dir=out_dir / "sim_build",
+    )
+
+    if args.replay or args.shrink:
+        replay_failures(sim_kwargs, cocotb_env)
+        return
+
+    if not args.compile_only and (args.jobs > 1 or args.seeds):
+        run_sharded(sim_kwargs, cocotb_env)
+        return
+
+    # outputs of the run (results, waveforms, coverage, journal) stay out of the shared model directory
+    work_dir = Path(args.work_dir or out_dir / "sim_build").absolute()
+    work_dir.mkdir(parents=True, exist_ok=True)
+    sim_kwargs["work_dir"] = str(work_dir)
+    if not args.compile_only:
+        journal = work_dir / "journal.jsonl"
+        journal.unlink(missing_ok=True)
+        cocotb_env[JOURNAL_ENV] = str(journal)
+        print(f"Vector journal: {journal}")
+        metrics = work_dir / "metrics.jsonl"
+        metrics.unlink(missing_ok=True)
+        cocotb_env[METRICS_ENV] = str(metrics)
+        if args.profile:
+            # imported first by cocotb, the profiler samples the testbench module's code
+            sim_kwargs["module"] = f"cocolight.sampling_profiler,{sim_kwargs['module']}"
+            cocotb_env[PROFILE_ENV] = str(work_dir / "profile.folded")
+
+    sim = CachedVerilator(extra_env=cocotb_env, compile_only=args.compile_only, **sim_kwargs)
+
+    try:
+        sim.run()
+    finally:
+        if not args.compile_only:
+            results = read_results(sim.env.get("COCOTB_RESULTS_FILE"))
+            log_sim_speed(profile.name, extra_args, results, testbench_cycles(metrics))
+            write_metrics_summary([metrics], work_dir / "metrics.json")
+            if args.profile:
+                render_flamegraph(work_dir / "profile.folded")
+
+
+def write_metrics_summary(metrics_files, out_file):
+    snapshots = load_metrics(metrics_files)
+    if not snapshots:
+        return
+    summary = summarize_metrics(snapshots)
+    with open(out_file, "w") as f:
+        json.dump(summary, f, indent=1)
+    print(format_metrics(summary))
+    print(f"Test metrics: {out_file}")
+
+
+def render_flamegraph(folded: Path):
+    if not folded.exists():
+        print(f"no profile written to {folded}")
+        return
+    svg = folded.with_suffix(".svg")
+    flamegraph = shutil.which("flamegraph.pl") or shutil.which("inferno-flamegraph")
+    if flamegraph:
+        with open(folded) as f, open(svg, "w") as out:
+            subprocess.run([flamegraph, "--title", args.design], stdin=f, stdout=out, check=True)
+        print(f"Flamegraph: {svg}")
+    else:
+        print(f"flamegraph.pl not found, open {folded} with speedscope or flamegraph.pl")
+
+
+def build_profile_name() -> str:
+    if args.build_profile:
+        return args.build_profile
+    return "trace" if args.debug else "default"
+
+
+def testbench_cycles(metrics_file) -> dict:
+    """simulated cycles of each test, as counted by the testbench"""
+    tests = summarize_metrics(load_metrics([metrics_file]))["tests"]
+    return {test: m["sim_cycles"] for test, m in tests.items()}
+
+
+def log_sim_speed(profile, extra_args, results, cycles):
+    if not args.sim_speed_log or not results:
+        return
+    records = record_sim_speed(
+        args.sim_speed_log, design_variant, profile, extra_args, results, cycles, revision=perf_db.git_revision()
+    )
+    for r in records:
+        print(
+            f"{r['test']}: {r['sim_cycles']} cycles in {r['wall_seconds']:.1f} s,"
+            f" {r['cycles_per_sec'] or 0:,.0f} cycles/s ({profile} profile)"
+        )
+
+
+def run_sharded(sim_kwargs, cocotb_env):
+    module = sim_kwargs["module"]
+    tests = discover_tests(Path(*module.split(".")).with_suffix(".py"))
+    if args.tests:
+        tests = {t: tests.get(t, False) for t in args.tests}
+    jobs = plan_jobs(tests, args.seeds or [args.seed], max(args.jobs, 1))
+    print(f"Running {len(jobs)} simulation jobs on {args.jobs} workers")
+
+    # build the model once, all jobs share it
+    CachedVerilator(extra_env=cocotb_env, compile_only=True, **sim_kwargs).run()
+
+    shards_dir = out_dir / "sim_build" / "shards"
+
+    def run_job(job):
+        work_dir = shards_dir / job.dirname
+        work_dir.mkdir(parents=True, exist_ok=True)
+        journal = work_dir / "journal.jsonl"
+        journal.unlink(missing_ok=True)
+        metrics = work_dir / "metrics.jsonl"
+        metrics.unlink(missing_ok=True)
+        sim = CachedVerilator(
+            extra_env=dict(cocotb_env, **job.env(), **{JOURNAL_ENV: str(journal), METRICS_ENV: str(metrics)}),
+            work_dir=str(work_dir),
+            **sim_kwargs,
+        )
+        try:
+            sim.run()
+        except SystemExit:
+            pass  # failures are collected from the results file
+        return job, sim.env.get("COCOTB_RESULTS_FILE")
+
+    with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+        results = list(pool.map(run_job, jobs))
+
+    summary = merge_results(results, shards_dir / "results.xml", shards_dir / "results.json")
+    cycles = {}
+    for job in jobs:
+        job_cycles = testbench_cycles(shards_dir / job.dirname / "metrics.jsonl")
+        if job.test in job_cycles:
+            cycles[job.name] = job_cycles[job.test]
+    log_sim_speed(build_profile_name(), sim_kwargs["extra_args"], summary["tests"], cycles)
+    write_metrics_summary(sorted(shards_dir.glob("*/metrics.jsonl")), shards_dir / "metrics.json")
+    for t in summary["tests"]:
+        print(f"{t['status'].upper():8} {t['name']}  ({t['time']:.1f}s)")
+    print(
+        f"passed: {summary['passed']} failed: {summary['failed']} skipped: {summary['skipped']}"
+        f"  results: {shards_dir / 'results.xml'}"
     )
+    if summary["failed"]:
+        sys.exit(1)
+
 
-    sim.run()
+def run_vectors(sim_kwargs, cocotb_env, test, vectors, work_dir: Path) -> list:
+    """Run `vectors` in a fresh simulation of `test`. Returns the journal entries of the run."""
+    if work_dir.exists():
+        shutil.rmtree(work_dir)
+    work_dir.mkdir(parents=True)
+    replay_file = work_dir / "replay.jsonl"
+    journal = work_dir / "journal.jsonl"
+    write_replay(replay_file, test, vectors)
+    env = dict(cocotb_env, TESTCASE=test, **{REPLAY_ENV: str(replay_file), JOURNAL_ENV: str(journal)})
+    env.pop(SHARD_ENV, None)
+    sim = CachedVerilator(extra_env=env, work_dir=str(work_dir), **sim_kwargs)
+    try:
+        sim.run()
+    except SystemExit:
+        pass  # failures are read from the journal
+    return load_journal(journal) if journal.exists() else []
+
+
+def replay_failures(sim_kwargs, cocotb_env):
+    journal_file = Path(args.replay or args.shrink)
+    failing = failing_entries(load_journal(journal_file))
+    if not failing:
+        sys.exit(f"no failing vectors in {journal_file}")
+    replay_dir = out_dir / "sim_build" / "replay"
+    # build the model once, all runs share it
+    CachedVerilator(extra_env=cocotb_env, compile_only=True, **sim_kwargs).run()
+
+    if args.replay:
+        tests = {}
+        for e in failing:
+            tests.setdefault(e.test, []).append(e.vector)
+        still_failing = 0
+        for test, vectors in tests.items():
+            print(f"Replaying {len(vectors)} vectors of {test}: {', '.join(map(str, vectors))}")
+            entries = run_vectors(sim_kwargs, cocotb_env, test, vectors, replay_dir / test)
+            still_failing += len(failing_entries(entries))
+        print(f"{still_failing} of {len(failing)} replayed vectors failed")
+        sys.exit(1 if still_failing else 0)
+
+    first = failing[0]
+    test, vector = first.test, first.vector
+    print(f"Shrinking vector #{first.id} of {test}: {vector} ({first.status})")
+    runs = 0
+
+    def fails(v) -> bool:
+        nonlocal runs
+        runs += 1
+        entries = run_vectors(sim_kwargs, cocotb_env, test, [v], replay_dir / f"shrink-{runs}")
+        failed = any(e.status != "passed" for e in entries)
+        print(f"  [{runs}] {v}: {'FAIL' if failed else 'pass'}")
+        return failed
+
+    if not fails(vector):
+        sys.exit(f"vector {vector} does not fail when run on its own")
+    vector = shrink_vector(vector, fails)
+    replay_file = replay_dir / "minimal.jsonl"
+    replay_file.unlink(missing_ok=True)
+    journal = VectorJournal(replay_file, test)
+    journal.issued(first.id, vector)
+    journal.finished([first.id], [])
+    journal.close()
+    print(f"Smallest failing vector after {runs} runs: {vector}")
+    print(f"Replay with: {sys.argv[0]} {args.design} --replay {replay_file}")
+    sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -1,17 +1,23 @@
 #!/usr/bin/env python3
-from math import ceil, log2
-from cocotb_test.simulator import Verilator
 
 from pathlib import Path
 import subprocess
 import sys
 import os
-import re
 import shutil
 import argparse
 
 import toml
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from cocolight import perf_db
+from cocolight.bsc_tools import get_used_mods, index_verilog_files
+from cocolight.build_cache import StageStamps, executable_id, hash_files, hash_items
+from cocolight.gtkwave import generate_translations
+from cocolight.simulator import CachedVerilator
+from cocolight.state_trace import STATE_TRACE_ENV
+
 parser = argparse.ArgumentParser()
 parser.add_argument('design')
 parser.add_argument('--gen', action='store_true')
@@ -19,8 +25,12 @@ parser.add_argument('--debug', action='store_true', default=False)
 parser.add_argument('--gtkwave', action='store_true')
 parser.add_argument('--seed', default='123', help='random seed (passed to cocotb)')
 parser.add_argument('--tests', nargs='+', help='Test functions to run')
+parser.add_argument('--state-trace', metavar='FILE',
+                    help='record the permutation states of the Python reference model into FILE')
+perf_db.add_arguments(parser)
 
 args = parser.parse_args()
+perf_db.check_arguments(parser, args)
 
 with open('xedaproject.toml') as f:
     xp = toml.load(f)
@@ -34,72 +44,9 @@ bluespec_sources = [f for f in rtl_settings['sources']
                     if f.endswith('.bsv') or f.endswith('.bs')]
 
 if args.gtkwave:
-    import vcd
-    import vcd.gtkw
-
-    def tr_enum(fmt, *symbols):
-        sz = ceil(log2(len(symbols)))
-        if fmt == 'hex':
-            sz = ceil(sz / 4)
-        if fmt == 'dec':
-            sz = None
-
-        return fmt, sz, [(val, sym) for val, sym in enumerate(symbols)]
-
-    typedef_enum_re = re.compile(
-        r'\s*typedef\s+enum\s+{\s*([^}]+)\s*}\s*(\w+)\s*', re.MULTILINE | re.DOTALL)
-
-    def val_to_int(v):
-        if isinstance(v, int):
-            return ceil(log2(v+1)), v
-        m = re.match(r"(\d+)'(b|d|h|o)(\d+)", v)
-        if m:
-            sz = int(m.group(1))
-            base_char = m.group(2)
-            base = 10 if base_char == 'd' else 2 if base_char == 'b' else 16 if base_char == 'h' else 8
-            return sz, int(m.group(3), base)
-        return None, int(v)
-
-    translations = {}
-
-    for bluespec_file in bluespec_sources:
-        with open(bluespec_file) as f:
-            content = f.read()
-
-            pkg_groups = next(re.finditer(r'\bpackage\s+(\w+)\b', content))
-            pkg = pkg_groups.group(1)
-
-            for td in typedef_enum_re.finditer(content):
-                td_body = td.group(1)
-                td_body = ' '.join([x.split('//')[0].strip()
-                                    for x in td_body.split('\n')])
-                td_name = td.group(2)
-                kvs = [re.split('\s*=\s*', x.strip())
-                       for x in td_body.split(',')]
-                kvs = [(x[0], x[1]) if len(x) == 2 else (x[0], i)
-                       for i, x in enumerate(kvs)]
-                kvs = {k: val_to_int(v) for k, v in kvs}
-                values = [v[0] for v in kvs.values()]
-                sz = max(values)
-                if not sz:
-                    print(len(kvs))
-                    sz = ceil(log2(len(kvs)+1))
-                    print(f'>>> sz={sz}')
-                fmt = 'hex' if sz >= 4 else 'bin'
-                translations[pkg + '::' +
-                             td_name] = fmt, sz, [(v, k) for k, (szz, v) in kvs.items()]
-
-    for tr_type_name, (datafmt, sz, tr) in translations.items():
-        translate = vcd.gtkw.make_translation_filter(
-            tr, datafmt=datafmt, size=sz)
-        gtkwave_dir = Path('gtkwave')
-        gtkwave_dir.mkdir(exist_ok=True, parents=True)
-        with open(gtkwave_dir / (tr_type_name + '.gwtr'), 'w') as f:
-            print(f"writing translation of {tr_type_name} into {f.name}")
-            f.write(translate)
+    generate_translations(bluespec_sources, 'gtkwave')
     sys.exit(0)
 
-
 BLUESPEC_PREFIX = os.environ.get('BLUESPEC_PREFIX')
 bsc_exec = os.path.join(BLUESPEC_PREFIX, 'bin',
                         'bsc') if BLUESPEC_PREFIX else shutil.which("bsc")
@@ -171,31 +118,9 @@ def prepend_to_file(filename, lines):
         f.write('\n'.join(lines) + '\n' + content)
 
 
-def get_used_mods(use_dir: Path, mod: str):
-    use_path = use_dir / f'{mod}.use'
-    uses = []
-    if use_path.exists():
-        with open(use_path) as f:
-            for l in f.readlines():
-                l = l.strip()
-                if l not in uses:
-                    uses.append(l)
-                    uses.extend([x for x in get_used_mods(
-                        use_dir, l) if x not in uses])
-    return uses
-
-
 def bsc_generate_verilog():
     top_file = bluespec_sources[-1]
     top = rtl_settings['top']
-    if vout_dir.exists():
-        shutil.rmtree(vout_dir)
-    vout_dir.mkdir(exist_ok=False)
-    if not args.debug:
-        if bsc_out.exists():
-            shutil.rmtree(bsc_out)
-    bsc_out.mkdir(exist_ok=True)
-
     for src in bluespec_sources:
         #     cmd = [bsc_exec] + bsc_flags + ['-u', src]
         dirname, basename = os.path.split(src)
@@ -229,6 +154,22 @@ def bsc_generate_verilog():
         '-g', top, top_file
     ]
 
+    lib_dirs = [os.path.curdir] + [d for d in lib_paths if d != '+']
+    bsv_files = sorted({Path(f).resolve() for f in bluespec_sources} |
+                       {f.resolve() for d in lib_dirs for pat in ('*.bsv', '*.bs') for f in Path(d).glob(pat)})
+    gen_digest = hash_items(executable_id(bsc_exec), cmd, hash_files(bsv_files))
+    if StageStamps(vout_dir / '.stamps.json').is_fresh('gen', gen_digest, [vout_dir / f'{top}.v']):
+        print('Bluespec sources and bsc flags unchanged, skipping generation')
+        return top
+
+    if vout_dir.exists():
+        shutil.rmtree(vout_dir)
+    vout_dir.mkdir(exist_ok=False)
+    if not args.debug:
+        if bsc_out.exists():
+            shutil.rmtree(bsc_out)
+    bsc_out.mkdir(exist_ok=True)
+
     print(f'running {" ".join(cmd)}')
 
     try:
@@ -239,12 +180,11 @@ def bsc_generate_verilog():
 
     used_mods = get_used_mods(vout_dir, top)
     print(f'used_mods={used_mods}')
+    verilog_index = index_verilog_files(verilog_paths)
     for use in used_mods:
         verilog_name = f'{use}.v'
-        if not (vout_dir / verilog_name).exists():
-            for vpath in verilog_paths:
-                for vfile in Path(vpath).glob(os.path.join('**', verilog_name)):
-                    shutil.copy(vfile, vout_dir)
+        if not (vout_dir / verilog_name).exists() and verilog_name in verilog_index:
+            shutil.copy(verilog_index[verilog_name], vout_dir)
 
     verilog_sources = list(vout_dir.glob('*.v'))
 
@@ -254,6 +194,8 @@ def bsc_generate_verilog():
 
     print(f'verilog_sources={verilog_sources}')
 
+    StageStamps(vout_dir / '.stamps.json').update('gen', gen_digest)
+
     return top
 
 
@@ -294,6 +236,11 @@ def run_sim(top):
                       RANDOM_SEED=args.seed,
                       )
 
+    cocotb_env.update(perf_db.env(args, perf_db.design_key(args.design, rtl_settings.get('parameters', {}))))
+
+    if args.state_trace:
+        cocotb_env[STATE_TRACE_ENV] = str(Path(args.state_trace).absolute())
+
     test_functions = args.tests
 
     if test_functions:
@@ -313,14 +260,14 @@ def run_sim(top):
     # PLUSARGS
     # SIM_BUILD
 
-    sim = Verilator(extra_args=extra_args,
-                    extra_env=cocotb_env,
-                    plus_args=[
-                        '+verilator+seed+50', '+verilator+rand+reset+2'],
-                    verilog_sources=verilog_sources,
-                    toplevel=top,
-                    module=xeda_design['tb']['cocotb']['module']
-                    )
+    sim = CachedVerilator(extra_args=extra_args,
+                          extra_env=cocotb_env,
+                          plus_args=[
+                              '+verilator+seed+50', '+verilator+rand+reset+2'],
+                          verilog_sources=verilog_sources,
+                          toplevel=top,
+                          module=xeda_design['tb']['cocotb']['module']
+                          )
 
     sim.run()
 
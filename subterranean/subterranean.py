@@ -74,6 +74,9 @@ class Subterranean(LwcAead, LwcHash):
     CRYPTO_ABYTES = 16
     CRYPTO_HASH_BYTES = 32
 
+    # optional recorder of round states (e.g. `cocolight.state_trace.StateTrace(33)`)
+    trace = None
+
     def __init__(self, debug=False) -> None:
         self.debug = debug
         self.initialize_state()
@@ -101,7 +104,18 @@ class Subterranean(LwcAead, LwcHash):
         def pi(state):
             return [state[(12*i) % SUBTERRANEAN_SIZE] for i in range(SUBTERRANEAN_SIZE)]
 
+        if self.trace is None:
+            self.state = pi(theta(iota(chi(self.state))))
+            return
+        from cocolight.state_trace import PERM_IN, PERM_OUT  # only traced when cocolight is used
+
+        self.trace.record_int(PERM_IN, 0, self.state_value())
         self.state = pi(theta(iota(chi(self.state))))
+        self.trace.record_int(PERM_OUT, 0, self.state_value())
+
+    def state_value(self) -> int:
+        """state as the value of the RTL state register (bit i is state[i])"""
+        return sum(b << i for i, b in enumerate(self.state))
 
     def duplex(self, sigma=[]):
         self.round()
@@ -1,5 +1,3 @@
-import random
-from random import randint
 import sys
 import os
 import inspect
@@ -26,17 +24,25 @@ except:
 
 try:
     from .cocolight import *
+    from .cocolight.state_trace import trace_from_env
 except:
     cocolight_dir = os.path.dirname(script_dir)
     if cocolight_dir not in sys.path:
         sys.path.append(cocolight_dir)
     from cocolight import *
+    from cocolight.state_trace import trace_from_env
+
+# round states of the Python model (run.py --state-trace), the C reference can't be traced
+Subterranean.trace = trace_from_env(33)
+
+
+def reference(debug=False):
+    return SubterraneanCref() if Subterranean.trace is None else Subterranean(debug)
 
 
 class SubterraneanRefCheckerTb(LwcRefCheckerTb):
     def __init__(self, dut: SimHandleBase, debug, max_in_stalls, max_out_stalls, min_out_stalls=None, supports_hash=True) -> None:
-        # ref = Subterranean(debug)
-        ref = SubterraneanCref()
+        ref = reference(debug)
         super().__init__(dut, ref, debug=debug, max_in_stalls=max_in_stalls,
                          max_out_stalls=max_out_stalls, min_out_stalls=min_out_stalls, supports_hash=supports_hash)
 
@@ -56,32 +62,37 @@ async def blanket_test_simple(dut: SimHandleBase):
 
     tb = LwcRefCheckerTb(
         dut,
-        ref=SubterraneanCref(),
+        ref=reference(debug),
         debug=debug, max_in_stalls=max_in_stalls, max_out_stalls=max_out_stalls, min_out_stalls=min_out_stalls, supports_hash=False)
 
-    short_size = [0, 1, 15, 16, 43, 61, 64, 179] + [randint(2, 180) for _ in range(20)]
+    short_size = [0, 1, 15, 16, 43, 61, 64, 179] + [tb.sizes.randint(2, 180) for _ in range(20)]
 
     # adsizes = [0, 1, 15, 10]
     # xtsizes = [0, 15]
 
     await tb.start()
 
-    for ad_size, xt_size in itertools.product(short_size, short_size):
+    for ad_size, xt_size in tb.shard_items(itertools.product(short_size, short_size)):
         await tb.xdec_test(ad_size=ad_size, ct_size=xt_size)
         await tb.xenc_test(ad_size=ad_size, pt_size=xt_size)
         # await tb.xhash_test(xt_size)
 
-    for ad_size, pt_size in itertools.product(short_size, short_size):
+    for ad_size, pt_size in tb.shard_items(itertools.product(short_size, short_size)):
         await tb.xenc_test(ad_size=ad_size, pt_size=pt_size)
 
-    for ad_size, pt_size in itertools.product(short_size, short_size):
+    for ad_size, pt_size in tb.shard_items(itertools.product(short_size, short_size)):
         await tb.xdec_test(ad_size=ad_size, ct_size=pt_size)
 
-    await tb.xdec_test(ad_size=1536, ct_size=0)
-    await tb.xenc_test(ad_size=1536, pt_size=0)
-    await tb.xdec_test(ad_size=0, ct_size=1536)
-    await tb.xenc_test(ad_size=0, pt_size=1536)
-    await tb.xdec_test(ad_size=0, ct_size=1535)
+    # long messages, split between shards like the vectors above
+    long_vectors = [
+        Vector('dec', ad_size=1536, xt_size=0),
+        Vector('enc', ad_size=1536, xt_size=0),
+        Vector('dec', ad_size=0, xt_size=1536),
+        Vector('enc', ad_size=0, xt_size=1536),
+        Vector('dec', ad_size=0, xt_size=1535),
+    ]
+    for vector in tb.shard_items(long_vectors):
+        await tb.run_vector(vector)
 
     await tb.launch_monitors()
     await tb.launch_drivers()
@@ -108,29 +119,32 @@ async def randomized_tests(dut: SimHandleBase):
         dut, debug=debug, max_in_stalls=5, max_out_stalls=5)
 
     sizes = [0, 1, 15, 16, 17,  23, 24, 25, 31, 32, 33, 43, 44, 45, 47, 48, 49, 61, 64, 65, 67] + \
-        [randint(2, 500) for _ in range(30)]
+        [tb.sizes.randint(2, 500) for _ in range(30)]
 
     sizes = list(set(sizes))  # unique
-    random.shuffle(sizes)
+    tb.sizes.shuffle(sizes)
     sizes2 = sizes[:]
-    random.shuffle(sizes2)
+    tb.sizes.shuffle(sizes2)
 
     await tb.start()
 
-    for size1, size2 in itertools.product(sizes, sizes2):
-        op = randint(0, 2 if supports_hash else 1)
-        if (op == 0):
-            await tb.xenc_test(ad_size=size1, pt_size=size2)
-        elif (op == 1):
-            await tb.xdec_test(ad_size=size1, ct_size=size2)
-        else:
-            await tb.xhash_test(hm_size=size1)
+    # draw ops of all vectors before sharding, so that all shards see the same test plan
+    vectors = [
+        (size1, size2, tb.sizes.randint(0, 2 if supports_hash else 1))
+        for size1, size2 in itertools.product(sizes, sizes2)
+    ]
 
-    await tb.launch_monitors()
-    await tb.launch_drivers()
+    def vectors_of_shard():
+        for size1, size2, op in tb.shard_items(vectors):
+            if op == 0:
+                yield Vector('enc', ad_size=size1, xt_size=size2)
+            elif op == 1:
+                yield Vector('dec', ad_size=size1, xt_size=size2)
+            else:
+                yield Vector('hash', hm_size=size1)
 
-    await tb.join_drivers()
-    await tb.join_monitors()
+    # vectors are generated, encoded and checked on the fly, keeping only a few messages in memory
+    await tb.run_stream(vectors_of_shard())
 
 
 @cocotb.test()
@@ -279,6 +293,8 @@ async def measure_timings(dut: SimHandleBase, supportsHash=False):
         all_results[op] = results
 
     pprint(all_results)
+    tb.check_timings(all_results)
+    tb.calibrate_cycle_model(dict(AD=block_sizes['AD'], XT=block_sizes['PT/CT'], HM=block_sizes['HM']))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# Design space exploration: builds the variants of designs (hand-made variant files, and combinations of bsc
+# parameter values), runs the timing plan of each one, and tabulates cycles/byte against an area proxy.
+# Builds go through `run.py` with one output directory per variant, so bsc and Verilator results are cached
+# across sweeps, and variants are scheduled on a pool of workers like `regress.py`.
+import argparse
+import csv
+import fnmatch
+import itertools
+import json
+import os
+import random
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+sys.path.append(str(SCRIPT_DIR))
+
+from cocolight.area import area_proxy
+from cocolight.build_cache import StageStamps, hash_files, hash_items
+from cocolight.cycle_model import CycleModel, load_model
+from cocolight.workload import load_histogram, sample_workload, workload_report
+from regress import RUN_PY, Target, Task, discover_targets, run_dag
+
+UNDEFINED = "-"  # parameter value of --param: leave the bsc define undefined, for `ifdef flags
+
+parser = argparse.ArgumentParser(
+    description="sweep design variants, and tabulate cycles/byte vs area",
+    epilog="other arguments are passed to run.py, e.g. --build-profile fast",
+)
+parser.add_argument(
+    "designs", nargs="+", help="designs and variants to sweep, e.g. 'Ascon/*' or 'xoodyak/Xoodyak*'"
+)
+parser.add_argument(
+    "--param",
+    action="append",
+    default=[],
+    metavar="NAME=V1,V2",
+    help="values of a bsc parameter, swept on all selected designs (not on variant files),"
+    f" e.g. UNROLL_FACTOR=1,2,4, IO_WIDTH=32,64 or ASCON128A={UNDEFINED},1 ({UNDEFINED}: not defined)",
+)
+parser.add_argument(
+    "--tb-module",
+    action="append",
+    default=[],
+    metavar="[NAME=VALUE:]MODULE",
+    help="testbench of swept designs, the first matching rule applies, e.g. ASCON128A=1:ascon128a_tb",
+)
+parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="number of parallel workers")
+parser.add_argument("--tests", nargs="+", default=["measure_timings"], help="timing plan of each variant")
+parser.add_argument("--seed", default="123")
+parser.add_argument(
+    "--workload", metavar="CSV", help="cycles/byte of this workload histogram (default: long messages)"
+)
+parser.add_argument("--workload-ops", type=int, default=10000)
+parser.add_argument("--out-dir", default="sweep_build", help="output directory")
+parser.add_argument("--force", action="store_true", help="re-run timing plans even if their inputs are unchanged")
+parser.add_argument("--list", action="store_true", help="list the variants and exit")
+
+
+def parse_param_spec(spec: str):
+    """NAME=V1,V2,... -> (NAME, [V1, V2, ...])"""
+    name, sep, values = spec.partition("=")
+    if not sep or not name or not values:
+        raise ValueError(f"invalid parameter values {spec!r}, expected NAME=V1,V2,...")
+    return name, [None if v == UNDEFINED else v for v in values.split(",")]
+
+
+def select_tb_module(params: Dict[str, Optional[str]], rules: List[str]) -> Optional[str]:
+    for rule in rules:
+        cond, sep, module = rule.rpartition(":")
+        if sep:
+            name, _, value = cond.partition("=")
+            actual = params.get(name)
+            if (UNDEFINED if actual is None else actual) != (value or UNDEFINED):
+                continue
+        return module
+    return None
+
+
+def sweep_targets(targets: List[Target], param_specs: List[str], tb_rules: List[str]) -> List[Target]:
+    """variant files as they are, and each design with all combinations of the swept parameter values"""
+    specs = [parse_param_spec(s) for s in param_specs]
+    if not specs:
+        return targets
+    swept = [t for t in targets if not t.params]
+    points = [t for t in targets if t.params]
+    for t in swept:
+        for values in itertools.product(*(values for _, values in specs)):
+            params = dict(zip((name for name, _ in specs), values))
+            label = ",".join(f"{k}={UNDEFINED if v is None else v}" for k, v in params.items())
+            tb_module = select_tb_module(params, tb_rules) or t.tb_module
+            points.append(t._replace(name=f"{t.name}[{label}]", params=params, tb_module=tb_module))
+    return points
+
+
+def pareto_front(results: List[dict], x="cycles_per_byte", y="area") -> List[dict]:
+    """results not beaten in both `x` and `y` (lower is better) by another result"""
+    valid = [r for r in results if r.get(x) is not None and r.get(y) is not None]
+
+    def dominates(a, b):
+        return a[x] <= b[x] and a[y] <= b[y] and (a[x] < b[x] or a[y] < b[y])
+
+    return [r for r in valid if not any(dominates(o, r) for o in valid)]
+
+
+def common_area_unit(results: List[dict]):
+    """Use register bits as the area of all results if they don't share one unit (yosys failed for some)"""
+    if len({r["area_unit"] for r in results if r.get("area") is not None}) > 1:
+        print("yosys LUT counts are not available for all variants, comparing register bits")
+        for r in results:
+            if r.get("area") is not None:
+                r.update(area=r["reg_bits"], area_unit="reg bits")
+
+
+def throughput(model: CycleModel, workload: Optional[str], num_ops: int) -> dict:
+    """cycles/byte of long messages (encryption) or of a workload histogram, predicted by a cycle model"""
+    if workload:
+        vectors = sample_workload(load_histogram(workload), num_ops, random.Random(1))
+        cycles = int(round(sum(model.predict_vector(v) for v in vectors)))
+        return dict(cycles_per_byte=workload_report(vectors, cycles, 100.0)["cycles_per_byte"])
+    xt_block = model.coefficients.get("xt_block")
+    xt_bytes = model.block_bytes.get("XT")
+    result = dict(cycles_per_byte=xt_block / xt_bytes if xt_block is not None and xt_bytes else None)
+    if "enc" in model.overhead:
+        result["enc_16_16_cycles"] = model.predict("enc", 16, 16)
+    return result
+
+
+def pareto_table(results: List[dict]) -> str:
+    rows = sorted(results, key=lambda r: (r.get("area") is None, r.get("area") or 0, r.get("cycles_per_byte") or 0))
+    width = max([len(r["name"]) for r in rows] + [7])
+    lines = [f"  {'variant':{width}}  {'cycles/byte':>11}  {'area':>8}  {'unit':8}  status"]
+    for r in rows:
+        cpb = "-" if r.get("cycles_per_byte") is None else f"{r['cycles_per_byte']:.3f}"
+        area = "-" if r.get("area") is None else r["area"]
+        mark = "*" if r.get("pareto") else " "
+        lines.append(f"{mark} {r['name']:{width}}  {cpb:>11}  {area:>8}  {r.get('area_unit', ''):8}  {r['status']}")
+    lines.append("* Pareto-optimal: no other passing variant has both fewer cycles/byte and less area")
+    return "\n".join(lines)
+
+
+def main():
+    args, run_args = parser.parse_known_args()
+    out_dir = Path(args.out_dir).absolute()
+    targets = discover_targets(SCRIPT_DIR)
+    targets = [t for t in targets if any(fnmatch.fnmatch(t.name, p) for p in args.designs)]
+    try:
+        targets = sweep_targets(targets, args.param, args.tb_module)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.list:
+        for t in targets:
+            params = " ".join(f"{k}={UNDEFINED if v is None else v}" for k, v in t.params.items())
+            print(f"{t.name:48} design={t.design} tb={t.tb_module} {params}")
+        return
+    if not targets:
+        sys.exit("no designs found")
+
+    tb_deps = sorted((SCRIPT_DIR / "cocolight").glob("*.py"))
+    tasks: List[Task] = []
+    target_tasks: Dict[str, Dict[str, Task]] = {}
+    for target in targets:
+        target_dir = out_dir / target.name
+        logs = target_dir / "logs"
+        models_file = target_dir / "cycle_models.json"
+        base_cmd = [sys.executable, str(RUN_PY)] + target.run_args(target_dir) + run_args
+        gen = Task(f"{target.name}: gen", base_cmd + ["--gen"], target.root, logs / "gen.log")
+        tasks.append(gen)
+        target_tasks[target.name] = dict(gen=gen)
+        if not target.tb_module:
+            continue
+        cmd = base_cmd + ["--tests", *args.tests, "--seed", args.seed, "--cycle-models", str(models_file)]
+        cmd += ["--update-cycle-model"]  # each run calibrates the model of the variant's current RTL
+        cmd += ["--perf-db", str(target_dir / "perf_db.jsonl")]
+
+        def timing_digest(target_dir=target_dir, target=target, cmd=cmd):
+            if args.force:
+                return None
+            return hash_items(
+                cmd,
+                hash_files(sorted((target_dir / "gen_rtl").glob("*.v"))),
+                hash_files([target.tb_file] + tb_deps),
+            )
+
+        timing = Task(
+            f"{target.name}: timing",
+            cmd,
+            target.root,
+            logs / "timing.log",
+            deps=[gen],
+            cache=timing_digest,
+            stamps=StageStamps(target_dir / "timing_stamps.json"),
+            outputs=[models_file],
+        )
+        tasks.append(timing)
+        target_tasks[target.name]["timing"] = timing
+
+    print(f"Sweeping {len(targets)} variants ({len(tasks)} tasks) on {args.jobs} workers")
+    run_dag(tasks, args.jobs)
+
+    results = []
+    for target in targets:
+        target_dir = out_dir / target.name
+        stages = target_tasks[target.name]
+        timing = stages.get("timing")
+        ok = stages["gen"].ok and timing is not None and timing.ok
+        result = dict(
+            name=target.name,
+            design=target.design,
+            params=target.params,
+            tb_module=target.tb_module,
+            status="passed" if ok else timing.status if timing else stages["gen"].status,
+        )
+        verilog = sorted((target_dir / "gen_rtl").glob("*.v"))
+        if stages["gen"].ok and verilog:
+            result.update(area_proxy(verilog, target.rtl_settings().get("top", "lwc")))
+        model = load_model(target_dir / "cycle_models.json", target.design_key) if ok else None
+        if model is not None:
+            result.update(throughput(model, args.workload, args.workload_ops))
+        results.append(result)
+    common_area_unit(results)
+    front = {r["name"] for r in pareto_front([r for r in results if r["status"] == "passed"])}
+    for r in results:
+        r["pareto"] = r["name"] in front
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with open(out_dir / "sweep.json", "w") as f:
+        json.dump(results, f, indent=1)
+    fields = ["name", "design", "status", "pareto", "cycles_per_byte", "enc_16_16_cycles", "area", "area_unit"]
+    fields += ["reg_bits", "luts", "ffs"]
+    with open(out_dir / "sweep.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
+    print()
+    print(pareto_table(results))
+    print(f"results: {out_dir / 'sweep.csv'}")
+    if any(not t.ok for t in tasks):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
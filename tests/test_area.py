@@ -0,0 +1,53 @@
+from cocolight.area import area_proxy, register_bits
+
+VERILOG = """
+module mkRound(CLK, EN, D, Q);
+  parameter WIDTH = 4;
+  parameter DEPTH = WIDTH / 2;
+  input CLK, EN;
+  input [WIDTH - 1 : 0] D;
+  output [WIDTH - 1 : 0] Q;
+  reg [WIDTH - 1 : 0] state;
+  reg [7:0] buffer [0:DEPTH - 1];
+  wire [WIDTH - 1 : 0] next;
+  reg comb;  // only assigned with blocking assignments: not a register
+  always @(*) comb = EN;
+  always @(posedge CLK)
+  begin
+    if (EN) state <= D;
+    buffer[0] <= 8'hFF;
+  end
+  assign Q = state;
+endmodule
+
+module mkTop(CLK, RST_N);
+  input CLK, RST_N;
+  /* reg [99:0] commented; */
+  reg [31:0] counter;
+  reg flag;
+  always @(posedge CLK)
+    if (!RST_N) counter <= 32'd0; else counter <= counter + 32'd1;
+  always @(posedge CLK) flag <= RST_N;
+  mkRound #(.WIDTH(8'd16)) wide(.CLK(CLK), .EN(flag), .D(), .Q());
+  mkRound narrow(.CLK(CLK), .EN(flag), .D(), .Q());
+  mkMissing missing(.CLK(CLK));
+endmodule
+"""
+
+
+def test_register_bits(tmp_path):
+    path = tmp_path / "mkTop.v"
+    path.write_text(VERILOG)
+    top = 32 + 1
+    wide = 16 + 8 * 8  # overridden WIDTH, DEPTH derived from it
+    narrow = 4 + 8 * 2
+    assert register_bits([path], "mkRound") == narrow
+    assert register_bits([path], "mkTop") == top + wide + narrow
+    assert register_bits([path], "mkMissing") == 0
+
+
+def test_area_proxy_without_yosys(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", str(tmp_path))
+    path = tmp_path / "mkTop.v"
+    path.write_text(VERILOG)
+    assert area_proxy([path], "mkRound") == dict(reg_bits=20, area=20, area_unit="reg bits")
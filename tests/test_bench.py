@@ -0,0 +1,61 @@
+from pathlib import Path
+
+from cocolight.bench import read_kat_stream, reset_port, stream_stats
+from cocolight.hw_api import OpCode, SegmentHeader, SegmentType
+
+KAT_DIR = Path(__file__).resolve().parent.parent / "Ascon" / "KAT_ascon128"
+
+
+def instruction(op: OpCode) -> int:
+    return int(op) << 28
+
+
+def segment(typ: SegmentType, size: int, last=0, eot=1) -> list:
+    return [SegmentHeader(typ, size, last=last, eot=eot, eoi=0).to_word32()] + [0] * -(-size // 4)
+
+
+def test_read_kat_stream(tmp_path):
+    path = tmp_path / "do.txt"
+    path.write_text("# comment\n\nHDR = 5200000F\nDAT = 0123456789ABCDEF\nDAT = 01XX4567\nSTT = E0000000\n")
+    assert read_kat_stream(path) == [
+        (0x5200000F, 0xFFFFFFFF),
+        (0x01234567, 0xFFFFFFFF),
+        (0x89ABCDEF, 0xFFFFFFFF),
+        (0x01004567, 0xFF00FFFF),
+        (0xE0000000, 0xFFFFFFFF),
+    ]
+
+
+def test_stream_stats():
+    pdi = (
+        [instruction(OpCode.ACTKEY), instruction(OpCode.ENC)]
+        + segment(SegmentType.NPUB, 16)
+        + segment(SegmentType.AD, 5)
+        + segment(SegmentType.PT, 9, last=1)
+        + [instruction(OpCode.DEC)]
+        + segment(SegmentType.NPUB, 16)
+        + segment(SegmentType.AD, 0)
+        + segment(SegmentType.CT, 3)
+        + segment(SegmentType.TAG, 16, last=1)
+        + [instruction(OpCode.HASH)]
+        + segment(SegmentType.HM, 0, last=1)
+    )
+    assert stream_stats(pdi) == dict(ops=dict(enc=1, dec=1, hash=1), bytes=5 + 9 + 3)
+
+
+def test_stream_stats_of_kat():
+    kats = KAT_DIR / "timing_tests"
+    stats = stream_stats([w for w, _ in read_kat_stream(kats / "pdi.txt")])
+    with open(kats / "do.txt") as f:
+        statuses = sum(line.startswith("STT") for line in f)
+    assert sum(stats["ops"].values()) == statuses
+
+
+def test_reset_port(tmp_path):
+    lwc = tmp_path / "lwc.v"
+    lwc.write_text("module lwc(input clk, input rst_n, input [31:0] pdi_data);\nendmodule\n")
+    core = tmp_path / "core.v"
+    core.write_text("module mkCore(CLK, RST_N, rst);\n  input rst;\nendmodule\n")
+    assert reset_port([core, lwc], "lwc") == "rst_n"
+    assert reset_port([core, lwc], "mkCore") == "rst"
+    assert reset_port([core], "lwc") == "rst"
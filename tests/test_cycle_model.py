@@ -0,0 +1,59 @@
+import itertools
+
+import pytest
+
+from cocolight.cycle_model import CycleModel, OpSample, load_model, load_models, save_model
+
+BLOCK_BYTES = dict(AD=8, XT=8, HM=8)
+OVERHEAD = dict(enc=20, dec=22, hash=30)
+
+
+def cycles(op, ad_size, xt_size, hm_size, new_key):
+    """a core with known costs: 12 cycles per AD block, 13 per PT/CT block, 9 per HM block, 16 per key"""
+    blocks = lambda n: -(-n // 8)
+    if op == "hash":
+        return OVERHEAD[op] + 9 * blocks(hm_size)
+    return OVERHEAD[op] + 12 * blocks(ad_size) + 13 * blocks(xt_size) + 16 * new_key
+
+
+def samples():
+    for op, ad_size, xt_size, new_key in itertools.product(("enc", "dec"), (0, 1, 8, 20), (0, 7, 16, 33), (True, False)):
+        yield OpSample(op, ad_size, xt_size, 0, new_key, cycles(op, ad_size, xt_size, 0, new_key))
+    for hm_size in (0, 1, 8, 9, 64):
+        yield OpSample("hash", 0, 0, hm_size, True, cycles("hash", 0, 0, hm_size, True))
+
+
+def test_fit_recovers_linear_model():
+    model = CycleModel.fit(samples(), BLOCK_BYTES)
+    assert model.max_error == pytest.approx(0, abs=1e-6)
+    assert model.overhead == pytest.approx(OVERHEAD)
+    assert model.coefficients == pytest.approx(dict(ad_block=12, xt_block=13, hm_block=9, key_load=16))
+    assert model.predict("enc", 100, 1000) == pytest.approx(cycles("enc", 100, 1000, 0, True))
+    assert model.predict("dec", 3, 5, new_key=False) == pytest.approx(cycles("dec", 3, 5, 0, False))
+    assert model.predict("hash", hm_size=200) == pytest.approx(cycles("hash", 0, 0, 200, True))
+    with pytest.raises(KeyError):
+        model.predict("dec_fail", 1, 1)
+
+
+def test_undetermined_terms_and_deviations():
+    # key is always loaded: its cost can't be told apart from the overhead
+    model = CycleModel.fit((s for s in samples() if s.new_key and s.op == "enc"), BLOCK_BYTES)
+    assert model.coefficients["key_load"] is None
+    assert model.coefficients["hm_block"] is None
+    assert model.predict("enc", 8, 8) == pytest.approx(cycles("enc", 8, 8, 0, True))
+    slow = OpSample("enc", 8, 8, 0, True, cycles("enc", 8, 8, 0, True) + 10)
+    close = OpSample("enc", 20, 33, 0, True, cycles("enc", 20, 33, 0, True) + 1)
+    assert [d.sample for d in model.deviations([slow, close], tolerance=0.05)] == [slow]
+
+
+def test_save_and_load_models(tmp_path):
+    path = tmp_path / "cycle_models.json"
+    assert load_model(path, "Ascon") is None
+    model = CycleModel.fit(samples(), BLOCK_BYTES, revision="abc")
+    save_model(path, "Ascon", model)
+    save_model(path, "Ascon[UNROLL_FACTOR=2]", CycleModel.fit(samples(), BLOCK_BYTES))
+    assert sorted(load_models(path)) == ["Ascon", "Ascon[UNROLL_FACTOR=2]"]
+    loaded = load_model(path, "Ascon")
+    assert loaded.info["revision"] == "abc"
+    assert loaded.predict("enc", 17, 33) == pytest.approx(model.predict("enc", 17, 33))
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]  # no temporary files left behind
@@ -0,0 +1,23 @@
+from cocolight.gtkwave import parse_bsv_types
+
+SOURCE = """
+package Types;
+
+typedef enum { Idle, Busy = 010, Done } State deriving (Bits, Eq);
+typedef enum { A = 'h3, B = 4'b0001, C = 'd12 } Code deriving (Bits, Eq);
+typedef enum { X = 2'sb01 } Broken deriving (Bits, Eq);
+
+endpackage
+"""
+
+
+def test_enum_literals():
+    types = parse_bsv_types(SOURCE)["types"]
+    assert types["State"] == dict(kind="enum", values=[["Idle", 0], ["Busy", 10], ["Done", 11]], width=4)
+    assert types["Code"] == dict(kind="enum", values=[["A", 3], ["B", 1], ["C", 12]], width=4)
+
+
+def test_unparsable_enum_is_skipped(capsys):
+    types = parse_bsv_types(SOURCE)["types"]
+    assert "Broken" not in types
+    assert "Skipping GTKWave translation of Broken" in capsys.readouterr().out
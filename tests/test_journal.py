@@ -0,0 +1,85 @@
+from cocolight.journal import (
+    Vector,
+    VectorJournal,
+    failing_entries,
+    load_journal,
+    load_replay,
+    shrink_candidates,
+    shrink_vector,
+    write_replay,
+)
+
+
+def test_journal_round_trip(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    enc = Vector("enc", ad_size=3, xt_size=17, seed=1, in_seed=2, out_seed=3, new_key=True, key_seed=4)
+    dec_fail = Vector("dec_fail", ad_size=0, xt_size=5, seed=5, corrupt="ct", corrupt_bit=9)
+    journal = VectorJournal(path, "test_enc_dec")
+    journal.plan(dict(seed=123, test="test_enc_dec"))
+    journal.issued(0, enc)
+    journal.issued(1, dec_fail)
+    journal.finished([1], [])
+    journal.close()
+    journal = VectorJournal(path, "randomized_tests")
+    journal.issued(0, Vector("hash", hm_size=7, seed=6))
+    journal.issued(1, Vector("enc", ad_size=0, xt_size=0, seed=7))
+    journal.finished([], [1])
+    journal.close()
+    journal = VectorJournal(path, "test_hash")
+    journal.issued(0, Vector("hash", hm_size=0, seed=8))  # the simulation crashed before the test finished
+    journal.close()
+
+    entries = load_journal(path)
+    assert [(e.test, e.id, e.status) for e in entries] == [
+        ("test_enc_dec", 0, "passed"),
+        ("test_enc_dec", 1, "failed"),
+        ("randomized_tests", 0, "passed"),
+        ("randomized_tests", 1, "incomplete"),
+        ("test_hash", 0, "unknown"),
+    ]
+    assert entries[0].vector == enc
+    assert entries[1].vector == dec_fail
+
+
+def test_failing_entries(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = VectorJournal(path, "t")
+    for i in range(3):
+        journal.issued(i, Vector("enc", ad_size=i, xt_size=i))
+    journal.finished([2], [1])
+    journal.close()
+    entries = load_journal(path)
+    assert [e.id for e in failing_entries(entries)] == [2]  # failed vectors first
+    assert [e.id for e in failing_entries(e for e in entries if e.id != 2)] == [1]
+    assert failing_entries(e for e in entries if e.id == 0) == []
+
+
+def test_replay_round_trip(tmp_path):
+    path = tmp_path / "replay.jsonl"
+    vectors = [Vector("dec", ad_size=1, xt_size=2, seed=3, new_key=False, key_seed=5), Vector("hash", hm_size=4)]
+    write_replay(path, "test_enc_dec", vectors)
+    assert load_replay(path, "test_enc_dec") == vectors
+    assert load_replay(path, "test_hash") == []
+
+
+def test_shrink_candidates():
+    assert shrink_candidates(0) == []
+    assert shrink_candidates(1) == [0]
+    assert shrink_candidates(2) == [0, 1]
+    assert shrink_candidates(100) == [0, 25, 50, 99]
+    for n in range(50):
+        assert all(c < n for c in shrink_candidates(n))
+
+
+def test_shrink_vector():
+    tried = []
+
+    def fails(v):  # fails with at least 3 bytes of AD and any ciphertext
+        tried.append(v)
+        return v.ad_size >= 3 and v.xt_size > 0
+
+    vector = Vector("dec", ad_size=100, xt_size=77, seed=1)
+    assert shrink_vector(vector, fails) == vector._replace(ad_size=3, xt_size=1)
+    assert all(v.seed == 1 for v in tried)
+    assert shrink_vector(Vector("hash", hm_size=10), lambda v: v.hm_size >= 10) == Vector("hash", hm_size=10)
+    assert shrink_vector(Vector("hash", hm_size=10), lambda v: True) == Vector("hash", hm_size=0)
@@ -0,0 +1,40 @@
+import importlib
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+from cocolight.lwc_tlm import LwcTlm, do_words, read_kat_words
+
+ASCON_DIR = Path(__file__).resolve().parent.parent / "Ascon"
+KAT_DIR = ASCON_DIR / "KAT_ascon128"
+
+
+@pytest.fixture(scope="module")
+def ascon_ref(tmp_path_factory):
+    """C reference of Ascon-128, as used by the Ascon testbench (built by cffi in the working directory)"""
+    if not (shutil.which("cc") or shutil.which("gcc")):
+        pytest.skip("no C compiler to build the Ascon reference")
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("cffi"))
+    sys.path.insert(0, str(ASCON_DIR))
+    try:
+        yield importlib.import_module("ascon128_tb").ref
+    finally:
+        sys.path.remove(str(ASCON_DIR))
+        os.chdir(cwd)
+
+
+@pytest.mark.parametrize("kats", ["kats_for_verification", "timing_tests"])
+def test_tlm_matches_do_txt(ascon_ref, kats):
+    tlm = LwcTlm(ascon_ref)
+    actual = do_words(tlm.run(read_kat_words(KAT_DIR / kats / "pdi.txt"), read_kat_words(KAT_DIR / kats / "sdi.txt")))
+    expected = read_kat_words(KAT_DIR / kats / "do.txt")
+    assert len(actual) == len(expected)
+    # None: words the model does not predict
+    mismatches = [i for i, (a, e) in enumerate(zip(actual, expected)) if a is not None and a != e]
+    assert not mismatches, f"first mismatching do word: {mismatches[0]}"
+    assert sum(a is not None for a in actual) > len(actual) // 2
+    assert tlm.ops
@@ -0,0 +1,40 @@
+import itertools
+
+from cocolight.rng import RngStreams
+from cocolight.utils import SHARD_ENV
+
+
+def issue_plan(streams: RngStreams) -> dict:
+    """seeds of the vectors of a plan shaped like the testbenches' blanket tests, by (plan item, op)"""
+    ad_sizes = [0, 1, 15, 16, 33]
+    xt_sizes = ad_sizes + [0, 1, 17]  # duplicate sizes, as in the testbenches
+    seeds = {}
+    for i, (ad_size, xt_size) in streams.shard_items(enumerate(itertools.product(ad_sizes, xt_sizes))):
+        seeds[i, "dec"] = streams.vector_seeds("dec", ad_size, xt_size, None)
+        seeds[i, "enc"] = streams.vector_seeds("enc", ad_size, xt_size, None)
+        seeds[i, "enc", 2] = streams.vector_seeds("enc", ad_size, xt_size, None)
+    for i, hm_size in streams.shard_items(enumerate([0, 1, 1, 7])):
+        seeds[i, "hash"] = streams.vector_seeds("hash", None, None, hm_size)
+    for i, (op, ad_size, xt_size) in streams.shard_items(enumerate([("dec", 1536, 0), ("enc", 0, 1536)])):
+        seeds[i, "long"] = streams.vector_seeds(op, ad_size, xt_size, None)
+    return seeds
+
+
+def test_vector_seeds_independent_of_sharding(monkeypatch):
+    monkeypatch.delenv(SHARD_ENV, raising=False)
+    full = issue_plan(RngStreams(123, "randomized_tests"))
+    assert len({s["seed"] for s in full.values()}) == len(full)
+    merged = {}
+    for shard in range(3):
+        monkeypatch.setenv(SHARD_ENV, f"{shard}/3")
+        seeds = issue_plan(RngStreams(123, "randomized_tests"))
+        assert not merged.keys() & seeds.keys()  # each vector is issued by a single shard
+        merged.update(seeds)
+    assert merged == full
+
+
+def test_vector_seeds_depend_on_test_and_seed():
+    a = RngStreams(123, "test_a").vector_seeds("enc", 1, 2, None)
+    assert a == RngStreams(123, "test_a").vector_seeds("enc", 1, 2, None)
+    assert a != RngStreams(123, "test_b").vector_seeds("enc", 1, 2, None)
+    assert a != RngStreams(124, "test_a").vector_seeds("enc", 1, 2, None)
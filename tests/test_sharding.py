@@ -0,0 +1,83 @@
+import json
+import xml.etree.ElementTree as ET
+
+from cocolight.sharding import ShardJob, discover_tests, merge_results, plan_jobs
+from cocolight.utils import SHARD_ENV
+
+TB = '''
+import cocotb
+from cocotb import test
+
+
+@cocotb.test()
+async def randomized_tests(dut):
+    tb = RefCheckerTb(dut)
+    for ad_size, xt_size in tb.shard_items(sizes):
+        pass
+
+
+@test
+async def kats(dut):
+    pass
+
+
+async def helper(dut):
+    pass
+'''
+
+
+def junit(path, *testcases):
+    suites = ET.Element("testsuites")
+    suite = ET.SubElement(suites, "testsuite")
+    for name, child in testcases:
+        tc = ET.SubElement(suite, "testcase", name=name, time="1.5", sim_time_ns="100")
+        if child:
+            ET.SubElement(tc, child)
+    ET.ElementTree(suites).write(path)
+    return path
+
+
+def test_discover_tests(tmp_path):
+    tb = tmp_path / "tb.py"
+    tb.write_text(TB)
+    assert discover_tests(tb) == dict(randomized_tests=True, kats=False)
+
+
+def test_plan_jobs():
+    tests = dict(randomized_tests=True, kats=False)
+    jobs = plan_jobs(tests, ["1", "2"], 3)
+    assert [j.name for j in jobs if j.seed == "1"] == [
+        "randomized_tests[seed=1][0/3]",
+        "randomized_tests[seed=1][1/3]",
+        "randomized_tests[seed=1][2/3]",
+        "kats[seed=1]",
+    ]
+    assert len(jobs) == 8
+    assert len({j.dirname for j in jobs}) == len(jobs)
+    assert jobs[1].env() == {"TESTCASE": "randomized_tests", "RANDOM_SEED": "1", SHARD_ENV: "1/3"}
+    assert SHARD_ENV not in jobs[3].env()
+    assert plan_jobs(tests, ["1"], 1) == [ShardJob("randomized_tests", "1"), ShardJob("kats", "1")]
+
+
+def test_merge_results(tmp_path):
+    jobs = plan_jobs(dict(randomized_tests=True, kats=False), ["1"], 2)
+    bad = tmp_path / "bad.xml"
+    bad.write_text("<testsuites")
+    results = [
+        (jobs[0], junit(tmp_path / "0.xml", ("randomized_tests", None))),
+        (jobs[1], junit(tmp_path / "1.xml", ("randomized_tests", "failure"))),
+        (jobs[2], bad),  # simulator crashed while writing its results
+    ]
+    summary = merge_results(results, tmp_path / "results.xml", tmp_path / "results.json")
+    assert (summary["passed"], summary["failed"], summary["skipped"]) == (1, 2, 0)
+    assert [(t["name"], t["status"]) for t in summary["tests"]] == [
+        ("randomized_tests[seed=1][0/2]", "passed"),
+        ("randomized_tests[seed=1][1/2]", "failed"),
+        ("kats[seed=1]", "failed"),
+    ]
+    assert summary["tests"][0]["time"] == 1.5
+    with open(tmp_path / "results.json") as f:
+        assert json.load(f)["tests"][1]["shard"] == [1, 2]
+    suite = ET.parse(tmp_path / "results.xml").find("testsuite")
+    assert (suite.get("tests"), suite.get("failures")) == ("3", "2")
+    assert suite.findall("testcase")[2].find("error") is not None
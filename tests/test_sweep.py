@@ -0,0 +1,36 @@
+from sweep import common_area_unit, pareto_front
+
+
+def result(name, cycles_per_byte, area, **kwargs):
+    return dict(name=name, cycles_per_byte=cycles_per_byte, area=area, **kwargs)
+
+
+def test_pareto_front():
+    small = result("small", 10.0, 100)
+    fast = result("fast", 2.0, 400)
+    balanced = result("balanced", 5.0, 200)
+    dominated = result("dominated", 6.0, 250)
+    tie = result("tie", 5.0, 200)  # equal in both: neither dominates the other
+    same_area = result("same_area", 12.0, 100)  # as small as `small` but slower
+    failed = result("failed", None, 50)
+    results = [small, fast, balanced, dominated, tie, same_area, failed]
+    assert [r["name"] for r in pareto_front(results)] == ["small", "fast", "balanced", "tie"]
+    assert [r["name"] for r in pareto_front(results, y="reg_bits")] == []
+    assert pareto_front([]) == []
+
+
+def test_common_area_unit():
+    results = [
+        result("a", 1.0, 300, area_unit="LUT", reg_bits=1000),
+        result("b", 2.0, 900, area_unit="reg bits", reg_bits=900),
+        result("c", 3.0, None, area_unit="reg bits", reg_bits=None),
+    ]
+    common_area_unit(results)
+    assert [r["area"] for r in results] == [1000, 900, None]
+    assert results[0]["area_unit"] == "reg bits"
+    luts = [
+        result("a", 1.0, 300, area_unit="LUT", reg_bits=1000),
+        result("b", 2.0, 200, area_unit="LUT", reg_bits=10),
+    ]
+    common_area_unit(luts)
+    assert [r["area"] for r in luts] == [300, 200]
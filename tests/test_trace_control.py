@@ -0,0 +1,42 @@
+import pytest
+
+from cocolight.trace_control import TraceControl, TraceWindow, parse_windows
+
+
+def test_parse_windows():
+    assert parse_windows("msg:12, m:3-5,1000-5000,t:7, time:1-1,") == [
+        TraceWindow("msg", 12, 12),
+        TraceWindow("msg", 3, 5),
+        TraceWindow("time", 1000, 5000),
+        TraceWindow("time", 7, None),
+        TraceWindow("time", 1, 1),
+    ]
+    assert parse_windows("") == []
+    assert str(TraceWindow("msg", 3, 5)) == "messages 3..5"
+    assert str(TraceWindow("time", 7, None)) == "7.. ns"
+
+
+@pytest.mark.parametrize("spec", ["msg:5-3", "cycle:10", "msg:", "t:abc", "10-x", "msg:1-2-3"])
+def test_parse_windows_invalid(spec):
+    with pytest.raises(ValueError, match="invalid trace window"):
+        parse_windows(spec)
+
+
+def test_message_windows():
+    # no cocolight_trace in this process: requests only update the state
+    trace = TraceControl(parse_windows("msg:2-3"))
+    assert not trace.available
+    assert [trace.selected(i) for i in (None, 1, 2, 3, 4)] == [False, False, True, True, False]
+    trace.message_started(1)
+    assert not trace.on
+    trace.message_started(2)
+    trace.message_started(3)
+    trace.message_done(2)
+    assert trace.on
+    trace.message_done(3)
+    assert not trace.on
+    trace.add_messages(7)
+    assert trace.selected(7) and not trace.selected(8)
+    with trace.window():
+        assert trace.on
+    assert not trace.on
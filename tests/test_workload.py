@@ -0,0 +1,58 @@
+import random
+from collections import Counter
+
+import pytest
+
+from cocolight.journal import Vector
+from cocolight.workload import WorkloadBin, load_histogram, sample_workload, workload_report
+
+HISTOGRAM = """op,adBytes,msgBytes,count,newKey
+enc,16,64,120
+dec,0,1500,30,0
+hash,,64,5
+enc,1,1,0
+"""
+
+
+def test_load_histogram(tmp_path):
+    path = tmp_path / "workload.csv"
+    path.write_text(HISTOGRAM)
+    assert load_histogram(path) == [
+        WorkloadBin("enc", 16, 64, 120.0, True),
+        WorkloadBin("dec", 0, 1500, 30.0, False),
+        WorkloadBin("hash", 0, 64, 5.0, True),
+    ]
+    path.write_text("op,adBytes,msgBytes,count\nmac,0,0,1\n")
+    with pytest.raises(ValueError):
+        load_histogram(path)
+
+
+def test_sample_workload_matches_histogram():
+    bins = [WorkloadBin("enc", 16, 64, 2), WorkloadBin("dec", 0, 1500, 1, False), WorkloadBin("hash", 0, 7, 1)]
+    vectors = sample_workload(bins, 10, random.Random(1))
+    assert len(vectors) == 10
+    # shares 5, 2.5, 2.5: the remaining operation goes to the first of the largest remainders
+    assert Counter(vectors) == {
+        Vector("enc", ad_size=16, xt_size=64, new_key=True): 5,
+        Vector("dec", ad_size=0, xt_size=1500, new_key=False): 3,
+        Vector("hash", hm_size=7): 2,
+    }
+    assert sample_workload(bins, 10, random.Random(1)) == vectors
+    assert sorted(sample_workload(bins, 10, random.Random(2))) == sorted(vectors)
+
+
+def test_sample_workload_keeps_rare_bins():
+    bins = [WorkloadBin("enc", 0, 16, 1000), WorkloadBin("hash", 0, 16, 1)]
+    assert Counter(v.op for v in sample_workload(bins, 100, random.Random(0))) == dict(enc=100)
+    assert Counter(v.op for v in sample_workload(bins, 1001, random.Random(0))) == dict(enc=1000, hash=1)
+    with pytest.raises(ValueError):
+        sample_workload([WorkloadBin("enc", 0, 16, 0)], 10, random.Random(0))
+
+
+def test_workload_report():
+    vectors = [Vector("enc", ad_size=16, xt_size=64), Vector("dec", ad_size=0, xt_size=20, new_key=False)]
+    report = workload_report(vectors, cycles=500, clock_mhz=100.0)
+    assert report["bytes"] == 100
+    assert report["key_loads"] == 1
+    assert report["cycles_per_byte"] == 5.0
+    assert report["ops_per_sec"] == pytest.approx(2 / 5e-6)
@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 
+import argparse
+import os
+import re
 import sys
-import tempfile
+from typing import NamedTuple
 
 def chunks(x, n):
     return [x[i:i+n] for i in range(0, len(x), n)]
@@ -143,24 +146,91 @@ values = [
     "1d5071dd 26e158a0 d05e5388 5dab2203 - 4e3da82a ccbadf9b 485287e0 72c2eba9 - ba76117e 04fab562 a686824e f9433538",
 ]
 
-def main(argv):
-    while True:
-        line = sys.stdin.readline()
-        if not line:
-            return 0
+class StateFormat(NamedTuple):
+    """layout of a permutation state displayed as `planes` planes of `plane_lanes` lanes, each lane
+    `lane_bytes` bytes (little-endian), and of the `label_width`-character labels of reference model traces.
+    `known` states are highlighted even without a trace."""
+    planes: int
+    plane_lanes: int
+    lane_bytes: int
+    label_width: int = 16
+    known: tuple = ()
+
+    def trace_re(self):
+        """label and state of a state printed by the reference model ("<label> <state>")"""
+        lane = f"[0-9a-f]{{{2 * self.lane_bytes}}}"
+        plane = f"{lane}(?: {lane}){{{self.plane_lanes - 1}}}"
+        state = f"{plane}(?: - {plane}){{{self.planes - 1}}}"
+        return re.compile(f"^(.{{{self.label_width}}}) ({state})\\s*$")
+
+
+# Xoodoo states, as printed by `Cyclist.dump_state` ("<label:16> <state>")
+FORMATS = {'xoodoo': StateFormat(planes=3, plane_lanes=4, lane_bytes=4, known=tuple(values))}
+
+# file(s) with trace of the reference model, separated by os.pathsep
+TRACE_ENV = "XOODYAK_STATE_TRACE"
+
+CACHE_SIZE = 1 << 16
+
 
-        b = list(reversed(chunks(line.strip(),2)))
-        planes = chunks(["".join(list(reversed(x))) for x in chunks(b, 4)], 4)
-        line = " - ".join(" ".join(p) for p in planes).lower()
+def load_trace(path, table, trace_re):
+    with open(path) as f:
+        for line in f:
+            m = trace_re.match(line)
+            if m and table.get(m.group(2)) is None:
+                table[m.group(2)] = m.group(1).strip()
 
-        try:
-            line = f"?{COLORS[values.index(line)]}?" + line
-        except:
-            pass
 
-        sys.stdout.write(f'{line}\n')
+def make_table(trace_files, fmt):
+    """state -> (color, label) of the known states of `fmt` and of the states in the traces"""
+    table = {v: None for v in fmt.known}
+    trace_re = fmt.trace_re()
+    for path in trace_files:
+        if os.path.exists(path):
+            load_trace(path, table, trace_re)
+    return {state: (COLORS[i % len(COLORS)], label) for i, (state, label) in enumerate(table.items())}
+
+
+def format_state(hex_value, fmt, table, cache):
+    """lanes of a state value (hex, as displayed by GTKWave) in the format of the reference model traces"""
+    out = cache.get(hex_value)
+    if out is None:
+        b = list(reversed(chunks(hex_value, 2)))
+        lanes = ["".join(list(reversed(x))) for x in chunks(b, fmt.lane_bytes)]
+        out = " - ".join(" ".join(p) for p in chunks(lanes, fmt.plane_lanes)).lower()
+        if out in table:
+            color, label = table[out]
+            out = f"?{color}?" + (f"{label}: " if label else "") + out
+        if len(cache) >= CACHE_SIZE:
+            cache.clear()
+        cache[hex_value] = out
+    return out
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='GTKWave translate filter process of permutation states')
+    parser.add_argument('traces', nargs='*', help='reference model traces (also: $XOODYAK_STATE_TRACE)')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='xoodoo')
+    args = parser.parse_args(argv[1:])
+    fmt = FORMATS[args.format]
+    trace_files = args.traces + [p for p in os.environ.get(TRACE_ENV, "").split(os.pathsep) if p]
+    table = make_table(trace_files, fmt)
+    cache = {}
+    fd = sys.stdin.fileno()
+    pending = b""
+    while True:
+        # GTKWave may send several values before reading back: translate all complete lines at once
+        data = os.read(fd, 1 << 16)
+        lines = (pending + data).split(b"\n")
+        pending = lines.pop()
+        if not data and pending.strip():
+            lines.append(pending)  # last value without a newline
+        out = "".join(format_state(l.decode().strip(), fmt, table, cache) + "\n" for l in lines)
+        sys.stdout.write(out)
         sys.stdout.flush()
-    return 0
+        if not data:
+            return 0
+
 
 if __name__ == '__main__':
 	sys.exit(main(sys.argv))
@@ -94,6 +94,10 @@ class State:
     def __str__(self):
         return " - ".join(str(x) for x in self.planes)
 
+    def to_bytes(self) -> bytes:
+        """state as bytes of the little-endian value of the RTL state register"""
+        return b"".join(lane.to_bytes(4, "little") for plane in self.planes for lane in plane.lanes)
+
     def set_zero(self):
         for i in range(self.NROWS):
             for j in range(Plane.NCOLUMNS):
@@ -128,6 +132,9 @@ class State:
 
 
 class Xoodoo:
+    # optional recorder of permutation states (e.g. `cocolight.state_trace.StateTrace(48)`)
+    trace = None
+
     def __init__(self):
         self.state = State()
         rc_s = []
@@ -150,8 +157,18 @@ class Xoodoo:
         self.state.set_zero()
 
     def permute(self, r=12):
+        trace = self.trace
+        if trace is None:
+            for i in range(0, r):
+                self.round(i)
+            return
+        from cocolight.state_trace import PERM_IN, PERM_OUT, ROUND_OUT  # only traced when cocolight is used
+
+        trace.record(PERM_IN, 0, self.state.to_bytes())
         for i in range(0, r):
             self.round(i)
+            trace.record(ROUND_OUT, i, self.state.to_bytes())
+        trace.record(PERM_OUT, r - 1, self.state.to_bytes())
 
     def round(self, i):
         # reference to state
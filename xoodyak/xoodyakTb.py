@@ -1,5 +1,3 @@
-import random
-from random import randint
 import sys
 import os
 import inspect
@@ -19,27 +17,33 @@ script_dir = os.path.realpath(os.path.dirname(
 
 try:
     from .pyxoodyak import Xoodyak
+    from .pyxoodyak.xoodyak import Xoodoo
     from .pyxoodyak.xoodyak_cref import XoodyakCref
 except:
     cocolight_dir = script_dir
     if cocolight_dir not in sys.path:
         sys.path.append(cocolight_dir)
     from pyxoodyak import Xoodyak
+    from pyxoodyak.xoodyak import Xoodoo
     from pyxoodyak.xoodyak_cref import XoodyakCref
 
 try:
     from .cocolight import *
+    from .cocolight.state_trace import trace_from_env
 except:
     cocolight_dir = os.path.dirname(script_dir)
     if cocolight_dir not in sys.path:
         sys.path.insert(0, cocolight_dir)
     from cocolight import *
+    from cocolight.state_trace import trace_from_env
+
+# permutation states of the Python model (run.py --state-trace), the C reference can't be traced
+Xoodoo.trace = trace_from_env(48)
 
 
 class XoodyakRefCheckerTb(LwcRefCheckerTb):
     def __init__(self, dut: SimHandleBase, debug, max_in_stalls, max_out_stalls) -> None:
-        # ref = Xoodyak(debug)
-        ref = XoodyakCref()
+        ref = XoodyakCref() if Xoodoo.trace is None else Xoodyak(debug)
         super().__init__(dut, ref, debug=debug, max_in_stalls=max_in_stalls,
                          max_out_stalls=max_out_stalls)
 
@@ -57,22 +61,27 @@ async def blanket_test_simple(dut: SimHandleBase):
         dut, debug=debug, max_in_stalls=10, max_out_stalls=10)
 
     short_size = [0, 1, 15, 16, 43, 61, 64, 179] + \
-        [randint(2, 180) for _ in range(20)]
+        [tb.sizes.randint(2, 180) for _ in range(20)]
 
     await tb.start()
 
-    for ad_size, pt_size in itertools.product(short_size, short_size):
+    for ad_size, pt_size in tb.shard_items(itertools.product(short_size, short_size)):
         await tb.xdec_test(ad_size=ad_size, ct_size=pt_size)
         await tb.xhash_test(pt_size)
 
-    for ad_size, pt_size in itertools.product(short_size, short_size):
+    for ad_size, pt_size in tb.shard_items(itertools.product(short_size, short_size)):
         await tb.xenc_test(ad_size=ad_size, pt_size=pt_size)
 
-    await tb.xdec_test(ad_size=1536, ct_size=0)
-    await tb.xenc_test(ad_size=1536, pt_size=0)
-    await tb.xdec_test(ad_size=0, ct_size=1536)
-    await tb.xenc_test(ad_size=0, pt_size=1536)
-    await tb.xdec_test(ad_size=0, ct_size=1535)
+    # long messages, split between shards like the vectors above
+    long_vectors = [
+        Vector('dec', ad_size=1536, xt_size=0),
+        Vector('enc', ad_size=1536, xt_size=0),
+        Vector('dec', ad_size=0, xt_size=1536),
+        Vector('enc', ad_size=0, xt_size=1536),
+        Vector('dec', ad_size=0, xt_size=1535),
+    ]
+    for vector in tb.shard_items(long_vectors):
+        await tb.run_vector(vector)
 
     await tb.launch_monitors()
     await tb.launch_drivers()
@@ -97,29 +106,32 @@ async def randomized_tests(dut: SimHandleBase):
         dut, debug=debug, max_in_stalls=5, max_out_stalls=5)
 
     sizes = [0, 1, 15, 16, 17,  23, 24, 25, 31, 32, 33, 43, 44, 45, 47, 48, 49, 61, 64, 65, 67] + \
-        [randint(2, 300) for _ in range(30)]
+        [tb.sizes.randint(2, 300) for _ in range(30)]
 
     sizes = list(set(sizes))  # unique
-    random.shuffle(sizes)
+    tb.sizes.shuffle(sizes)
     sizes2 = sizes[:]
-    random.shuffle(sizes2)
+    tb.sizes.shuffle(sizes2)
 
     await tb.start()
 
-    for size1, size2 in itertools.product(sizes, sizes2):
-        op = randint(0, 2)
-        if (op == 0):
-            await tb.xenc_test(ad_size=size1, pt_size=size2)
-        elif (op == 1):
-            await tb.xdec_test(ad_size=size1, ct_size=size2)
-        else:
-            await tb.xhash_test(hm_size=size1)
+    # draw ops of all vectors before sharding, so that all shards see the same test plan
+    vectors = [
+        (size1, size2, tb.sizes.randint(0, 2))
+        for size1, size2 in itertools.product(sizes, sizes2)
+    ]
 
-    await tb.launch_monitors()
-    await tb.launch_drivers()
+    def vectors_of_shard():
+        for size1, size2, op in tb.shard_items(vectors):
+            if op == 0:
+                yield Vector('enc', ad_size=size1, xt_size=size2)
+            elif op == 1:
+                yield Vector('dec', ad_size=size1, xt_size=size2)
+            else:
+                yield Vector('hash', hm_size=size1)
 
-    await tb.join_drivers()
-    await tb.join_monitors()
+    # vectors are generated, encoded and checked on the fly, keeping only a few messages in memory
+    await tb.run_stream(vectors_of_shard())
 
 
 @cocotb.test()
@@ -267,6 +279,19 @@ async def measure_timings(dut: SimHandleBase):
     all_results[op] = results
 
     pprint(all_results)
+    tb.check_timings(all_results)
+    tb.calibrate_cycle_model(dict(AD=block_sizes['AD'], XT=block_sizes['PT/CT'], HM=block_sizes['HM']))
+
+
+@cocotb.test()
+async def workload_throughput(dut: SimHandleBase):
+    """Back-to-back throughput of a workload histogram (`run.py --workload CSV`)"""
+    max_stalls = 0
+    tb = XoodyakRefCheckerTb(dut, debug=False, max_in_stalls=max_stalls, max_out_stalls=max_stalls)
+
+    await tb.start()
+
+    await tb.measure_workload_from_env()
 
 
 if __name__ == "__main__":